@@ -0,0 +1,49 @@
+"""
+Builds the opening books of the saved boards from the games already played on them.
+
+The games saved in Histories/ and the self-play games in the actor logs of the board's
+AlphaZero checkpoint are replayed from the starting position, and the first moves of each
+are added up per position. The book is written to Books/ as memory mapped arrays, see
+Logic.book.
+
+    python -m Helpers.build_book "mini chess.npz" "new board.npz"
+
+The AI opponent, and the MCTS bots given the opening_book flag, then play the first
+moves straight from the book without searching or asking the language model.
+"""
+
+import argparse
+import sys
+
+from Logic.book import MAX_BOOK_PLIES, OpeningBook, find_games
+from Logic.loader import load_board, load_pieces
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("boards", nargs="+", help="Board file names in Boards/")
+    parser.add_argument(
+        "--max-plies",
+        type=int,
+        default=MAX_BOOK_PLIES,
+        help="How many moves of every game go in the book",
+    )
+    parser.add_argument("--histories", help="Where the saved games are")
+    parser.add_argument("--checkpoints", help="Where the AlphaZero checkpoints are")
+    parser.add_argument("--directory", help="Where to write the books")
+    args = parser.parse_args(argv)
+
+    pieces = load_pieces()
+    for name in args.boards:
+        games = find_games(name, args.histories, args.checkpoints)
+        book = OpeningBook.build(load_board(name, pieces), games, args.max_plies)
+        book.save(name, args.directory)
+        print(
+            f"{name}: {len(games)} games, {len(book)} positions, "
+            f"{len(book.entries)} moves"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Builds the endgame tablebases of the small saved boards.
+
+Every position reachable from the starting position of a board is enumerated and solved
+with retrograde analysis, and the distances to the end of the game are written to
+Tablebases/ as memory mapped arrays, see Logic.tablebase.
+
+    python -m Helpers.build_tablebase "small_chess.npz" "Example.npz"
+
+The engine, and the MCTS bots given the tablebase flag, then play the solved positions
+straight from the table. Only boards with few pieces are small enough, a 4x4 board with
+three pieces a side has about 4.5 million positions and takes a quarter of an hour.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from Logic.loader import load_board, load_pieces
+from Logic.tablebase import DRAW, MAX_POSITIONS, Tablebase
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("boards", nargs="+", help="Board file names in Boards/")
+    parser.add_argument(
+        "--max-positions",
+        type=int,
+        default=MAX_POSITIONS,
+        help="Gives up on boards with more reachable positions than this",
+    )
+    parser.add_argument("--directory", help="Where to write the tablebases")
+    args = parser.parse_args(argv)
+
+    pieces = load_pieces()
+    failed = False
+    for name in args.boards:
+        game = load_board(name, pieces)
+        start = time.perf_counter()
+        try:
+            tablebase = Tablebase.build(game, args.max_positions)
+        except ValueError as error:
+            print(f"{name}: {error}")
+            failed = True
+            continue
+        tablebase.save(name, args.directory)
+
+        distances = np.asarray(tablebase.distances)
+        draws = int((distances == DRAW).sum())
+        wins = int(((distances != DRAW) & (distances % 2 == 1)).sum())
+        distance = tablebase.probe(game)
+        if distance == DRAW:
+            result = "a draw"
+        else:
+            winner = "the side to move" if distance % 2 else "the other side"
+            moves = "move" if distance == 1 else "moves"
+            result = f"won by {winner} in {distance} {moves}"
+        print(
+            f"{name}: {len(tablebase)} positions, {wins} won, "
+            f"{len(tablebase) - wins - draws} lost, {draws} drawn for the side to move, "
+            f"{time.perf_counter() - start:.1f}s. The starting position is {result}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Monte Carlo graph search for the games built on GameLogic.
+
+The MCTS bots from open_spiel search a tree, so every position that can be reached by
+more than one order of moves gets expanded and evaluated once per order. Custom pieces
+that can step back and forth make that very common. The bot below keeps its nodes in a
+transposition table keyed by the position hash instead, so all the paths leading to a
+position share one node with a single evaluation and one set of children.
+
+The statistics used for selection live on the edges, so a node reached from several
+parents doesn't mix up the visits each parent made through it. The table is an LRU cache
+capped at a number of nodes, evicted nodes are simply expanded again when reached.
+
+It works with any evaluator following the open_spiel interface (`evaluate` and `prior`),
+so both mcts.RandomRolloutEvaluator and the AlphaZeroEvaluator can be used.
+"""
+
+import collections
+import math
+import time
+
+import numpy as np
+
+
+def position_key(state):
+    """Returns the key identifying the position of a state
+
+    States built on GameLogic use its Zobrist hash key together with the square of every
+    piece id. The actions name the piece that moves by its id, so two positions where
+    identical pieces swapped places have the same hash key but different actions. Other
+    games fall back on the string of the state and the player to move."""
+    game_logic = getattr(state, "game_logic", None)
+    if game_logic is not None:
+        return (
+            game_logic.hash_key,
+            tuple(piece and piece.position for piece in game_logic.pieces_by_id),
+        )
+    return (str(state), state.current_player())
+
+
+class GraphEdge:
+    """The statistics of one action taken from a node"""
+
+    __slots__ = ("action", "player", "prior", "explore_count", "total_reward")
+
+    def __init__(self, action, player, prior):
+        self.action = action
+        self.player = player
+        self.prior = prior
+        self.explore_count = 0
+        self.total_reward = 0.0
+
+    def uct_value(self, parent_explore_count, uct_c):
+        """Returns the UCT value of the edge, the same formula as mcts.SearchNode"""
+        if self.explore_count == 0:
+            return float("inf")
+        return self.total_reward / self.explore_count + uct_c * math.sqrt(
+            math.log(parent_explore_count) / self.explore_count
+        )
+
+    def puct_value(self, parent_explore_count, uct_c):
+        """Returns the PUCT value of the edge, the same formula as mcts.SearchNode"""
+        return (
+            self.explore_count and self.total_reward / self.explore_count
+        ) + uct_c * self.prior * math.sqrt(parent_explore_count) / (
+            self.explore_count + 1
+        )
+
+
+class GraphNode:
+    """A position in the search graph, shared by every path that reaches it"""
+
+    __slots__ = ("player", "edges", "explore_count", "returns")
+
+    def __init__(self, player, edges, returns=None):
+        self.player = player
+        self.edges = edges
+        self.explore_count = 0
+        # Only set for terminal positions
+        self.returns = returns
+
+
+class BatchedAlphaZeroEvaluator:
+    """AlphaZero evaluator that scores a whole batch of states with one model call
+
+    It gives the same values and priors as the AlphaZeroEvaluator from open_spiel, but the
+    observations and legal action masks of all the states are stacked and sent through
+    `model.inference` together, which for a small network costs about as much as a single
+    state. The masks come from the game's legal_actions_masks when it has one.
+    """
+
+    def __init__(self, game, model):
+        self._game = game
+        self._model = model
+
+    def evaluate_batch(self, states):
+        """Returns the (returns, prior) of every state"""
+        if not states:
+            return []
+        observations = np.stack(
+            [
+                np.asarray(state.observation_tensor(), dtype=np.float32)
+                for state in states
+            ]
+        )
+        if hasattr(self._game, "legal_actions_masks"):
+            masks = self._game.legal_actions_masks(states)
+        else:
+            masks = np.stack([state.legal_actions_mask() for state in states])
+        values, policies = self._model.inference(observations, masks)
+
+        evaluations = []
+        for state, value, policy in zip(states, values, policies):
+            # Like the open_spiel evaluator, the value is the one of the first player
+            value = float(np.asarray(value).reshape(-1)[0])
+            prior = [(action, policy[action]) for action in state.legal_actions()]
+            evaluations.append((np.array([value, -value]), prior))
+        return evaluations
+
+    def evaluate(self, state):
+        return self.evaluate_batch([state])[0][0]
+
+    def prior(self, state):
+        return self.evaluate_batch([state])[0][1]
+
+
+class GraphMCTSBot:
+    """MCTS bot that searches a graph of positions instead of a tree
+
+    The constructor takes the same arguments as mcts.MCTSBot, plus the maximum number of
+    nodes kept in the transposition table. Solving isn't supported, since proven values
+    can't be propagated safely through positions with several parents, so `solve` is only
+    accepted for compatibility. `child_selection_fn` should be GraphEdge.uct_value or
+    GraphEdge.puct_value, the mcts.SearchNode functions are mapped to those.
+
+    With a `batch_size` above 1 every iteration walks down to that many leaves before
+    evaluating them together, using the evaluator's `evaluate_batch` when it has one. While
+    the leaves are collected every edge walked through counts as visited and lost
+    `virtual_loss` times, which steers the following walks towards other leaves. The
+    virtual losses are taken back once the real values are backed up.
+
+    With a `time_budget`, in seconds, every search runs until the budget is used up
+    instead of for max_simulations simulations, so the bot answers in about the same time
+    on any board. The simulations run and the time taken by the last search are kept in
+    `search_stats`.
+    """
+
+    def __init__(
+        self,
+        game,
+        uct_c,
+        max_simulations,
+        evaluator,
+        solve=False,
+        random_state=None,
+        child_selection_fn=GraphEdge.uct_value,
+        dirichlet_noise=None,
+        verbose=False,
+        transposition_table_size=100000,
+        batch_size=1,
+        virtual_loss=1.0,
+        time_budget=None,
+    ):
+        self._game = game
+        self.uct_c = uct_c
+        self.max_simulations = max_simulations
+        self.evaluator = evaluator
+        self.solve = solve
+        self._random_state = random_state or np.random.RandomState()
+        if getattr(child_selection_fn, "__name__", None) == "puct_value":
+            child_selection_fn = GraphEdge.puct_value
+        elif getattr(child_selection_fn, "__name__", None) == "uct_value":
+            child_selection_fn = GraphEdge.uct_value
+        self._child_selection_fn = child_selection_fn
+        self._dirichlet_noise = dirichlet_noise
+        self.verbose = verbose
+        self.transposition_table_size = max(1, transposition_table_size)
+        self.batch_size = max(1, batch_size)
+        self.virtual_loss = virtual_loss
+        self.nodes = collections.OrderedDict()
+        self.time_budget = time_budget
+        # Visits the root of the last search already had from the previous moves
+        self.reused_visits = 0
+        self.search_stats = {"nodes": 0, "seconds": 0.0}
+
+    def restart(self):
+        self.nodes.clear()
+
+    def restart_at(self, state):
+        self.restart()
+
+    def inform_action(self, state, player_id, action):
+        pass
+
+    def step(self, state):
+        return self.step_with_policy(state)[1]
+
+    def step_with_policy(self, state):
+        """Returns the visit count policy at the root and the most visited action"""
+        root = self.mcts_search(state)
+        visits = sum(edge.explore_count for edge in root.edges)
+        policy = [
+            (edge.action, edge.explore_count / max(visits, 1)) for edge in root.edges
+        ]
+        best = max(root.edges, key=lambda edge: (edge.explore_count, edge.total_reward))
+        if self.verbose:
+            print(
+                "Graph search with {} nodes, best action {} with {} visits, "
+                "{} simulations in {:.2f}s".format(
+                    len(self.nodes),
+                    best.action,
+                    best.explore_count,
+                    self.search_stats["nodes"],
+                    self.search_stats["seconds"],
+                )
+            )
+        return policy, best.action
+
+    def _get_node(self, key):
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+        return node
+
+    def _evaluate(self, states):
+        """Returns the (returns, prior) of every state, in one call to the evaluator if it
+        can evaluate batches"""
+        if hasattr(self.evaluator, "evaluate_batch"):
+            return self.evaluator.evaluate_batch(states)
+        return [
+            (self.evaluator.evaluate(state), self.evaluator.prior(state))
+            for state in states
+        ]
+
+    def _add_node(self, key, state, evaluation=None):
+        """Expands the position of a state into a node, returns the node and the value
+        to back up, which comes from the evaluator unless the position is terminal"""
+        if state.is_terminal():
+            returns = np.array(state.returns())
+            node = GraphNode(None, [], returns)
+        else:
+            player = state.current_player()
+            returns, prior = evaluation or self._evaluate([state])[0]
+            prior = list(prior)
+            self._random_state.shuffle(prior)
+            node = GraphNode(
+                player, [GraphEdge(action, player, p) for action, p in prior]
+            )
+            returns = np.array(returns)
+        self.nodes[key] = node
+        return node, returns
+
+    def _evict(self, path_keys):
+        """Drops the least recently used nodes until the table is back under its cap,
+        keeping the nodes of the current simulation"""
+        while len(self.nodes) > self.transposition_table_size:
+            key = next(iter(self.nodes))
+            if key in path_keys:
+                # Nodes on the path are the most recently used, so only they are left
+                break
+            del self.nodes[key]
+
+    def _root_priors(self, root):
+        if not self._dirichlet_noise or not root.edges:
+            return None
+        epsilon, alpha = self._dirichlet_noise
+        noise = self._random_state.dirichlet([alpha] * len(root.edges))
+        return [
+            (1 - epsilon) * edge.prior + epsilon * n
+            for edge, n in zip(root.edges, noise)
+        ]
+
+    def _select(self, node, priors):
+        """Returns the edge of the node to follow"""
+        if priors is None:
+            return max(
+                node.edges,
+                key=lambda edge: self._child_selection_fn(
+                    edge, node.explore_count, self.uct_c
+                ),
+            )
+
+        # Dirichlet noise only applies to the root, so the shared edges keep their priors
+        best, best_value = None, -float("inf")
+        for edge, prior in zip(node.edges, priors):
+            shared_prior, edge.prior = edge.prior, prior
+            value = self._child_selection_fn(edge, node.explore_count, self.uct_c)
+            edge.prior = shared_prior
+            if value > best_value:
+                best, best_value = edge, value
+        return best
+
+    def _descend(self, state, root, root_key, root_priors):
+        """Walks down from the root, applying the moves to the state, until it reaches a
+        position that isn't in the graph yet or a game that is over
+
+        Returns the nodes and edges walked through, the keys of the positions on the way,
+        the key of the last position and the returns to back up, which are None if the
+        last position still has to be evaluated."""
+        node = root
+        path_keys = {root_key}
+        path = [node]
+        edges = []
+
+        while node.returns is None:
+            if not node.edges:
+                # A player without any legal move ends the game without a winner
+                return path, edges, path_keys, None, np.zeros(self._game.num_players())
+            edge = self._select(node, root_priors if len(path) == 1 else None)
+            state.apply_action(edge.action)
+            edges.append(edge)
+            key = position_key(state)
+
+            if key in path_keys:
+                # The moves went around in a circle back to a position on the path, which
+                # is scored as a draw instead of following the cycle forever
+                return path, edges, path_keys, key, np.zeros(self._game.num_players())
+            path_keys.add(key)
+
+            child = self._get_node(key)
+            if child is None:
+                return path, edges, path_keys, key, None
+            path.append(child)
+            node = child
+        return path, edges, path_keys, None, node.returns
+
+    def _add_virtual_loss(self, path, edges, sign):
+        for node in path:
+            node.explore_count += sign
+        for edge in edges:
+            edge.explore_count += sign
+            edge.total_reward -= sign * self.virtual_loss
+
+    def _backup(self, path, edges, returns):
+        for node in path:
+            node.explore_count += 1
+        for edge in edges:
+            edge.explore_count += 1
+            edge.total_reward += returns[edge.player]
+
+    def _simulate(self, state, root, root_key, root_priors):
+        """Runs one simulation from the root and backs up its value"""
+        path, edges, path_keys, key, returns = self._descend(
+            state, root, root_key, root_priors
+        )
+        if returns is None:
+            child, returns = self._add_node(key, state)
+            path.append(child)
+        self._backup(path, edges, returns)
+        self._evict(path_keys)
+
+    def _simulate_batch(self, state, root, root_key, root_priors, count):
+        """Runs `count` simulations whose new leaves are evaluated together"""
+        walks = []
+        leaves = {}
+        for _ in range(count):
+            leaf_state = state.clone()
+            walk = self._descend(leaf_state, root, root_key, root_priors)
+            self._add_virtual_loss(walk[0], walk[1], 1)
+            walks.append(walk)
+            if walk[4] is None and walk[3] not in leaves:
+                leaves[walk[3]] = leaf_state
+
+        keys = list(leaves)
+        evaluations = self._evaluate(
+            [leaves[key] for key in keys if not leaves[key].is_terminal()]
+        )
+        evaluations = iter(evaluations)
+        values = {}
+        for key in keys:
+            leaf_state = leaves[key]
+            evaluation = None if leaf_state.is_terminal() else next(evaluations)
+            values[key] = self._add_node(key, leaf_state, evaluation)
+
+        path_keys = set()
+        for path, edges, keys_on_path, key, returns in walks:
+            self._add_virtual_loss(path, edges, -1)
+            if returns is None:
+                child, returns = values[key]
+                path = path + [child]
+            self._backup(path, edges, returns)
+            path_keys |= keys_on_path
+        self._evict(path_keys)
+
+    def mcts_search(self, state):
+        """Runs max_simulations simulations from the state, or as many as fit in the time
+        budget, and returns its node"""
+        start = time.perf_counter()
+        deadline = None if self.time_budget is None else start + self.time_budget
+        root_key = position_key(state)
+        root = self._get_node(root_key)
+        if root is None:
+            root, _ = self._add_node(root_key, state)
+        if root.returns is not None:
+            raise ValueError("Can't search from a terminal state")
+        self.reused_visits = root.explore_count
+        if self.verbose and self.reused_visits:
+            print("Reusing a node with {} visits".format(self.reused_visits))
+        root_priors = self._root_priors(root)
+
+        simulations = 0
+        while (
+            simulations < self.max_simulations
+            if deadline is None
+            else simulations == 0 or time.perf_counter() < deadline
+        ):
+            # The root stays in the table even if it's small enough to evict it
+            self.nodes[root_key] = root
+            self.nodes.move_to_end(root_key)
+            if self.batch_size == 1:
+                self._simulate(state.clone(), root, root_key, root_priors)
+                simulations += 1
+            else:
+                count = self.batch_size
+                if deadline is None:
+                    count = min(count, self.max_simulations - simulations)
+                self._simulate_batch(state, root, root_key, root_priors, count)
+                simulations += count
+        self.search_stats = {
+            "nodes": simulations,
+            "seconds": time.perf_counter() - start,
+        }
+        return root
@@ -0,0 +1,226 @@
+"""
+Root-parallel MCTS over a process pool.
+
+Every worker process runs its own independent search from the current position with its
+own seed. Once they're done, or the move deadline has passed, the visit counts and rewards
+of the root moves are added up over all the workers and the most visited move is played.
+The searches don't share anything while they run, so this scales with the number of cores
+without any locking.
+
+The bots and states have to be built inside the workers, so the bot is created from two
+picklable factories:
+
+    bot_factory(state, rng) -> a bot with mcts_search, built once per worker
+    state_factory(game_logic) -> the state to search from
+
+Both mcts.MCTSBot and GraphMCTSBot can be used as the worker bots.
+
+The bot owns its worker processes, so it should be closed once the games are over, or
+used as a context manager:
+
+    with RootParallelMCTSBot(bot_factory, state_factory) as bot:
+        action = bot.step(state)
+"""
+
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+# The bot of the current worker process, along with the random state it was built with
+_WORKER = {}
+
+
+def _init_worker(bot_factory, state_factory, game_logic):
+    """Builds the bot of the worker right away, so loading it, like reading the AlphaZero
+    checkpoint, isn't done on the clock of a move"""
+    _WORKER["bot_factory"] = bot_factory
+    _WORKER["state_factory"] = state_factory
+    _WORKER["rng"] = np.random.RandomState()
+    _WORKER["bot"] = bot_factory(state_factory(game_logic), _WORKER["rng"])
+
+
+def _ready():
+    return os.getpid()
+
+
+def root_statistics(root):
+    """Returns {action: (visits, total reward)} for the moves of a searched root, from
+    either an mcts.SearchNode or a GraphNode"""
+    children = root.edges if hasattr(root, "edges") else root.children
+    return {
+        child.action: (child.explore_count, child.total_reward) for child in children
+    }
+
+
+def _search(game_logic, seed, deadline):
+    """Runs searches from the position until the deadline and returns the root statistics
+
+    The worker keeps searching while there is time left. A bot that returns the same root
+    again, like GraphMCTSBot which keeps its graph between searches, already has cumulative
+    statistics, otherwise the statistics of each new tree are added up. A search that only
+    gets to start after the deadline, behind a late one, returns nothing right away."""
+    if deadline is not None and time.time() >= deadline:
+        return {}
+    state = _WORKER["state_factory"](game_logic)
+    _WORKER["rng"].seed(seed)
+    if _WORKER["bot"] is None:
+        _WORKER["bot"] = _WORKER["bot_factory"](state, _WORKER["rng"])
+    bot = _WORKER["bot"]
+
+    totals = collections.defaultdict(lambda: [0, 0.0])
+    previous_root, previous = None, {}
+    while True:
+        if deadline is not None and hasattr(bot, "time_budget"):
+            # Bots with a time budget stop on their own right at the deadline
+            bot.time_budget = max(0.0, deadline - time.time())
+        root = bot.mcts_search(state)
+        statistics = root_statistics(root)
+        if root is previous_root:
+            # Only the visits made since the previous search are new
+            for action, (visits, reward) in statistics.items():
+                old_visits, old_reward = previous.get(action, (0, 0.0))
+                totals[action][0] += visits - old_visits
+                totals[action][1] += reward - old_reward
+        else:
+            for action, (visits, reward) in statistics.items():
+                totals[action][0] += visits
+                totals[action][1] += reward
+        previous_root, previous = root, statistics
+        if deadline is None or time.time() >= deadline:
+            break
+    return {action: tuple(total) for action, total in totals.items()}
+
+
+class RootParallelMCTSBot:
+    """Bot running independent MCTS searches in a process pool and merging their roots
+
+    `num_workers` searches run for every move, seeded from `seed` and the move number so a
+    game can be replayed. With a `deadline`, in seconds, every worker keeps searching until
+    it runs out and the results that are in by then are merged, so a slow worker can't
+    hold the move up, its late result is ignored. Without one every worker runs a single
+    search. The worker processes and their bots are kept for the whole game, so the bots
+    are only built once and keep their trees between moves.
+    """
+
+    def __init__(
+        self,
+        bot_factory,
+        state_factory,
+        num_workers=None,
+        deadline=None,
+        seed=None,
+        verbose=False,
+    ):
+        self.num_workers = num_workers or os.cpu_count()
+        self.deadline = deadline
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.verbose = verbose
+        self._bot_factory = bot_factory
+        self._state_factory = state_factory
+        self._pool = None
+        self._moves = 0
+        self.search_stats = {"nodes": 0, "seconds": 0.0}
+
+    def _get_pool(self, game_logic):
+        """Returns the process pool, starting it and waiting for the worker bots to be
+        built the first time"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                initializer=_init_worker,
+                initargs=(self._bot_factory, self._state_factory, game_logic),
+            )
+            wait([self._pool.submit(_ready) for _ in range(self.num_workers)])
+        return self._pool
+
+    def close(self):
+        """Shuts the worker processes down"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def restart(self):
+        self._moves = 0
+
+    def restart_at(self, state):
+        self.restart()
+
+    def inform_action(self, state, player_id, action):
+        pass
+
+    def search(self, state):
+        """Runs the searches and returns the merged {action: (visits, total reward)}"""
+        game_logic = state.game_logic.clone()
+        pool = self._get_pool(game_logic)
+        start = time.perf_counter()
+        deadline = None if self.deadline is None else time.time() + self.deadline
+        self._moves += 1
+        futures = [
+            pool.submit(
+                _search,
+                game_logic,
+                (self.seed + self._moves * self.num_workers + worker) % 2**32,
+                deadline,
+            )
+            for worker in range(self.num_workers)
+        ]
+
+        if deadline is None:
+            done, not_done = wait(futures)
+        else:
+            # A search can only stop between two simulations runs, so the workers get a
+            # little extra time to hand in their results
+            done, not_done = wait(
+                futures, timeout=max(0.0, deadline - time.time()) + 0.1 * self.deadline
+            )
+        # The late searches stop on their own at the deadline, their results are ignored
+        for future in not_done:
+            future.cancel()
+
+        merged = collections.defaultdict(lambda: [0, 0.0])
+        for future in done:
+            for action, (visits, reward) in future.result().items():
+                merged[action][0] += visits
+                merged[action][1] += reward
+        self.search_stats = {
+            "nodes": sum(visits for visits, _ in merged.values()),
+            "seconds": time.perf_counter() - start,
+        }
+        if self.verbose:
+            print(
+                "Merged {} of {} searches with {} visits in {:.2f}s".format(
+                    len(done),
+                    len(futures),
+                    self.search_stats["nodes"],
+                    self.search_stats["seconds"],
+                )
+            )
+        return {action: tuple(total) for action, total in merged.items()}
+
+    def step_with_policy(self, state):
+        """Returns the merged visit count policy and the most visited action
+
+        If no search handed in a move, because none of them finished in time or the
+        position has no moves searched, the first legal action is played."""
+        merged = self.search(state)
+        visits = sum(visits for visits, _ in merged.values())
+        if not visits:
+            action = state.legal_actions()[0]
+            return [(action, 1.0)], action
+        policy = [
+            (action, count / visits) for action, (count, _) in sorted(merged.items())
+        ]
+        best = max(merged, key=lambda action: merged[action])
+        return policy, best
+
+    def step(self, state):
+        return self.step_with_policy(state)[1]
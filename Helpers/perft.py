@@ -0,0 +1,239 @@
+"""
+Perft benchmark over the saved board library.
+
+Perft counts the leaf nodes of the game tree down to a fixed depth using the GameLogic move
+generation, which checks both the correctness and the speed of the move generator. The
+work for each board is split across a process pool at the root, one task per legal move.
+
+    python -m Helpers.perft --depth 4
+    python -m Helpers.perft --depth 4 --update-baseline
+    python -m Helpers.perft --depth 4 --write-baseline
+    python -m Helpers.perft --depth 4 --check-speed
+
+The node counts are compared against the baseline JSON kept in the repository, and the run
+fails when they differ from it. Speeds depend on the machine, so they're only checked with
+--check-speed, against a speed baseline recorded on the same machine with --write-baseline,
+and the run then also fails when the nodes per second drop by more than the threshold.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Logic.loader import list_boards, load_board, load_pieces
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "perft_baseline.json")
+# Recorded on the machine running the benchmark, it isn't part of the repository
+DEFAULT_SPEED_BASELINE = os.path.join(os.path.dirname(__file__), "perft_speed.json")
+
+# Runs faster than this are too noisy to compare speeds, only their node counts are checked
+MIN_TIMED_SECONDS = 0.05
+
+# Boards loaded by the current process, so each worker only loads a board once
+_GAMES = {}
+
+
+def perft(game, depth):
+    """Returns the number of leaf nodes `depth` moves deep from the current position
+
+    Moves are made and taken back in place, so the game is left as it was. A position
+    where the game is over, or where the player to move has no moves, is a leaf.
+    """
+    if depth == 0 or game.game_over:
+        return 1
+    actions = game.get_all_possible_moves_action_space()
+    if depth == 1:
+        return len(actions) or 1
+    if not actions:
+        return 1
+
+    nodes = 0
+    for action in actions:
+        game.push_action(action)
+        nodes += perft(game, depth - 1)
+        game.pop_action()
+    return nodes
+
+
+def _get_game(name):
+    game = _GAMES.get(name)
+    if game is None:
+        game = load_board(name, load_pieces())
+        _GAMES[name] = game
+    return game
+
+
+def _load_boards(names):
+    """Loads the boards up front, so loading them isn't part of the measured time"""
+    for name in names:
+        _get_game(name)
+
+
+def _perft_after(name, action, depth):
+    """Counts the leaves below one root move, run by the workers of the pool"""
+    game = _get_game(name)
+    game.push_action(action)
+    try:
+        return perft(game, depth - 1)
+    finally:
+        game.pop_action()
+
+
+def run_board(name, depth, pool=None):
+    """Runs perft on a saved board and returns its node count, time and nodes per second"""
+    game = _get_game(name)
+    start = time.perf_counter()
+    actions = game.get_all_possible_moves_action_space()
+    if depth <= 1 or not actions or pool is None:
+        nodes = perft(game, depth)
+    else:
+        nodes = sum(
+            pool.map(
+                _perft_after,
+                [name] * len(actions),
+                actions,
+                [depth] * len(actions),
+            )
+        )
+    seconds = time.perf_counter() - start
+    return {
+        "nodes": nodes,
+        "seconds": seconds,
+        "nodes_per_second": nodes / seconds if seconds > 0 else 0.0,
+    }
+
+
+def compare_to_baseline(results, baseline, depth):
+    """Returns the list of boards whose node count differs from the baseline
+
+    Boards missing from the baseline are skipped."""
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name, {}).get(str(depth))
+        if expected is not None and result["nodes"] != expected["nodes"]:
+            failures.append(
+                f"{name}: {result['nodes']} nodes at depth {depth}, expected {expected['nodes']}"
+            )
+    return failures
+
+
+def compare_speed(results, speed_baseline, depth, threshold):
+    """Returns the list of boards whose speed dropped by more than `threshold`, a
+    fraction of the nodes per second of the speed baseline
+
+    Boards missing from the speed baseline are skipped, and so are the boards it searched
+    in less than MIN_TIMED_SECONDS."""
+    failures = []
+    for name, result in results.items():
+        expected = speed_baseline.get(name, {}).get(str(depth))
+        if expected is None or expected["seconds"] < MIN_TIMED_SECONDS:
+            continue
+        minimum = expected["nodes_per_second"] * (1 - threshold)
+        if result["nodes_per_second"] < minimum:
+            failures.append(
+                f"{name}: {result['nodes_per_second']:.0f} nodes/s at depth {depth}, "
+                f"expected at least {minimum:.0f}"
+            )
+    return failures
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument(
+        "--boards", nargs="*", help="Board file names, all of Boards/ by default"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--speed-baseline", default=DEFAULT_SPEED_BASELINE)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed drop in nodes per second, as a fraction of the speed baseline",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Write the node counts to the baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--write-baseline",
+        action="store_true",
+        help="Record the speeds of this machine to the speed baseline",
+    )
+    parser.add_argument(
+        "--check-speed",
+        action="store_true",
+        help="Also fail when the speed dropped below the speed baseline",
+    )
+    args = parser.parse_args(argv)
+    if args.check_speed and not (
+        args.write_baseline or os.path.exists(args.speed_baseline)
+    ):
+        parser.error(
+            f"no speed baseline at {args.speed_baseline}, record one with --write-baseline"
+        )
+
+    boards = args.boards or list_boards()
+    results = {}
+    _load_boards(boards)
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=_load_boards, initargs=(boards,)
+    ) as pool:
+        # Starts the workers before anything is timed
+        pool.submit(_load_boards, boards).result()
+        for name in boards:
+            results[name] = run_board(name, args.depth, pool)
+            print(
+                f"{name:<24} depth {args.depth}: {results[name]['nodes']:>10} nodes "
+                f"{results[name]['seconds']:8.3f}s "
+                f"{results[name]['nodes_per_second']:>12.0f} nodes/s"
+            )
+
+    if args.write_baseline:
+        speed_baseline = _read_json(args.speed_baseline)
+        for name, result in results.items():
+            speed_baseline.setdefault(name, {})[str(args.depth)] = {
+                "seconds": round(result["seconds"], 4),
+                "nodes_per_second": round(result["nodes_per_second"]),
+            }
+        _write_json(args.speed_baseline, speed_baseline)
+        print(f"Speed baseline written to {args.speed_baseline}")
+
+    baseline = _read_json(args.baseline)
+    if args.update_baseline:
+        for name, result in results.items():
+            baseline.setdefault(name, {})[str(args.depth)] = {"nodes": result["nodes"]}
+        _write_json(args.baseline, baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    failures = compare_to_baseline(results, baseline, args.depth)
+    if args.check_speed and not args.write_baseline:
+        failures += compare_speed(
+            results, _read_json(args.speed_baseline), args.depth, args.threshold
+        )
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
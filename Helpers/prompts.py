@@ -1,23 +1,10 @@
-from UI.board_create_screen import PIECE_HEIGHT, PIECE_WIDTH, BLACK_PIECE, WHITE_PIECE
+def get_next_move_prompt(position, legend, game_history, possible_moves, past_games):
+    """Returns a string that is used to prompt the AI to make a move
 
-
-def get_next_move_prompt(
-    init_piece_position, init_piece_alignment, game_history, possible_moves, past_games
-):
-    """Returns a string that is used to prompt the AI to make a move"""
-    piece_array = [
-        ["" for _ in range(init_piece_position.shape[1])]
-        for _ in range(init_piece_position.shape[0])
-    ]
-
-    for i in range(init_piece_position.shape[0]):
-        for j in range(init_piece_position.shape[1]):
-            if init_piece_position[i, j] != 0:
-                color = "w" if init_piece_alignment[i, j] == WHITE_PIECE else "b"
-                piece_array[i][j] = f"{color}{int(init_piece_position[i, j])}"
-
-    history = "\n".join(game_history)
-    possible_moves = "\n".join(possible_moves)
+    The position is written in the notation of Logic/notation.py and the moves like a1a2,
+    which keeps the prompt a fraction of the size of the board arrays."""
+    history = " ".join(game_history)
+    possible_moves = " ".join(possible_moves)
 
     return f"""
 
@@ -25,9 +12,13 @@ def get_next_move_prompt(
     
     This is a modified version of chess. The rules are the same, but the pieces and board are different.
     
-    Initially, the board looks like this:
+    The board is written like FEN, rank by rank from the top. Uppercase letters are white pieces, lowercase
+    letters are black pieces, a piece followed by + is a king and numbers count empty squares. The letters
+    stand for these pieces: {legend}
+    
+    The board looks like this, followed by the side to move:
     
-    {piece_array}
+    {position}
     
     Below is a list of games that have been played in the past with the same pieces and board that shows the moves that were made alongside
     the result of the game. You can use this to help you make your move.
@@ -43,5 +34,5 @@ def get_next_move_prompt(
     
     {possible_moves}
     
-    Please enter your next move in the format: <piece><row><col> -> <row><col>
+    Please enter your next move as the square it starts from followed by the square it ends on, like a1a2
     """
@@ -0,0 +1,332 @@
+"""
+Plays games between the search bots without the UI and keeps them as a dataset.
+
+The games are spread over a process pool, every worker building its bots once and
+playing small batches of games. The finished games are streamed into compressed .npz
+shards of games_per_shard games in SelfPlay/<board>/. A shard holds the moves of all its
+games in `actions`, game i being actions[game_offsets[i]:game_offsets[i + 1]], and the
+search policy of every move the same way, the policy of move j being the actions
+policy_actions[policy_offsets[j]:policy_offsets[j + 1]] with their policy_probs. The
+`returns` of every game for white and black, the board, the bots and the board's number
+of distinct actions are kept alongside. Training runs can read the positions back with
+read_shard instead of playing them again.
+
+    python -m Helpers.self_play "mini chess.npz" mcts mcts --games 10000
+    python -m Helpers.self_play "mini chess.npz" az mcts --games 1000 --move-deadline 0.2
+
+The bots are the ones of Helpers.spiel_helper (mcts, static, az and random), so open_spiel
+has to be installed for the workers.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from Logic.loader import load_board
+
+DEFAULT_DIRECTORY = os.path.join(os.getcwd(), "SelfPlay")
+
+BOT_TYPES = ("mcts", "static", "az", "random")
+
+# Games still going after this many moves are stopped and count as draws
+MAX_MOVES = 200
+
+GAMES_PER_SHARD = 1000
+
+# Games a worker plays before handing them back
+GAMES_PER_TASK = 8
+
+
+def play_game(state, bots, max_moves=MAX_MOVES, temperature_moves=0, rng=None):
+    """Plays a game from the state, returning its actions, the search policy of every
+    move as (actions, probabilities) and the returns of both players
+
+    For the first temperature_moves moves the action is drawn from the policy instead of
+    being the bot's pick, so bots that always search the same way still play different
+    games."""
+    rng = rng or np.random.RandomState()
+    actions, policies = [], []
+    while not state.is_terminal() and len(actions) < max_moves:
+        player = state.current_player()
+        policy, action = bots[player].step_with_policy(state)
+        policy_actions = np.array([a for a, _ in policy], dtype=np.int32)
+        policy_probs = np.array([p for _, p in policy], dtype=np.float32)
+        if len(actions) < temperature_moves and policy_probs.sum() > 0:
+            action = int(
+                rng.choice(policy_actions, p=policy_probs / policy_probs.sum())
+            )
+        for i, bot in enumerate(bots):
+            if i != player:
+                bot.inform_action(state, player, action)
+        actions.append(action)
+        policies.append((policy_actions, policy_probs))
+        state.apply_action(action)
+
+    returns = state.returns() if state.is_terminal() else [0.0, 0.0]
+    for bot in bots:
+        bot.restart()
+    return actions, policies, returns
+
+
+class ShardWriter:
+    """Collects finished games and writes them out games_per_shard at a time"""
+
+    def __init__(
+        self, directory, prefix, games_per_shard=GAMES_PER_SHARD, metadata=None
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.games_per_shard = games_per_shard
+        self.metadata = metadata or {}
+        self.paths = []
+        self.games = 0
+        self.positions = 0
+        self._pending = []
+
+    def add(self, actions, policies, returns):
+        self._pending.append((actions, policies, returns))
+        self.games += 1
+        self.positions += len(actions)
+        if len(self._pending) >= self.games_per_shard:
+            self.flush()
+
+    def flush(self):
+        """Writes the games collected so far to a new shard"""
+        if not self._pending:
+            return None
+        games, self._pending = self._pending, []
+        game_lengths = [len(actions) for actions, _, _ in games]
+        policies = [policy for _, game_policies, _ in games for policy in game_policies]
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.prefix}-{len(self.paths):05d}.npz")
+        # Written under another name first, so a reader never sees half a shard
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(
+                f,
+                actions=np.array(
+                    [action for actions, _, _ in games for action in actions],
+                    dtype=np.int32,
+                ),
+                game_offsets=np.concatenate([[0], np.cumsum(game_lengths)]).astype(
+                    np.int64
+                ),
+                policy_offsets=np.concatenate(
+                    [[0], np.cumsum([len(actions) for actions, _ in policies])]
+                ).astype(np.int64),
+                policy_actions=np.concatenate(
+                    [actions for actions, _ in policies] or [[]]
+                ).astype(np.int32),
+                policy_probs=np.concatenate(
+                    [probs for _, probs in policies] or [[]]
+                ).astype(np.float32),
+                returns=np.array(
+                    [returns for _, _, returns in games], dtype=np.float32
+                ).reshape(-1, 2),
+                **{key: np.array(value) for key, value in self.metadata.items()},
+            )
+        os.replace(path + ".tmp", path)
+        self.paths.append(path)
+        return path
+
+    def close(self):
+        return self.flush()
+
+
+def read_shard(path):
+    """Returns the (actions, policies, returns) of every game of a shard, the policies
+    being (actions, probabilities) for every move"""
+    with np.load(path) as shard:
+        actions = shard["actions"]
+        game_offsets = shard["game_offsets"]
+        policy_offsets = shard["policy_offsets"]
+        policy_actions = shard["policy_actions"]
+        policy_probs = shard["policy_probs"]
+        returns = shard["returns"]
+
+    games = []
+    for i in range(len(game_offsets) - 1):
+        start, end = game_offsets[i], game_offsets[i + 1]
+        policies = [
+            (
+                policy_actions[policy_offsets[j] : policy_offsets[j + 1]],
+                policy_probs[policy_offsets[j] : policy_offsets[j + 1]],
+            )
+            for j in range(start, end)
+        ]
+        games.append((actions[start:end].tolist(), policies, returns[i].tolist()))
+    return games
+
+
+def shard_paths(name, directory=None):
+    """Returns the shards written for a board, oldest first"""
+    directory = directory or DEFAULT_DIRECTORY
+    return sorted(
+        glob.glob(os.path.join(directory, os.path.splitext(name)[0], "*.npz"))
+    )
+
+
+# The game and bots of the current worker process, built once per worker
+_WORKER = {}
+
+
+def _init_worker(name, bot_types, flags):
+    # open_spiel is only needed in the workers, which keeps the shards readable without it
+    from Helpers import spiel_helper
+
+    spiel_helper.mcts_flags.update(flags)
+    game = spiel_helper.build_game(load_board(name))
+    rng = np.random.RandomState()
+    _WORKER["game"] = game
+    _WORKER["rng"] = rng
+    _WORKER["bots"] = [
+        spiel_helper._init_bot(bot_type, game, player, rng=rng)
+        for player, bot_type in enumerate(bot_types)
+    ]
+
+
+def _play_games(count, seed, max_moves, temperature_moves):
+    _WORKER["rng"].seed(seed)
+    return [
+        play_game(
+            _WORKER["game"].new_initial_state(),
+            _WORKER["bots"],
+            max_moves,
+            temperature_moves,
+            _WORKER["rng"],
+        )
+        for _ in range(count)
+    ]
+
+
+def generate(
+    name,
+    bot_types,
+    num_games,
+    flags,
+    workers=None,
+    directory=None,
+    games_per_shard=GAMES_PER_SHARD,
+    max_moves=MAX_MOVES,
+    temperature_moves=0,
+    seed=None,
+):
+    """Plays num_games games of the board over a pool of workers and writes them to
+    shards as they finish, returning the ShardWriter"""
+    seed = seed if seed is not None else int(time.time())
+    game_logic = load_board(name)
+    writer = ShardWriter(
+        os.path.join(directory or DEFAULT_DIRECTORY, os.path.splitext(name)[0]),
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{seed}",
+        games_per_shard,
+        metadata={
+            "board": name,
+            "bots": list(bot_types),
+            "num_distinct_actions": len(game_logic.pieces)
+            * game_logic.rows
+            * game_logic.cols,
+        },
+    )
+    workers = workers or os.cpu_count() or 1
+    # The workers search on a single core each
+    flags = dict(flags, parallel_workers=0, quiet=True, verbose=False)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(name, list(bot_types), flags),
+    ) as executor:
+        tasks = set()
+        scheduled = 0
+        while scheduled < num_games or tasks:
+            # Only a few batches are queued per worker, so the games are written out as
+            # they're played instead of all piling up in memory
+            while scheduled < num_games and len(tasks) < 2 * workers:
+                count = min(GAMES_PER_TASK, num_games - scheduled)
+                tasks.add(
+                    executor.submit(
+                        _play_games,
+                        count,
+                        seed + scheduled,
+                        max_moves,
+                        temperature_moves,
+                    )
+                )
+                scheduled += count
+            done, tasks = wait(tasks, return_when=FIRST_COMPLETED)
+            for task in done:
+                for game in task.result():
+                    writer.add(*game)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{writer.games}/{num_games} games, {writer.positions} positions, "
+                f"{writer.games / max(elapsed, 1e-9):.1f} games/s"
+            )
+    writer.close()
+    return writer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("board", help="Board file name in Boards/")
+    parser.add_argument(
+        "bots",
+        nargs=2,
+        choices=BOT_TYPES,
+        help="The bot playing white and the one playing black",
+    )
+    parser.add_argument("--games", type=int, default=1000, help="Games to play")
+    parser.add_argument(
+        "--workers", type=int, help="Processes playing games, one per core by default"
+    )
+    parser.add_argument("--games-per-shard", type=int, default=GAMES_PER_SHARD)
+    parser.add_argument("--max-moves", type=int, default=MAX_MOVES)
+    parser.add_argument(
+        "--temperature-moves",
+        type=int,
+        default=0,
+        help="Moves at the start of every game drawn from the search policy",
+    )
+    parser.add_argument("--max-simulations", type=int, default=100)
+    parser.add_argument(
+        "--move-deadline", type=float, help="Seconds the bots search every move for"
+    )
+    parser.add_argument("--az-path", default="./Checkpoints/")
+    parser.add_argument("--tablebase", action="store_true", help="Use the tablebase")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--directory", help="Where to write the shards")
+    args = parser.parse_args(argv)
+    flags = {
+        "max_simulations": args.max_simulations,
+        "move_deadline": args.move_deadline,
+        "az_path": args.az_path,
+        "tablebase": args.board if args.tablebase else None,
+        "seed": args.seed,
+    }
+    writer = generate(
+        args.board,
+        args.bots,
+        args.games,
+        flags,
+        workers=args.workers,
+        directory=args.directory,
+        games_per_shard=args.games_per_shard,
+        max_moves=args.max_moves,
+        temperature_moves=args.temperature_moves,
+        seed=args.seed,
+    )
+    print(
+        f"{args.board}: {writer.games} games, {writer.positions} positions in "
+        f"{len(writer.paths)} shards"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@ import os
 import collections
 import random
 import sys
+import functools
 import pyspiel
 
 from open_spiel.python.algorithms.alpha_zero import alpha_zero
@@ -19,6 +20,12 @@ from open_spiel.python.bots import uniform_random
 from open_spiel.python.games import mini_chess, mini_chess_helper
 from Logic.piece import GamePiece
 from Logic.game import GameLogic
+from Helpers.graph_mcts import GraphMCTSBot, BatchedAlphaZeroEvaluator
+from Helpers.parallel_mcts import RootParallelMCTSBot
+from Helpers.tree_reuse import TreeReuseMixin
+from Logic.evaluation import StaticEvaluator
+from Logic.tablebase import LookupBot, Tablebase, TablebaseEvaluator
+from Logic.book import OpeningBook
 
 _NUM_PLAYERS = 2
 BOARD_ROWS, BOARD_COLS = 8, 8
@@ -82,8 +89,11 @@ class MiniChessGame(pyspiel.Game):
         self.cols = cols
 
     def new_initial_state(self):
-        """Returns a state corresponding to the start of a game."""
-        return MiniChessState(self, self.game_logic)
+        """Returns a state corresponding to the start of a game.
+        Every state gets its own copy of the starting position, the moves applied to one
+        game would otherwise show up in every game started after it.
+        """
+        return MiniChessState(self, self.game_logic.clone())
 
     def make_py_observer(self, iig_obs_type=None, params=None):
         """Returns an object used for observing game state.
@@ -98,6 +108,38 @@ class MiniChessGame(pyspiel.Game):
 
         return BoardObserver(self.num_pieces, self.rows, self.cols)
 
+    def legal_actions_masks(self, states):
+        """Returns an N x num_distinct_actions boolean mask of the legal actions of N states.
+        All the states are handled in a single call to GameLogic.get_legal_actions_masks
+        instead of building a list of legal actions for each of them, which is what batched
+        leaf evaluation needs. Terminal states get an empty mask.
+        """
+        game_logics = [state.game_logic for state in states]
+        masks = self.game_logic.get_legal_actions_masks(
+            np.stack([game_logic.piece_position for game_logic in game_logics]),
+            np.stack([game_logic.piece_alignment for game_logic in game_logics]),
+            np.array([game_logic.turn for game_logic in game_logics]),
+            np.stack([game_logic.get_piece_ids() for game_logic in game_logics]),
+            self.num_distinct_actions(),
+        )
+        masks[[game_logic.game_over for game_logic in game_logics]] = False
+        return masks
+
+
+def build_game(game_logic, name=None):
+    """Wraps a GameLogic set up with a board into a MiniChessGame, the same way
+    AITrainScreen does"""
+    name = name or os.path.splitext(game_logic.name or "mini_chess")[0]
+    num_pieces = len(game_logic.pieces)
+    return MiniChessGame(
+        _GAME_TYPE=game_type(name),
+        _GAME_INFO=game_info(num_pieces * game_logic.rows * game_logic.cols),
+        game_logic=game_logic,
+        num_pieces=num_pieces,
+        rows=game_logic.rows,
+        cols=game_logic.cols,
+    )
+
 
 class MiniChessState(pyspiel.State):
     """A state object that implements logic underneath for the working of the game
@@ -157,6 +199,8 @@ class MiniChessState(pyspiel.State):
 
     def returns(self):
         """Total reward for each player over the course of the game so far."""
+        if not self.game_logic.game_over:
+            return [0, 0]
         return [1, -1] if self.game_logic.winner == "White" else [-1, 1]
 
     def __str__(self):
@@ -208,7 +252,7 @@ class BoardObserver:
     def string_from(self, state: MiniChessState, player):
         """Observation of `state` from the PoV of `player`, as a string."""
         del player
-        return state.game_logic.board_to_string()
+        return state.game_logic.to_fen()
 
 
 """
@@ -339,6 +383,28 @@ mcts_flags = {
     "solve": True,
     "quiet": False,
     "verbose": False,
+    # Merges positions reached by different move orders into shared nodes, with at most
+    # transposition_table_size of them kept in memory
+    "graph_search": False,
+    "transposition_table_size": 100000,
+    # Runs the mcts, static and az bots as independent searches in this many processes,
+    # merging their root visit counts
+    "parallel_workers": 0,
+    # Seconds the mcts, static and az bots search every move for, instead of running
+    # max_simulations simulations
+    "move_deadline": None,
+    # Leaves evaluated together by the az bot, and the virtual loss spreading them out. A
+    # batch size above 1 runs the search with GraphMCTSBot
+    "batch_size": 1,
+    "virtual_loss": 1.0,
+    # Keeps the subtree of the move played for the next search instead of a new tree
+    "tree_reuse": True,
+    # Board name whose tablebase, built with Helpers.build_tablebase, the mcts, static and
+    # az bots play solved positions from and score their leaves with
+    "tablebase": None,
+    # Board name whose opening book, built with Helpers.build_book, the mcts, static and
+    # az bots play the first moves from
+    "opening_book": None,
 }
 
 
@@ -347,29 +413,160 @@ def _opt_print(*args, **kwargs):
         print(*args, **kwargs)
 
 
-def _init_bot(bot_type, game, player_id):
-    """Initializes a bot by type."""
-    rng = np.random.RandomState(mcts_flags["seed"])
-    if bot_type == "mcts":
-        evaluator = mcts.RandomRolloutEvaluator(mcts_flags["rollout_count"], rng)
-        return mcts.MCTSBot(
+class TreeReuseMCTSBot(TreeReuseMixin, mcts.MCTSBot):
+    """MCTSBot keeping the subtree of the moves played between its searches, and
+    searching for a time budget when it has one"""
+
+
+def _load_tablebase():
+    if not mcts_flags["tablebase"]:
+        return None
+    tablebase = Tablebase.load(mcts_flags["tablebase"])
+    if tablebase is None:
+        raise ValueError("No tablebase built for %s" % mcts_flags["tablebase"])
+    return tablebase
+
+
+def _lookup_tables():
+    """Returns the opening book and tablebase set in the flags, which the search bots
+    play from before searching"""
+    tables = []
+    if mcts_flags["opening_book"]:
+        book = OpeningBook.load(mcts_flags["opening_book"])
+        if book is None:
+            raise ValueError(
+                "No opening book built for %s" % mcts_flags["opening_book"]
+            )
+        tables.append(book)
+    tablebase = _load_tablebase()
+    if tablebase is not None:
+        tables.append(tablebase)
+    return tables
+
+
+def _mcts_bot(game, evaluator, rng, **kwargs):
+    """Builds a tree search MCTSBot, or a GraphMCTSBot when graph_search is set or the
+    leaves are evaluated in batches. With a tablebase the solved leaves are evaluated
+    from it instead."""
+    tablebase = _load_tablebase()
+    if tablebase is not None:
+        evaluator = TablebaseEvaluator(tablebase, evaluator)
+    if mcts_flags["graph_search"] or mcts_flags["batch_size"] > 1:
+        return GraphMCTSBot(
             game,
             mcts_flags["uct_c"],
             mcts_flags["max_simulations"],
             evaluator,
             random_state=rng,
+            transposition_table_size=mcts_flags["transposition_table_size"],
+            batch_size=mcts_flags["batch_size"],
+            virtual_loss=mcts_flags["virtual_loss"],
+            time_budget=mcts_flags["move_deadline"],
+            **kwargs,
+        )
+    return TreeReuseMCTSBot(
+        game,
+        mcts_flags["uct_c"],
+        mcts_flags["max_simulations"],
+        evaluator,
+        random_state=rng,
+        time_budget=mcts_flags["move_deadline"],
+        reuse_tree=mcts_flags["tree_reuse"],
+        **kwargs,
+    )
+
+
+# The games rebuilt inside the worker processes of the root parallel bots
+_WORKER_GAMES = {}
+
+
+def _worker_game(game_config, game_logic):
+    """Rebuilds the MiniChessGame in a worker process, the same way AITrainScreen does"""
+    game = _WORKER_GAMES.get(game_config)
+    if game is None:
+        name, num_distinct_actions, num_pieces, rows, cols = game_config
+        game = MiniChessGame(
+            _GAME_TYPE=game_type(name),
+            _GAME_INFO=game_info(num_distinct_actions),
+            game_logic=game_logic,
+            num_pieces=num_pieces,
+            rows=rows,
+            cols=cols,
+        )
+        _WORKER_GAMES[game_config] = game
+    return game
+
+
+def _worker_state(game_config, game_logic):
+    return MiniChessState(_worker_game(game_config, game_logic), game_logic)
+
+
+def _worker_bot(bot_type, flags, state, rng):
+    mcts_flags.update(flags)
+    return _init_bot(bot_type, state.game, 0, rng=rng)
+
+
+def _parallel_bot(bot_type, game):
+    """Builds a RootParallelMCTSBot whose workers run the given type of bot"""
+    game_config = (
+        game.get_type().short_name,
+        game.num_distinct_actions(),
+        game.num_pieces,
+        game.rows,
+        game.cols,
+    )
+    # The workers build their own bots, which run on a single core and only search
+    flags = dict(mcts_flags, parallel_workers=0, opening_book=None)
+    return RootParallelMCTSBot(
+        functools.partial(_worker_bot, bot_type, flags),
+        functools.partial(_worker_state, game_config),
+        num_workers=mcts_flags["parallel_workers"],
+        deadline=mcts_flags["move_deadline"],
+        seed=mcts_flags["seed"],
+        verbose=mcts_flags["verbose"],
+    )
+
+
+def _init_bot(bot_type, game, player_id, rng=None):
+    """Initializes a bot by type, the search bots playing from the opening book and
+    tablebase first when they're set."""
+    bot = _new_bot(bot_type, game, player_id, rng)
+    tables = _lookup_tables() if bot_type in ("mcts", "static", "az") else []
+    return LookupBot(bot, *tables) if tables else bot
+
+
+def _new_bot(bot_type, game, player_id, rng=None):
+    if mcts_flags["parallel_workers"] > 1 and bot_type in ("mcts", "static", "az"):
+        return _parallel_bot(bot_type, game)
+    rng = rng or np.random.RandomState(mcts_flags["seed"])
+    if bot_type == "mcts":
+        evaluator = mcts.RandomRolloutEvaluator(mcts_flags["rollout_count"], rng)
+        return _mcts_bot(
+            game,
+            evaluator,
+            rng,
+            solve=mcts_flags["solve"],
+            verbose=mcts_flags["verbose"],
+        )
+    if bot_type == "static":
+        # Scores the leaves from the movement of the pieces instead of random rollouts
+        return _mcts_bot(
+            game,
+            StaticEvaluator(),
+            rng,
             solve=mcts_flags["solve"],
             verbose=mcts_flags["verbose"],
         )
     if bot_type == "az":
         model = az_model.Model.from_checkpoint(mcts_flags["az_path"])
-        evaluator = az_evaluator.AlphaZeroEvaluator(game, model)
-        return mcts.MCTSBot(
+        if mcts_flags["batch_size"] > 1:
+            evaluator = BatchedAlphaZeroEvaluator(game, model)
+        else:
+            evaluator = az_evaluator.AlphaZeroEvaluator(game, model)
+        return _mcts_bot(
             game,
-            mcts_flags["uct_c"],
-            mcts_flags["max_simulations"],
             evaluator,
-            random_state=rng,
+            rng,
             child_selection_fn=mcts.SearchNode.puct_value,
             solve=mcts_flags["solve"],
             verbose=mcts_flags["verbose"],
@@ -386,6 +583,14 @@ def _init_bot(bot_type, game, player_id):
     raise ValueError("Invalid bot type: %s" % bot_type)
 
 
+def close_bots(bots):
+    """Shuts down the worker processes of the bots that have them"""
+    for bot in bots:
+        close = getattr(bot, "close", None)
+        if close is not None:
+            close()
+
+
 def _get_action(state, action_str):
     for action in state.legal_actions():
         if action_str == state.action_to_string(state.current_player(), action):
@@ -443,6 +648,13 @@ def _play_game(game, bots, initial_actions):
             _opt_print(
                 "Player {} sampled action: {}".format(current_player, action_str)
             )
+            stats = getattr(bot, "search_stats", None)
+            if stats is not None:
+                _opt_print(
+                    "Searched {} nodes in {:.2f}s".format(
+                        stats["nodes"], stats["seconds"]
+                    )
+                )
 
         for i, bot in enumerate(bots):
             if i != current_player:
@@ -493,6 +705,8 @@ def debug_mcts_evaluator(argv, game: pyspiel.Game = None, **kwargs):
     except (KeyboardInterrupt, EOFError):
         game_num -= 1
         print("Caught a KeyboardInterrupt, stopping early.")
+    finally:
+        close_bots(bots)
     print("Number of games played:", game_num + 1)
     print("Number of distinct games played:", len(histories))
     print("Players:", mcts_flags["player1"], mcts_flags["player2"])
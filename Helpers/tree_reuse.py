@@ -0,0 +1,206 @@
+"""
+Search tree reuse between the moves of a game.
+
+The MCTS bots from open_spiel build a new tree for every move, even though the subtree
+below the move that was actually played already holds the statistics of the position the
+next search starts from. TreeReuseMixin keeps that subtree: after every move played, by
+the bot itself in step or by the opponent through inform_action, the root moves down to
+the child of that move and the rest of the tree is dropped. The next search then starts
+from the visits already made there instead of from nothing. The policy step_with_policy
+returns is made of the visit counts of the root moves, so it can be trained on.
+
+The mixin goes in front of mcts.MCTSBot, or any bot with the same search internals:
+
+    class TreeReuseMCTSBot(TreeReuseMixin, mcts.MCTSBot):
+        pass
+
+The kept root is only used when the position it was built for is the one being searched,
+so a bot that missed a move, or is asked about another game, simply starts a new tree.
+
+Since the mixin runs the simulations itself, it's also where the MCTS bots get their time
+budget: given `time_budget` seconds a search keeps going until they're used up instead of
+stopping after max_simulations simulations.
+"""
+
+import time
+
+import numpy as np
+
+from Helpers.graph_mcts import position_key
+
+# pyspiel.PlayerId.CHANCE, the player of the chance nodes, kept here so the mixin doesn't
+# need pyspiel
+CHANCE = -1
+
+
+class TreeReuseMixin:
+    """Keeps the subtree of the moves played between the searches of an MCTS bot
+
+    It needs the bot's `mcts_search` to build new trees and its `_apply_tree_policy` and
+    `evaluator` to search them. The search loop itself is a copy of the one in
+    mcts.MCTSBot.mcts_search, since the bot has no way to search from a given root, so
+    it relies on that contract: `_apply_tree_policy(root, state)` returns the path of
+    visited nodes, root first, and the state at its end, stepping past chance nodes
+    itself when `dont_return_chance_node` is set, and the nodes are SearchNodes. The
+    copy is tested against mcts.MCTSBot to catch it drifting from open_spiel. On top of
+    the bot's arguments it takes `time_budget`, the seconds a search may take, and
+    `reuse_tree`, which can turn the reuse off.
+    `reused_visits` holds the number of visits the last search started with and
+    `search_stats` the simulations it ran and the time it took.
+    """
+
+    def __init__(self, *args, time_budget=None, reuse_tree=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.time_budget = time_budget
+        self.reuse_tree = reuse_tree
+        self.reused_visits = 0
+        self.search_stats = {"nodes": 0, "seconds": 0.0}
+        self._root = None
+        self._root_key = None
+
+    def restart(self):
+        self._root = None
+        self._root_key = None
+
+    def restart_at(self, state):
+        self.restart()
+
+    def _advance(self, state, action):
+        """Moves the kept root down to the child of the action played from the state"""
+        if not self.reuse_tree:
+            return
+        if self._root is None or self._root_key != position_key(state):
+            self.restart()
+            return
+        child = next(
+            (child for child in self._root.children if child.action == action), None
+        )
+        if child is None or child.explore_count == 0:
+            # Nothing below the move was searched, there's nothing worth keeping
+            self.restart()
+            return
+        next_state = state.clone()
+        next_state.apply_action(action)
+        self._root, self._root_key = child, position_key(next_state)
+
+    def inform_action(self, state, player_id, action):
+        self._advance(state, action)
+
+    def step_with_policy(self, state):
+        """Returns the visit counts of the root moves as the policy over the legal
+        actions, along with the move the search picked
+
+        mcts.MCTSBot gives all of the probability to the move it picked, which leaves
+        nothing to learn from or to sample moves from."""
+        root = self.mcts_search(state)
+        action = root.best_child().action
+        visits = {child.action: child.explore_count for child in root.children}
+        total = sum(visits.values())
+        if not total:
+            visits, total = {action: 1}, 1
+        policy = [
+            (legal_action, visits.get(legal_action, 0) / total)
+            for legal_action in state.legal_actions()
+        ]
+        self._advance(state, action)
+        return policy, action
+
+    def _new_root(self, state):
+        """Returns the unexpanded root of a new tree, which the bot's own search gives
+        when it's allowed no simulations"""
+        max_simulations, self.max_simulations = self.max_simulations, 0
+        try:
+            return super().mcts_search(state)
+        finally:
+            self.max_simulations = max_simulations
+
+    def mcts_search(self, state):
+        """Searches from the kept subtree if it is the one of the state, otherwise from a
+        new tree, and keeps the root for the next move"""
+        start = time.perf_counter()
+        key = position_key(state)
+        root = self._root if self.reuse_tree and self._root_key == key else None
+        if root is None:
+            self.reused_visits = 0
+            root = self._new_root(state)
+        else:
+            self.reused_visits = root.explore_count
+            if self.verbose:
+                print("Reusing a subtree with {} visits".format(self.reused_visits))
+        deadline = None if self.time_budget is None else start + self.time_budget
+        simulations = self._search_from(root, state, deadline)
+        self.search_stats = {
+            "nodes": simulations,
+            "seconds": time.perf_counter() - start,
+        }
+        if self.verbose:
+            print(
+                "{} simulations in {:.2f}s".format(
+                    simulations, self.search_stats["seconds"]
+                )
+            )
+        if self.reuse_tree:
+            self._root, self._root_key = root, key
+        return root
+
+    def _search_from(self, root, state, deadline=None):
+        """Runs max_simulations simulations from the root, or as many as fit before the
+        deadline, the same way mcts.MCTSBot.mcts_search does, and returns how many ran
+        """
+        simulations = 0
+        while (
+            simulations < self.max_simulations
+            if deadline is None
+            else simulations == 0 or time.perf_counter() < deadline
+        ):
+            if root.outcome is not None:
+                break
+            simulations += 1
+            visit_path, working_state = self._apply_tree_policy(root, state)
+            if working_state.is_terminal():
+                returns = working_state.returns()
+                visit_path[-1].outcome = returns
+                solved = self.solve
+            else:
+                returns = self.evaluator.evaluate(working_state)
+                solved = False
+
+            while visit_path:
+                # A chance node is rewarded for the player who chose the move above it
+                decision_node = -1
+                while visit_path[decision_node].player == CHANCE:
+                    decision_node -= 1
+                target_return = returns[visit_path[decision_node].player]
+                node = visit_path.pop()
+                node.total_reward += target_return
+                node.explore_count += 1
+
+                if solved and node.children:
+                    player = node.children[0].player
+                    if player == CHANCE:
+                        # A chance node is only solved when all its outcomes are the same
+                        outcome = node.children[0].outcome
+                        if outcome is not None and all(
+                            np.array_equal(child.outcome, outcome)
+                            for child in node.children
+                        ):
+                            node.outcome = outcome
+                        else:
+                            solved = False
+                        continue
+                    best = None
+                    all_solved = True
+                    for child in node.children:
+                        if child.outcome is None:
+                            all_solved = False
+                        elif (
+                            best is None or child.outcome[player] > best.outcome[player]
+                        ):
+                            best = child
+                    if best is not None and (
+                        all_solved or best.outcome[player] == self.max_utility
+                    ):
+                        node.outcome = best.outcome
+                    else:
+                        solved = False
+        return simulations
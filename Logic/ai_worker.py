@@ -0,0 +1,103 @@
+import threading
+import time
+import traceback
+
+
+class AIMoveWorker:
+    """Works out the AI moves on a background thread, so the screen keeps drawing and
+    handling clicks while the engine searches or the language model answers
+
+    start hands the worker a clone of the game, the game on screen is never touched by the
+    thread. The main loop then calls poll every frame, which gives back the action once it
+    is ready and still meant for the position on the board. A move that was cancelled, or
+    whose position was changed in the meantime (by an undo for instance), is thrown away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._request = 0
+        self._thread = None
+        self._game = None
+        self._position = None
+        self._result = None
+        self.started = None
+
+    @property
+    def busy(self):
+        """Whether a move is being worked out"""
+        return self._game is not None
+
+    @property
+    def elapsed(self):
+        """Seconds since the move being worked out was asked for"""
+        return 0.0 if self.started is None else time.perf_counter() - self.started
+
+    def start(self, game):
+        """Starts working out the AI move of the game's position"""
+        self.cancel()
+        previous = self._thread
+        game.get_engine()
+        worker_game = game.clone()
+        if previous is not None and previous.is_alive():
+            # The cancelled search hasn't stopped yet, so it keeps the engine to itself
+            worker_game.engine = None
+            worker_game.get_engine()
+        # Cleared here rather than by the search, a cancel coming before the thread gets
+        # to search still stops it
+        worker_game.engine.clear_stop()
+        with self._lock:
+            self._request += 1
+            request = self._request
+            self._result = None
+        self._game = worker_game
+        self._position = (game.hash_key, len(game.game_history))
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, args=(request, worker_game), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, request, game):
+        try:
+            action = game.choose_ai_action()
+        except Exception:
+            traceback.print_exc()
+            action = None
+        with self._lock:
+            if request == self._request:
+                self._result = (request, action)
+
+    def poll(self, game):
+        """Returns the action once it's ready, None while it's still being worked out
+
+        Once an action is returned, or the game moved on from the position it was asked
+        for, the worker isn't busy anymore."""
+        if self._game is None:
+            return None
+        if (game.hash_key, len(game.game_history)) != self._position:
+            self.cancel()
+            return None
+        with self._lock:
+            result, self._result = self._result, None
+        if result is None:
+            return None
+        self._game = None
+        self.started = None
+        return result[1]
+
+    def cancel(self):
+        """Drops the move being worked out, stopping the engine if it's searching"""
+        if self._game is None:
+            return
+        with self._lock:
+            self._request += 1
+            self._result = None
+        if self._game.engine is not None:
+            self._game.engine.stop()
+        self._game = None
+        self.started = None
+
+    def wait(self, timeout=None):
+        """Blocks until the thread working out the last move is done"""
+        if self._thread is not None:
+            self._thread.join(timeout)
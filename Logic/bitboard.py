@@ -0,0 +1,253 @@
+import numpy as np
+
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+
+MAX_BOARD_SIZE = 16
+
+# Mask tables built from the compiled move tables of the pieces, keyed by the id of the
+# compiled tables they were built from
+_MASK_TABLES = {}
+
+
+def _bit(row, col, cols):
+    return 1 << (row * cols + col)
+
+
+def compile_mask_tables(tables, phased_movement, rows, cols):
+    """Turns compiled move tables into bitboard masks
+
+    For phased pieces each square maps to the mask of squares the piece can jump to.
+    For contiguous pieces each square maps to a tuple of rays, where a ray is a tuple of
+    (ray mask, ascending, stops) with `stops` mapping every square index on the ray to
+    the mask of the ray up to and including that square. `ascending` tells whether the
+    square indices grow along the ray, which decides if the nearest blocker is the lowest
+    or the highest set bit.
+    """
+    masks = {}
+    for (r, c), table in tables.items():
+        square = r * cols + c
+        if phased_movement:
+            mask = 0
+            for row, col in table:
+                mask |= _bit(row, col, cols)
+            masks[square] = mask
+        else:
+            rays = []
+            for ray in table:
+                ray_mask = 0
+                stops = {}
+                for row, col in ray:
+                    ray_mask |= _bit(row, col, cols)
+                    stops[row * cols + col] = ray_mask
+                ascending = ray[0][0] * cols + ray[0][1] > square
+                rays.append((ray_mask, ascending, stops))
+            masks[square] = tuple(rays)
+    return masks
+
+
+def get_mask_tables(piece, rows, cols):
+    """Returns the bitboard masks for a piece, building them only once per movement"""
+    tables = piece.get_move_tables(rows, cols)
+    cached = _MASK_TABLES.get(id(tables))
+    if cached is None or cached[0] is not tables:
+        # The compiled tables are kept alongside the masks so their id can't be reused
+        cached = (
+            tables,
+            compile_mask_tables(tables, piece.phased_movement, rows, cols),
+        )
+        _MASK_TABLES[id(tables)] = cached
+    return cached[1]
+
+
+class BitboardGameLogic:
+    """Bitboard version of GameLogic meant for search
+
+    The position is kept as Python ints: one occupancy mask per color, one mask per piece
+    type, one of the kings and the square of every piece id (-1 once captured). Everything that never
+    changes during a game (the type, color, king flag and masks of each piece id) is
+    shared between clones, so cloning only copies a few ints and one short list.
+
+    Squares are indexed as row * cols + col, which allows boards up to 16x16.
+    """
+
+    def __init__(self, rows=8, cols=8):
+        if not (0 < rows <= MAX_BOARD_SIZE and 0 < cols <= MAX_BOARD_SIZE):
+            raise ValueError(
+                f"Bitboards support boards up to {MAX_BOARD_SIZE}x{MAX_BOARD_SIZE}, got {rows}x{cols}"
+            )
+        self.rows, self.cols = rows, cols
+        self.color_masks = {BLACK_PIECE: 0, WHITE_PIECE: 0}
+        self.type_masks = {}
+        self.king_mask = 0
+        self.piece_squares = []
+        self.piece_info = ()
+        self.turn = WHITE_PIECE
+        self.game_over = False
+        self.winner = None
+        self.name = None
+
+    @classmethod
+    def from_game_logic(cls, game):
+        """Builds a bitboard position from a GameLogic instance with its pieces set up"""
+        bitboard = cls(rows=game.rows, cols=game.cols)
+        pieces = sorted(game.pieces.values(), key=lambda piece: piece.id)
+        bitboard.piece_squares = [-1] * (pieces[-1].id + 1 if pieces else 0)
+        piece_info = [None] * len(bitboard.piece_squares)
+        for piece in pieces:
+            row, col = int(piece.position[0]), int(piece.position[1])
+            color = int(piece.color)
+            bit = _bit(row, col, game.cols)
+            bitboard.piece_squares[piece.id] = row * game.cols + col
+            bitboard.color_masks[color] |= bit
+            bitboard.type_masks[piece.hash] = (
+                bitboard.type_masks.get(piece.hash, 0) | bit
+            )
+            if piece.is_king:
+                bitboard.king_mask |= bit
+            piece_info[piece.id] = (
+                piece.hash,
+                color,
+                piece.is_king,
+                piece.phased_movement,
+                get_mask_tables(piece, game.rows, game.cols),
+            )
+        bitboard.piece_info = tuple(piece_info)
+        bitboard.turn = WHITE_PIECE if game.turn == WHITE_PIECE else BLACK_PIECE
+        bitboard.game_over = game.game_over
+        bitboard.winner = game.winner
+        bitboard.name = game.name
+        return bitboard
+
+    def _targets(self, piece_id):
+        """Returns the mask of squares a piece can move to"""
+        _, color, _, phased_movement, masks = self.piece_info[piece_id]
+        own = self.color_masks[color]
+        table = masks[self.piece_squares[piece_id]]
+
+        if phased_movement:
+            return table & ~own
+
+        occupied = self.color_masks[BLACK_PIECE] | self.color_masks[WHITE_PIECE]
+        targets = 0
+        for ray_mask, ascending, stops in table:
+            blockers = ray_mask & occupied
+            if blockers == 0:
+                targets |= ray_mask
+            else:
+                if ascending:
+                    nearest = (blockers & -blockers).bit_length() - 1
+                else:
+                    nearest = blockers.bit_length() - 1
+                targets |= stops[nearest]
+        return targets & ~own
+
+    def get_all_possible_moves_action_space(self):
+        """Returns all possible moves for the current player"""
+        moves = []
+        board_size = self.rows * self.cols
+        for piece_id, square in enumerate(self.piece_squares):
+            if square < 0 or self.piece_info[piece_id][1] != self.turn:
+                continue
+            targets = self._targets(piece_id)
+            while targets:
+                bit = targets & -targets
+                row, col = divmod(bit.bit_length() - 1, self.cols)
+                # Same action encoding as GameLogic
+                moves.append(piece_id * board_size + row * self.rows + col)
+                targets ^= bit
+        moves.sort()
+        return moves
+
+    def apply_action(self, action):
+        """Applies the action to the board"""
+        piece_id = action // (self.rows * self.cols)
+        action = action % (self.rows * self.cols)
+        row = action // self.rows
+        col = action % self.cols
+        if piece_id >= len(self.piece_squares) or self.piece_squares[piece_id] < 0:
+            return
+        piece_hash, color, is_king, _, _ = self.piece_info[piece_id]
+        if color != self.turn:
+            return
+        target = row * self.cols + col
+        bit = 1 << target
+        if not self._targets(piece_id) & bit:
+            return
+
+        enemy = BLACK_PIECE if color == WHITE_PIECE else WHITE_PIECE
+        if self.color_masks[enemy] & bit:
+            captured_id = self.piece_squares.index(target)
+            captured_hash, _, captured_king, _, _ = self.piece_info[captured_id]
+            self.piece_squares[captured_id] = -1
+            self.color_masks[enemy] ^= bit
+            self.type_masks[captured_hash] ^= bit
+            if captured_king:
+                self.king_mask ^= bit
+                self.game_over = True
+                self.winner = "White" if color == WHITE_PIECE else "Black"
+
+        move = (1 << self.piece_squares[piece_id]) | bit
+        self.color_masks[color] ^= move
+        self.type_masks[piece_hash] ^= move
+        if is_king:
+            self.king_mask ^= move
+        self.piece_squares[piece_id] = target
+        self.turn = WHITE_PIECE if self.turn == BLACK_PIECE else BLACK_PIECE
+
+    def action_to_string(self, action):
+        """Converts the action to a string"""
+        piece_id = action // (self.rows * self.cols)
+        action = action % (self.rows * self.cols)
+        row = action // self.rows
+        col = action % self.cols
+        piece_hash, color, _, _, _ = self.piece_info[piece_id]
+        position = divmod(self.piece_squares[piece_id], self.cols)
+        return f"{'w' if color == WHITE_PIECE else 'b'}{piece_hash}={position}->{(row, col)}"
+
+    def get_current_game_state(self):
+        """Returns the current game state as the piece_position and piece_alignment arrays"""
+        piece_position = np.zeros((self.rows, self.cols))
+        piece_alignment = np.zeros((self.rows, self.cols))
+        for piece_id, square in enumerate(self.piece_squares):
+            if square >= 0:
+                piece_hash, color, _, _, _ = self.piece_info[piece_id]
+                row, col = divmod(square, self.cols)
+                piece_position[row, col] = piece_hash
+                piece_alignment[row, col] = color
+        return piece_position, piece_alignment
+
+    def board_to_string(self):
+        """Returns the board as a string"""
+        piece_position, piece_alignment = self.get_current_game_state()
+        return f"{piece_position}\n{piece_alignment}"
+
+    def key(self):
+        """Returns a tuple of ints that identifies the position"""
+        return (
+            self.turn,
+            self.color_masks[WHITE_PIECE],
+            self.color_masks[BLACK_PIECE],
+            self.king_mask,
+            *sorted(self.type_masks.items()),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, BitboardGameLogic) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def clone(self):
+        """Clones the current game state"""
+        clone = BitboardGameLogic.__new__(BitboardGameLogic)
+        clone.rows, clone.cols = self.rows, self.cols
+        clone.color_masks = self.color_masks.copy()
+        clone.type_masks = self.type_masks.copy()
+        clone.king_mask = self.king_mask
+        clone.piece_squares = self.piece_squares.copy()
+        clone.piece_info = self.piece_info
+        clone.turn = self.turn
+        clone.game_over = self.game_over
+        clone.winner = self.winner
+        clone.name = self.name
+        return clone
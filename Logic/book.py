@@ -0,0 +1,215 @@
+import collections
+import glob
+import os
+import re
+
+import numpy as np
+
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+
+DEFAULT_DIRECTORY = os.path.join(os.getcwd(), "Books")
+
+# Only the first moves of every game go in the book
+MAX_BOOK_PLIES = 16
+
+# A move has to be seen this many times before the book plays it
+MIN_MOVE_COUNT = 2
+
+# The moves are written the way GameLogic.get_all_possible_moves and action_to_string
+# write them, like w492=(3, 0)->(2, 0)
+MOVE_PATTERN = re.compile(r"([wb])(\d+)=\((\d+), (\d+)\)->\((\d+), (\d+)\)")
+
+# What the book keeps for every move of a position, the positions themselves are kept in
+# a separate array of sorted hash keys. A move is its from square times the number of
+# squares plus its to square, which needs more than 16 bits past 16x16 boards
+ENTRY_DTYPE = np.dtype([("move", "<u4"), ("count", "<u4"), ("score", "<f4")])
+
+
+def parse_moves(text):
+    """Returns the (color, piece hash, from square, to square) of every move in the text"""
+    return [
+        (
+            WHITE_PIECE if color == "w" else BLACK_PIECE,
+            int(piece_hash),
+            (int(row1), int(col1)),
+            (int(row2), int(col2)),
+        )
+        for color, piece_hash, row1, col1, row2, col2 in MOVE_PATTERN.findall(text)
+    ]
+
+
+def read_history(path):
+    """Reads the games saved in Histories/ by GameScreen, returning (moves, winner) pairs
+
+    Every game is its moves, one per line, followed by a "White wins" or "Black wins"
+    line."""
+    games = []
+    moves = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line in ("White wins", "Black wins"):
+                if moves:
+                    games.append(
+                        (moves, WHITE_PIECE if line == "White wins" else BLACK_PIECE)
+                    )
+                moves = []
+            else:
+                moves.extend(parse_moves(line))
+    return games
+
+
+def read_actor_log(path):
+    """Reads the self-play games from an AlphaZero actor log, returning (moves, winner)
+    pairs. The returns are those of white first."""
+    games = []
+    with open(path, "r") as f:
+        for line in f:
+            if "Returns:" not in line or "Actions:" not in line:
+                continue
+            returns, actions = line.split("Returns:", 1)[1].split("; Actions:", 1)
+            moves = parse_moves(actions)
+            white_return = float(returns.split()[0])
+            if moves:
+                winner = None
+                if white_return > 0:
+                    winner = WHITE_PIECE
+                elif white_return < 0:
+                    winner = BLACK_PIECE
+                games.append((moves, winner))
+    return games
+
+
+def find_games(name, histories=None, checkpoints=None):
+    """Returns the saved and self-played games of a board"""
+    histories = histories or os.path.join(os.getcwd(), "Histories")
+    checkpoints = checkpoints or os.path.join(os.getcwd(), "Checkpoints")
+    games = []
+    history = os.path.join(histories, f"{name}.txt")
+    if os.path.exists(history):
+        games.extend(read_history(history))
+    pattern = os.path.join(
+        checkpoints, f"{os.path.splitext(name)[0]}_az", "log-actor-*.txt"
+    )
+    for log in sorted(glob.glob(pattern)):
+        games.extend(read_actor_log(log))
+    return games
+
+
+def move_action(game, move):
+    """Returns the action of a (from square, to square) move in the game, or None if the
+    move isn't legal"""
+    (row1, col1), (row2, col2) = move
+    piece = game.pieces.get((row1, col1))
+    if piece is None or piece.color != game.turn:
+        return None
+    action = piece.id * (game.rows * game.cols) + row2 * game.rows + col2
+    if action not in game.get_all_possible_moves_action_space():
+        return None
+    return action
+
+
+class OpeningBook:
+    """The moves played from the first positions of a board, keyed by GameLogic.hash_key
+
+    Moves are kept as from and to squares rather than actions, since a position reached
+    by different move orders can have its pieces under different ids. Every move of a
+    position has the number of games it was played in and the score of the player who
+    played it, 1 for a win, 0.5 for a draw and 0 for a loss.
+
+    Like the tablebase, the sorted keys and the moves are saved as .npy files which are
+    memory mapped when loaded, so looking up a position is a binary search.
+    """
+
+    def __init__(self, keys, entries):
+        self.keys = keys
+        self.entries = entries
+
+    @classmethod
+    def build(cls, game, games, max_plies=MAX_BOOK_PLIES):
+        """Replays the (moves, winner) games from the current position of the game and
+        collects the first max_plies moves of each. Games with a move that isn't legal
+        were played on another version of the board and are skipped."""
+        board_size = game.rows * game.cols
+        statistics = collections.defaultdict(lambda: [0, 0.0])
+        for moves, winner in games:
+            replay = game.clone()
+            seen = []
+            for color, piece_hash, start, end in moves[:max_plies]:
+                piece = replay.pieces.get(start)
+                action = move_action(replay, (start, end))
+                if action is None or piece.hash != piece_hash or color != replay.turn:
+                    seen = None
+                    break
+                seen.append((replay.hash_key, color, start, end))
+                replay.push_action(action)
+            if seen is None:
+                continue
+            for key, color, (row1, col1), (row2, col2) in seen:
+                move = (row1 * game.cols + col1) * board_size + row2 * game.cols + col2
+                entry = statistics[(key, move)]
+                entry[0] += 1
+                entry[1] += 0.5 if winner is None else 1.0 if winner == color else 0.0
+
+        # Sorted by position, then with the most played moves first
+        items = sorted(statistics.items(), key=lambda item: (item[0][0], -item[1][0]))
+        keys = np.array([key for (key, _), _ in items], dtype=np.uint64)
+        entries = np.array(
+            [(move, count, score) for (_, move), (count, score) in items],
+            dtype=ENTRY_DTYPE,
+        )
+        return cls(keys, entries)
+
+    @staticmethod
+    def paths(name, directory=None):
+        """Returns the paths of the key and move files of a board's book"""
+        directory = directory or DEFAULT_DIRECTORY
+        base = os.path.join(directory, os.path.splitext(name)[0])
+        return base + ".keys.npy", base + ".moves.npy"
+
+    def save(self, name, directory=None):
+        keys_path, entries_path = self.paths(name, directory)
+        os.makedirs(os.path.dirname(keys_path), exist_ok=True)
+        np.save(keys_path, self.keys)
+        np.save(entries_path, self.entries)
+
+    @classmethod
+    def load(cls, name, directory=None):
+        """Memory maps the book of a board, or returns None if it wasn't built"""
+        keys_path, entries_path = cls.paths(name, directory)
+        if not (os.path.exists(keys_path) and os.path.exists(entries_path)):
+            return None
+        return cls(
+            np.load(keys_path, mmap_mode="r"), np.load(entries_path, mmap_mode="r")
+        )
+
+    def __len__(self):
+        """The number of distinct positions in the book"""
+        return len(np.unique(self.keys))
+
+    def moves(self, game):
+        """Returns the (action, count, score) of the book moves of the game's position
+        that are legal in it, most played first"""
+        key = np.uint64(game.hash_key)
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        board_size = game.rows * game.cols
+        moves = []
+        for move, count, score in self.entries[start:end].tolist():
+            start_square, end_square = divmod(move, board_size)
+            action = move_action(
+                game, (divmod(start_square, game.cols), divmod(end_square, game.cols))
+            )
+            if action is not None:
+                moves.append((action, count, score))
+        return moves
+
+    def best_action(self, game, min_count=MIN_MOVE_COUNT):
+        """Returns the book move with the best average score among the moves played at
+        least min_count times, or None once the game has left the book"""
+        if game.game_over:
+            return None
+        moves = [move for move in self.moves(game) if move[1] >= min_count]
+        if not moves:
+            return None
+        return max(moves, key=lambda move: (move[2] / move[1], move[1]))[0]
@@ -0,0 +1,203 @@
+import time
+
+from Logic.evaluation import PositionEvaluator
+
+# Score of a won game. Wins found sooner score higher, so the engine takes the quickest one
+WIN_SCORE = 1000000
+# Scores this close to WIN_SCORE are wins or losses found by the search
+WIN_THRESHOLD = WIN_SCORE - 1000
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# How many nodes are searched between two looks at the clock
+NODES_PER_TIME_CHECK = 256
+
+# The transposition table is cleared before a search once it holds this many positions
+MAX_TRANSPOSITION_TABLE_SIZE = 1000000
+
+
+def tablebase_score(distance, ply):
+    """Turns a tablebase distance into a score for the player to move, the king being
+    taken `distance` moves after this ply"""
+    if distance < 0:
+        return 0  # A draw
+    score = WIN_SCORE - (ply + distance)
+    return score if distance % 2 else -score
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out"""
+
+
+class AlphaBetaEngine:
+    """Iterative deepening alpha-beta search over GameLogic
+
+    The search makes and takes back moves with push_action and pop_action on a clone of
+    the game, so the game being played is never touched. Every iteration searches one move
+    deeper, starting with the best move of the previous one, until the time budget or
+    max_depth is reached. Positions already searched are kept in a transposition table
+    keyed by GameLogic.hash_key. The leaves are scored by `evaluate`, a function of the game
+    returning the score for the player to move, by default a PositionEvaluator. Positions
+    found in the `tablebase` get their exact score without being searched.
+
+    With the same max_depth and no time budget the engine always plays the same move.
+    The positions searched and the time taken by the last search are kept in
+    `search_stats`, alongside the depth it completed.
+
+    A search running on another thread can be cut short with stop, it then returns the
+    best move of the deepest iteration it finished. The stop is only cleared by
+    clear_stop, which is called when the search is scheduled rather than when it starts,
+    so a stop coming before the thread gets to search isn't lost.
+    """
+
+    def __init__(self, time_budget=0.5, max_depth=64, evaluate=None, tablebase=None):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.evaluate = evaluate or PositionEvaluator()
+        self.tablebase = tablebase
+        self.transposition_table = {}
+        self.nodes = 0
+        self.depth_reached = 0
+        self.search_stats = {"nodes": 0, "seconds": 0.0, "depth": 0}
+        self._deadline = None
+        self._stopped = False
+
+    def stop(self):
+        """Makes the running search return as soon as it next looks at the clock"""
+        self._stopped = True
+
+    def clear_stop(self):
+        """Lets the next search run after a stop"""
+        self._stopped = False
+
+    def search(self, game):
+        """Returns the best action for the player to move, or None if there isn't one"""
+        start = time.perf_counter()
+        game = game.clone()
+        actions = game.get_all_possible_moves_action_space()
+        if game.game_over or not actions:
+            return None
+        self.nodes = 0
+        self.depth_reached = 0
+        if self.tablebase is not None:
+            action = self.tablebase.best_action(game)
+            if action is not None:
+                self.search_stats = {
+                    "nodes": 0,
+                    "seconds": time.perf_counter() - start,
+                    "depth": 0,
+                }
+                return action
+
+        if len(self.transposition_table) > MAX_TRANSPOSITION_TABLE_SIZE:
+            self.transposition_table = {}
+        self._deadline = None if self.time_budget is None else start + self.time_budget
+        best_action = actions[0]
+        for depth in range(1, self.max_depth + 1):
+            if self._stopped:
+                break
+            try:
+                score, action = self._search_root(game, actions, depth, best_action)
+            except SearchTimeout:
+                # The unfinished iteration is thrown away, and so are the moves it had
+                # pushed, which only live on the clone
+                break
+            best_action, self.depth_reached = action, depth
+            if abs(score) >= WIN_THRESHOLD:
+                break  # A forced win or loss was found, searching deeper won't change it
+        self.search_stats = {
+            "nodes": self.nodes,
+            "seconds": time.perf_counter() - start,
+            "depth": self.depth_reached,
+        }
+        return best_action
+
+    def _search_root(self, game, actions, depth, first_action):
+        ordered = [first_action] + [a for a in actions if a != first_action]
+        alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+        best_action = first_action
+        for action in ordered:
+            game.push_action(action)
+            score = -self._negamax(game, depth - 1, -beta, -alpha, 1)
+            game.pop_action()
+            if score > alpha:
+                alpha, best_action = score, action
+        self.transposition_table[game.hash_key] = (depth, alpha, EXACT, best_action)
+        return alpha, best_action
+
+    def _order_actions(self, game, actions, tt_action):
+        """Puts the move from the transposition table first, then captures"""
+        board_size = game.rows * game.cols
+
+        def priority(action):
+            if action == tt_action:
+                return 0
+            square = action % board_size
+            row, col = square // game.rows, square % game.cols
+            return 1 if game.piece_position[row, col] != 0 else 2
+
+        return sorted(actions, key=priority)
+
+    def _negamax(self, game, depth, alpha, beta, ply):
+        self.nodes += 1
+        if (
+            self.nodes % NODES_PER_TIME_CHECK == 0
+            and self.depth_reached > 0
+            and (
+                self._stopped
+                or self._deadline is not None
+                and time.perf_counter() > self._deadline
+            )
+        ):
+            raise SearchTimeout()
+
+        if game.game_over:
+            # The player who just moved took the king
+            return -(WIN_SCORE - ply)
+
+        key = game.hash_key
+        if self.tablebase is not None:
+            distance = self.tablebase.probe(game)
+            if distance is not None:
+                return tablebase_score(distance, ply)
+        if depth == 0:
+            return self.evaluate(game)
+
+        entry = self.transposition_table.get(key)
+        tt_action = None
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, tt_action = entry
+            # Win scores depend on how deep they were found, so they're only used for ordering
+            if entry_depth >= depth and abs(entry_score) < WIN_THRESHOLD:
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        actions = game.get_all_possible_moves_action_space()
+        if not actions:
+            return 0  # No moves left, nobody can win
+
+        original_alpha = alpha
+        best_score, best_action = -WIN_SCORE - 1, None
+        for action in self._order_actions(game, actions, tt_action):
+            game.push_action(action)
+            score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            game.pop_action()
+            if score > best_score:
+                best_score, best_action = score, action
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table[key] = (depth, best_score, flag, best_action)
+        return best_score
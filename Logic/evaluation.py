@@ -0,0 +1,163 @@
+import math
+
+import numpy as np
+
+from UI.piece_draw_screen import TOTAL_EXPECTED_PIECES
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+
+# Weight of the average mobility of a piece type, which is its material value, and of how
+# much more or less mobile a piece is on its current square than on average
+MATERIAL_WEIGHT = 100
+MOBILITY_WEIGHT = 10
+
+# Scores are squashed into (-1, 1) with tanh(score / VALUE_SCALE) for the MCTS bots
+VALUE_SCALE = 1000
+
+# The color index used in the lookup tables, 0 is kept for empty squares
+_COLOR_INDEX = {BLACK_PIECE: 1, WHITE_PIECE: 2}
+
+
+def mobility_table(piece, rows, cols):
+    """Returns a rows x cols array with the number of squares the piece can reach from each
+    square of an empty board, counted from its compiled move tables"""
+    tables = piece.get_move_tables(rows, cols)
+    mobility = np.zeros((rows, cols))
+    for (r, c), table in tables.items():
+        if piece.phased_movement:
+            mobility[r, c] = len(table)
+        else:
+            mobility[r, c] = sum(len(ray) for ray in table)
+    return mobility
+
+
+def piece_value(piece, rows, cols):
+    """The value of a piece type is its average mobility over the squares of the board"""
+    return float(mobility_table(piece, rows, cols).mean())
+
+
+class PositionEvaluator:
+    """Static evaluation of GameLogic positions from the movement of the pieces
+
+    Since pieces are drawn by the players there's no fixed material table. Instead every
+    (piece type, color) gets a piece-square table for the board size: its material value,
+    the average mobility over the board, plus a bonus or penalty for how much more or less
+    it can reach from that square. Kings only get the mobility part since losing them ends
+    the game anyway.
+
+    The tables are stacked into one flat array indexed by (type, color, square), with the
+    black tables negated, so scoring a position is a single NumPy gather and sum over
+    piece_position and piece_alignment, and a batch of positions is scored in one call.
+    Calling the evaluator on a game returns the score for the player to move, which is
+    what AlphaBetaEngine expects.
+    """
+
+    def __init__(
+        self, material_weight=MATERIAL_WEIGHT, mobility_weight=MOBILITY_WEIGHT
+    ):
+        self.material_weight = material_weight
+        self.mobility_weight = mobility_weight
+        # Lookup tables keyed by the id of the piece_types dictionary they were built from,
+        # which clones of a game share
+        self._tables = {}
+
+    def get_tables(self, game):
+        """Returns the offsets of the types, colors and squares into the flat piece-square
+        tables, and the tables themselves"""
+        piece_types = game.piece_types
+        cached = self._tables.get(id(piece_types))
+        if (
+            cached is not None
+            and cached[0] is piece_types
+            and cached[1] == len(piece_types)
+        ):
+            return cached[2]
+
+        piece_types = game._get_piece_types()
+        kings = {
+            (piece.hash, piece.color) for piece in game.pieces.values() if piece.is_king
+        }
+        hashes = sorted({piece_hash for piece_hash, _ in piece_types})
+        # Index 0 of both the types and the colors is an empty square, which scores 0
+        lookup = np.zeros(TOTAL_EXPECTED_PIECES, dtype=np.intp)
+        tables = np.zeros((len(hashes) + 1, 3, game.rows * game.cols))
+        for index, piece_hash in enumerate(hashes, start=1):
+            lookup[piece_hash] = index
+        for (piece_hash, color), piece in piece_types.items():
+            mobility = mobility_table(piece, game.rows, game.cols)
+            value = mobility.mean()
+            table = self.mobility_weight * (mobility - value)
+            if (piece_hash, color) not in kings:
+                table += self.material_weight * value
+            # Scores are summed from white's side, so black pieces count negatively
+            sign = 1 if color == WHITE_PIECE else -1
+            tables[lookup[piece_hash], _COLOR_INDEX[color]] = sign * table.ravel()
+
+        # The gather index of a square is (type * 3 + color) * board size + square
+        board_size = game.rows * game.cols
+        lookup = lookup * 3 * board_size
+        color_offsets = np.zeros(3, dtype=np.intp)
+        color_offsets[_COLOR_INDEX[BLACK_PIECE]] = (
+            _COLOR_INDEX[BLACK_PIECE] * board_size
+        )
+        color_offsets[_COLOR_INDEX[WHITE_PIECE]] = (
+            _COLOR_INDEX[WHITE_PIECE] * board_size
+        )
+        squares = np.arange(board_size).reshape(game.rows, game.cols)
+        tables = (lookup, color_offsets, squares, tables.ravel())
+        self._tables[id(piece_types)] = (piece_types, len(piece_types), tables)
+        return tables
+
+    def evaluate_batch(self, game, piece_positions, piece_alignments, turns):
+        """Scores N positions of the game at once for their player to move
+
+        Takes N x rows x cols arrays of piece positions and alignments and the N turns.
+        """
+        lookup, color_offsets, squares, tables = self.get_tables(game)
+        index = (
+            lookup[np.asarray(piece_positions).astype(np.intp)]
+            + color_offsets[np.asarray(piece_alignments).astype(np.intp)]
+            + squares
+        )
+        scores = tables[index].sum(axis=(1, 2))
+        return np.where(np.asarray(turns) == WHITE_PIECE, scores, -scores)
+
+    def evaluate(self, game):
+        """Scores the position of the game for the player to move"""
+        lookup, color_offsets, squares, tables = self.get_tables(game)
+        score = tables[
+            lookup[game.piece_position.astype(np.intp)]
+            + color_offsets[game.piece_alignment.astype(np.intp)]
+            + squares
+        ].sum()
+        return float(score if game.turn == WHITE_PIECE else -score)
+
+    def __call__(self, game):
+        return self.evaluate(game)
+
+
+class StaticEvaluator:
+    """MCTS evaluator following the open_spiel interface (`evaluate` and `prior`) that
+    scores the leaves with PositionEvaluator instead of playing random rollouts
+
+    The score is squashed into (-1, 1) and returned for both players, white first."""
+
+    def __init__(self, position_evaluator=None, value_scale=VALUE_SCALE):
+        self.position_evaluator = position_evaluator or PositionEvaluator()
+        self.value_scale = value_scale
+
+    def evaluate(self, state):
+        if state.is_terminal():
+            return np.array(state.returns(), dtype=float)
+        game = state.game_logic
+        score = self.position_evaluator.evaluate(game)
+        if game.turn != WHITE_PIECE:
+            score = -score
+        value = math.tanh(score / self.value_scale)
+        return np.array([value, -value])
+
+    def prior(self, state):
+        """Returns a uniform prior over the legal actions"""
+        if state.is_terminal():
+            return []
+        actions = state.legal_actions()
+        return [(action, 1.0 / len(actions)) for action in actions]
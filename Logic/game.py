@@ -11,10 +11,36 @@ from UI.piece_draw_screen import TOTAL_EXPECTED_PIECES, WALK, BLACK, WHITE
 from UI.board_create_screen import PIECE_HEIGHT, PIECE_WIDTH, BLACK_PIECE, WHITE_PIECE
 from langchain.chat_models import ChatOpenAI
 from Helpers.prompts import get_next_move_prompt
+from Logic.piece import GamePiece
+from Logic.engine import AlphaBetaEngine
+from Logic.book import move_action, parse_moves
+from Logic.past_games import DEFAULT_TOKEN_BUDGET
+from Logic.notation import (
+    legend,
+    move_name,
+    parse_move,
+    piece_letters,
+    read_fen,
+    write_fen,
+)
+from Logic.llm_client import LLMMoveClient
+from Logic.zobrist import SIDE_TO_MOVE_KEY, compute_hash_key, zobrist_key
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Initializing the llm model with the openai api key stored in the .env file
-llm = ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"))
+# The client asking the llm model for moves, only made once the AI first needs it so the
+# game can be played against the engine without an openai api key
+llm = None
+
+
+def get_llm():
+    """Returns the llm client, initializing it with the openai api key stored in the .env
+    file the first time"""
+    global llm
+    if llm is None:
+        llm = LLMMoveClient(ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY")))
+    return llm
 
 
 class GameLogic:
@@ -33,45 +59,186 @@ class GameLogic:
         self.game_over = False
         self.winner = None
         self.name = None
+        # One piece for every (piece hash, color) in the game, used to look up movement
+        self.piece_types = {}
+        # Cached moves of the pieces keyed by square, alongside the squares they depend on,
+        # and the legal actions of the current state. Both are thrown away as pieces move.
+        self._move_cache = {}
+        self._state_version = 0
+        self._legal_actions = (None, None)
+        # Moves that can be taken back with pop_action, newest last
+        self.undo_stack = []
+        # The pieces indexed by their id, None once captured, and the state version it was
+        # last known to match the pieces at
+        self.pieces_by_id = []
+        self._index_version = -1
+        # Zobrist key of the position, None until it's first asked for
+        self._hash_key = None
+        # Who plays the AI moves, "llm" asks the language model and "engine" searches locally
+        self.ai_player = "llm"
+        self.engine = None
+        # Seconds the engine may think about a move
+        self.move_time = 0.5
+        # Solved positions of the board, which the engine plays from without searching
+        self.tablebase = None
+        # Moves played from the first positions in past games, tried before the AI player
+        self.book = None
+        # The saved games of the board, a PastGamesIndex, and how many tokens of the llm
+        # prompt they may take
+        self.past_games = None
+        self.past_games_budget = DEFAULT_TOKEN_BUDGET
+        # Letters of the piece hashes in the notation, and the number of piece types they
+        # were handed out for
+        self._piece_letters = (None, None)
+        # Seconds the language model gets to answer before the engine's move is played
+        self.llm_deadline = 5.0
+        # Where every move raced between the language model and the engine came from and
+        # how long each took, shared with the clones so moves worked out on them count
+        self.hedge_history = []
 
     def ai_move(self):
-        """Gets the next move from the ai and handles it by calling the handle_press function with the correct parameters"""
-        possible_moves = self.get_all_possible_moves()
-        if os.path.exists(os.path.join(os.getcwd(), "Histories", f"{self.name}.txt")):
-            with open(
-                os.path.join(os.getcwd(), "Histories", f"{self.name}.txt"), "r"
-            ) as f:
-                past_games = f.read()
-        else:
-            past_games = ""
+        """Gets the next move from the ai and plays it"""
+        self.get_engine().clear_stop()
+        action = self.choose_ai_action()
+        if action is not None:
+            self.apply_action(action)
+
+    def choose_ai_action(self):
+        """Returns the action the AI wants to play, without playing it
+
+        The book is asked first, then the engine or, in llm mode, the language model raced
+        against the engine (see hedged_action). The game itself isn't changed, so this can
+        run on a clone in the background while the board is still drawn."""
+        if self.game_over:
+            return None
+        if self.book is not None:
+            action = self.book.best_action(self)
+            if action is not None:
+                return action
+        if self.ai_player == "engine":
+            return self.get_engine().search(self)
+        return self.hedged_action()
+
+    def hedged_action(self):
+        """Asks the language model and the engine for a move at the same time
+
+        The move of the language model is played if a legal one comes back within
+        llm_deadline seconds, otherwise the engine's, so a slow or confused language model
+        never holds the game up for longer than that. If neither has a move the first
+        legal action is played.
+
+        Which one was played and how long each took is added to hedge_history. A reply of
+        the language model coming after the engine won is still timed, and cached by the
+        client for the next time the position comes up."""
+        start = time.perf_counter()
+        stats = {"source": None, "llm_seconds": None, "engine_seconds": None}
+        self.hedge_history.append(stats)
+        engine = self.get_engine()
+
+        def timed(name, function, game):
+            try:
+                return function(game)
+            finally:
+                stats[name] = time.perf_counter() - start
+
+        # Each side gets its own copy of the game, since the language model can still be
+        # working on its copy after the move is played
+        executor = ThreadPoolExecutor(max_workers=2)
+        llm_future = executor.submit(
+            timed, "llm_seconds", GameLogic.llm_action, self.clone()
+        )
+        engine_future = executor.submit(
+            timed, "engine_seconds", engine.search, self.clone()
+        )
+        executor.shutdown(wait=False)
+
+        try:
+            action = llm_future.result(timeout=self.llm_deadline)
+        except Exception:
+            action = None
+        if action is not None:
+            stats["source"] = "llm"
+            engine.stop()
+        try:
+            # The engine is waited for either way, so its next search doesn't start
+            # while this one still runs
+            engine_action = engine_future.result()
+        except Exception:
+            engine_action = None
+        if stats["source"] == "llm":
+            # The search is over, the stop mustn't carry on to the next one
+            engine.clear_stop()
+        if action is None and engine_action is not None:
+            action = engine_action
+            stats["source"] = "engine"
+        if action is None:
+            actions = self.get_all_possible_moves_action_space()
+            action = actions[0] if actions else None
+            stats["source"] = "first legal"
+        return action
+
+    def llm_action(self):
+        """Returns the move the language model chose, or None if it didn't answer with a
+        legal one"""
+        # Only the past games closest to this one are shown, so the prompt doesn't grow
+        # with every game saved
+        past_moves = parse_moves("\n".join(self.game_history))
+        past_games = ""
+        if self.past_games is not None:
+            past_games = self.past_games.select(
+                self, past_moves, self.past_games_budget
+            )
         prompt = get_next_move_prompt(
-            init_piece_position=self.initial_piece_position,
-            init_piece_alignment=self.initial_piece_alignment,
-            game_history=self.game_history,
-            possible_moves=possible_moves,
+            position=self.to_fen(),
+            legend=self.fen_legend(),
+            game_history=[
+                move_name(start, end, self.rows) for _, _, start, end in past_moves
+            ],
+            possible_moves=[
+                self.action_to_move(action)
+                for action in self.get_all_possible_moves_action_space()
+            ],
             past_games=past_games,
         )
 
         try:
-            next_move = llm.predict(prompt)
-
-            parsed_move = next_move.split("->")
-
-            starting = parsed_move[0].strip().split("=")[1].strip()
-            row1, col1 = starting.strip("")[1], starting.strip("")[-2]
-            ending = parsed_move[1]
-            row2, col2 = ending.strip("")[1], ending.strip("")[-2]
+            return self.parse_llm_move(
+                get_llm().predict(
+                    prompt,
+                    validate=lambda reply: self.parse_llm_move(reply) is not None,
+                )
+            )
         except:
-            next_move = possible_moves[0]
-            parsed_move = next_move.split("->")
-
-            starting = parsed_move[0].strip().split("=")[1].strip()
-            row1, col1 = starting.strip("")[1], starting.strip("")[-2]
-            ending = parsed_move[1]
-            row2, col2 = ending.strip("")[1], ending.strip("")[-2]
-
-        self.handle_press(int(row1), int(col1))
-        self.handle_press(int(row2), int(col2))
+            return None
+
+    def parse_llm_move(self, next_move):
+        """Returns the action of a move written by the llm, or None if it can't be read or
+        isn't legal. The move can be written like a1a2 or like the game history."""
+        if not isinstance(next_move, str):
+            return None
+        action = self.move_to_action(next_move)
+        if action is None:
+            moves = parse_moves(next_move)
+            if moves:
+                action = move_action(self, moves[0][2:])
+        return action
+
+    def get_engine(self):
+        """Returns the local alpha-beta engine, creating it the first time"""
+        if self.engine is None:
+            self.engine = AlphaBetaEngine(
+                time_budget=self.move_time, tablebase=self.tablebase
+            )
+        return self.engine
+
+    def engine_move(self):
+        """Plays the move chosen by the local alpha-beta engine, which needs no network
+        and answers within its time budget"""
+        engine = self.get_engine()
+        engine.clear_stop()
+        action = engine.search(self)
+        if action is not None:
+            self.apply_action(action)
 
     def handle_press(self, row, col):
         """Handles the press of a piece on the board
@@ -89,36 +256,11 @@ class GameLogic:
             if self.selected_piece is not None:
                 # print(f"Currently the piece is at {self.selected_piece.position}")
                 if (row, col) in self.piece_can_move_to:
-                    self.game_history.append(
-                        f'{"w" if self.turn == WHITE_PIECE else "b"}{self.selected_piece.hash}={self.selected_piece.position}->{row, col}'
-                    )
-
-                    del self.pieces[
-                        (
-                            self.selected_piece.position[0],
-                            self.selected_piece.position[1],
-                        )
-                    ]
-                    if self.pieces.get((row, col), None) is not None:
-                        if self.pieces[(row, col)].is_king:
-                            self.game_over = True
-                            self.winner = (
-                                "White"
-                                if self.selected_piece.color == WHITE_PIECE
-                                else "Black"
-                            )
-                            self.game_history.append(f"\n{self.winner} wins\n")
-                            print(f"{self.winner} wins")
-                    self.piece_position[self.selected_piece.position] = 0
-                    self.piece_position[row, col] = self.selected_piece.hash
-                    self.piece_alignment[self.selected_piece.position] = 0
-                    self.piece_alignment[row, col] = self.selected_piece.color
-                    self.selected_piece.position = (row, col)
-                    # print(self.selected_piece.position)
+                    captured = self._move_piece(self.selected_piece, row, col)
+                    if captured is not None and captured.is_king:
+                        print(f"{self.winner} wins")
                     self.piece_can_move_to = []
-                    self.pieces[(row, col)] = self.selected_piece
                     self.selected_piece = None
-                    self.turn = WHITE_PIECE if self.turn == BLACK_PIECE else BLACK_PIECE
                 else:
                     self.selected_piece = None
                     self.piece_can_move_to = []
@@ -129,19 +271,221 @@ class GameLogic:
                     if self.selected_piece.color != self.turn:
                         self.selected_piece = None
                         return
-                    self.piece_can_move_to = self.selected_piece.get_valid_moves(
-                        self.piece_position, (row, col), self.piece_alignment
-                    )
+                    self.piece_can_move_to = self._get_valid_moves(self.selected_piece)
                     # print(f"piece can move to: {self.piece_can_move_to}")
 
+    def _move_piece(self, piece, row, col):
+        """Moves a piece to (row, col), capturing whatever is there
+
+        Everything needed to take the move back is pushed onto the undo stack: the piece,
+        the square it came from, the captured piece, the turn, the game over flags and the
+        length of the game history before the move. Returns the captured piece, if any.
+        """
+        from_position = piece.position
+        captured = self.pieces.get((row, col), None)
+        self.undo_stack.append(
+            (
+                piece,
+                from_position,
+                captured,
+                self.turn,
+                self.game_over,
+                self.winner,
+                len(self.game_history),
+            )
+        )
+        self.game_history.append(
+            f'{"w" if self.turn == WHITE_PIECE else "b"}{piece.hash}={from_position}->{row, col}'
+        )
+
+        self._invalidate_moves(from_position, (row, col))
+        self._update_hash_key(piece, from_position, (row, col), captured)
+        del self.pieces[(from_position[0], from_position[1])]
+        if captured is not None:
+            if self.pieces_by_id and self.pieces_by_id[captured.id] is captured:
+                self.pieces_by_id[captured.id] = None
+            if captured.is_king:
+                self.game_over = True
+                self.winner = "White" if piece.color == WHITE_PIECE else "Black"
+                self.game_history.append(f"\n{self.winner} wins\n")
+        self.piece_position[from_position] = 0
+        self.piece_position[row, col] = piece.hash
+        self.piece_alignment[from_position] = 0
+        self.piece_alignment[row, col] = piece.color
+        piece.position = (row, col)
+        self.pieces[(row, col)] = piece
+        self.turn = WHITE_PIECE if self.turn == BLACK_PIECE else BLACK_PIECE
+        return captured
+
+    def get_piece_by_id(self, piece_id):
+        """Returns the piece with the given id, or None if it isn't on the board"""
+        piece = None
+        if 0 <= piece_id < len(self.pieces_by_id):
+            piece = self.pieces_by_id[piece_id]
+            if piece is not None and self.pieces.get(piece.position) is piece:
+                return piece
+        if piece is None and self._index_version == self._state_version:
+            # Captured, or never on the board
+            return None
+
+        # The index is rebuilt if the pieces were changed without going through the moves,
+        # like when the pieces dictionary is set up by hand
+        self._index_pieces()
+        if 0 <= piece_id < len(self.pieces_by_id):
+            return self.pieces_by_id[piece_id]
+        return None
+
+    def _index_pieces(self):
+        """Rebuilds the id index of the pieces from the pieces dictionary"""
+        pieces = [
+            piece
+            for piece in self.pieces.values()
+            if isinstance(piece.id, (int, np.integer)) and piece.id >= 0
+        ]
+        self.pieces_by_id = [None] * (max((p.id for p in pieces), default=-1) + 1)
+        for piece in pieces:
+            self.pieces_by_id[piece.id] = piece
+        self._index_version = self._state_version
+
+    def push_action(self, action):
+        """Applies the action in place so it can be taken back with pop_action
+
+        Unlike apply_action, an illegal action raises a ValueError instead of being
+        ignored, so every push can be matched with a pop during a search."""
+        piece_id = action // (self.rows * self.cols)
+        square = action % (self.rows * self.cols)
+        row = square // self.rows
+        col = square % self.cols
+        piece = self.get_piece_by_id(piece_id)
+        if (
+            piece is None
+            or piece.color != self.turn
+            or (row, col) not in self._get_valid_moves(piece)
+        ):
+            raise ValueError(f"Illegal action: {action}")
+        self._move_piece(piece, row, col)
+
+    def pop_action(self):
+        """Takes back the last move, whether it came from push_action, apply_action or
+        handle_press, and returns its action. Raises an IndexError if there is no move
+        to take back."""
+        (
+            piece,
+            from_position,
+            captured,
+            turn,
+            game_over,
+            winner,
+            history_length,
+        ) = self.undo_stack.pop()
+        to_position = piece.position
+
+        self._invalidate_moves(from_position, to_position)
+        self._update_hash_key(piece, from_position, to_position, captured)
+        del self.pieces[to_position]
+        if captured is not None:
+            if self.pieces_by_id and captured.id < len(self.pieces_by_id):
+                self.pieces_by_id[captured.id] = captured
+            self.pieces[to_position] = captured
+            self.piece_position[to_position] = captured.hash
+            self.piece_alignment[to_position] = captured.color
+        else:
+            self.piece_position[to_position] = 0
+            self.piece_alignment[to_position] = 0
+        self.piece_position[from_position] = piece.hash
+        self.piece_alignment[from_position] = piece.color
+        piece.position = from_position
+        self.pieces[(from_position[0], from_position[1])] = piece
+
+        self.turn = turn
+        self.game_over = game_over
+        self.winner = winner
+        del self.game_history[history_length:]
+        self.selected_piece = None
+        self.piece_can_move_to = []
+        return (
+            piece.id * (self.rows * self.cols)
+            + to_position[0] * self.rows
+            + to_position[1]
+        )
+
+    @property
+    def hash_key(self):
+        """64 bit Zobrist key of the position, including the side to move
+
+        It's kept up to date as moves are made and taken back, and computed from the board
+        arrays the first time it's asked for or after invalidate_move_cache."""
+        if self._hash_key is None:
+            self._hash_key = compute_hash_key(
+                self.piece_position, self.piece_alignment, self.turn
+            )
+        return self._hash_key
+
+    def _update_hash_key(self, piece, from_position, to_position, captured):
+        """XORs a move in or out of the hash key, which is the same in both directions"""
+        if self._hash_key is None:
+            return
+        key = self._hash_key ^ SIDE_TO_MOVE_KEY
+        key ^= zobrist_key(piece.hash, piece.color, *from_position)
+        key ^= zobrist_key(piece.hash, piece.color, *to_position)
+        if captured is not None:
+            key ^= zobrist_key(captured.hash, captured.color, *to_position)
+        self._hash_key = key
+
+    def _get_valid_moves(self, piece):
+        """Returns the valid moves of a piece, only generating them if they aren't cached"""
+        position = (piece.position[0], piece.position[1])
+        cached = self._move_cache.get(position)
+        if cached is not None and cached[0] == piece.hash and cached[1] == piece.color:
+            return cached[2]
+
+        valid_moves = piece.get_valid_moves(
+            self.piece_position, position, self.piece_alignment
+        )
+        self._move_cache[position] = (
+            piece.hash,
+            piece.color,
+            valid_moves,
+            piece.get_reach(position, self.rows, self.cols),
+        )
+        return valid_moves
+
+    def _invalidate_moves(self, from_position, to_position):
+        """Drops the cached moves that a piece moving between two squares can change
+
+        Only the pieces on those two squares and the pieces whose rays or jump targets
+        touch either of them are affected, everything else stays cached. The moves keep
+        the id index up to date themselves, so it stays current if it was.
+        """
+        from_position = (from_position[0], from_position[1])
+        to_position = (to_position[0], to_position[1])
+        if self._index_version == self._state_version:
+            self._index_version += 1
+        self._state_version += 1
+        stale = [
+            position
+            for position, (_, _, _, reach) in self._move_cache.items()
+            if position == from_position
+            or position == to_position
+            or from_position in reach
+            or to_position in reach
+        ]
+        for position in stale:
+            del self._move_cache[position]
+
+    def invalidate_move_cache(self):
+        """Clears the cached moves and the hash key, needed after editing the board arrays
+        or pieces directly"""
+        self._move_cache = {}
+        self._state_version += 1
+        self._hash_key = None
+
     def get_all_possible_moves(self):
         """Returns all possible moves for the current player"""
         moves = []
         for piece in self.pieces.values():
             if piece.color == self.turn:
-                valid_moves = piece.get_valid_moves(
-                    self.piece_position, piece.position, self.piece_alignment
-                )
+                valid_moves = self._get_valid_moves(piece)
                 piece_valid_moves = [
                     f'{"w" if piece.color == WHITE_PIECE else "b"}{piece.hash}={piece.position}->{move}'
                     for move in valid_moves
@@ -150,13 +494,17 @@ class GameLogic:
         return moves
 
     def get_all_possible_moves_action_space(self):
-        """Returns all possible moves for the current player"""
+        """Returns all possible moves for the current player
+
+        The result is memoized for the current state, so asking for the legal actions of
+        the same state again doesn't generate anything."""
+        if self._legal_actions[0] == (self._state_version, self.turn):
+            return list(self._legal_actions[1])
+
         moves = []
         for piece in self.pieces.values():
             if piece.color == self.turn:
-                valid_moves = piece.get_valid_moves(
-                    self.piece_position, piece.position, self.piece_alignment
-                )
+                valid_moves = self._get_valid_moves(piece)
 
                 move_ids = [
                     piece.id * (self.rows * self.cols) + move[0] * self.rows + move[1]
@@ -165,8 +513,101 @@ class GameLogic:
                 moves.extend(move_ids)
         moves.sort()
 
-        print(moves)
-        return moves
+        self._legal_actions = ((self._state_version, self.turn), moves)
+        return list(moves)
+
+    def get_piece_ids(self):
+        """Returns a rows x cols array with the id of the piece on each square, -1 if empty"""
+        piece_ids = np.full((self.rows, self.cols), -1, dtype=np.int64)
+        for position, piece in self.pieces.items():
+            piece_ids[position] = piece.id
+        return piece_ids
+
+    def get_legal_actions_masks(
+        self,
+        piece_positions,
+        piece_alignments,
+        turns,
+        piece_ids,
+        num_distinct_actions=None,
+    ):
+        """Returns an N x num_distinct_actions boolean mask of the legal actions of N positions
+
+        The positions are given as stacked piece_position, piece_alignment and piece id
+        arrays (see get_piece_ids) of shape N x rows x cols, alongside the color to move in
+        each of them. The movement of each piece is looked up from the pieces of this game.
+
+        Instead of generating the moves of every position one at a time, the states are
+        grouped by piece id and square, so the occupancy checks for a piece's targets are
+        done for all the states it sits on that square in at once.
+        """
+        piece_positions = np.asarray(piece_positions)
+        piece_alignments = np.asarray(piece_alignments)
+        piece_ids = np.asarray(piece_ids)
+        turns = np.asarray(turns)
+        num_states = piece_positions.shape[0]
+        board_size = self.rows * self.cols
+        if num_distinct_actions is None:
+            num_distinct_actions = (int(piece_ids.max(initial=-1)) + 1) * board_size
+
+        masks = np.zeros((num_states, num_distinct_actions), dtype=bool)
+        flat_positions = piece_positions.reshape(num_states, board_size)
+        flat_alignments = piece_alignments.reshape(num_states, board_size)
+        piece_types = self._get_piece_types()
+
+        states, rows, cols = np.nonzero(piece_ids >= 0)
+        colors = piece_alignments[states, rows, cols]
+        to_move = colors == turns[states]
+        states, rows, cols, colors = (
+            states[to_move],
+            rows[to_move],
+            cols[to_move],
+            colors[to_move],
+        )
+        ids = piece_ids[states, rows, cols]
+        hashes = piece_positions[states, rows, cols]
+
+        # Every distinct (piece id, square) is handled once for all the states it appears in
+        groups = {}
+        for i, key in enumerate(zip(ids.tolist(), rows.tolist(), cols.tolist())):
+            groups.setdefault(key, []).append(i)
+
+        for (piece_id, row, col), indices in groups.items():
+            first = indices[0]
+            piece = piece_types[(int(hashes[first]), colors[first])]
+            color = colors[first]
+            group_states = states[indices]
+            positions = flat_positions[group_states]
+            alignments = flat_alignments[group_states]
+            table = piece.get_move_tables(self.rows, self.cols)[(row, col)]
+            offset = piece_id * board_size
+
+            if piece.phased_movement:
+                if not table:
+                    continue
+                squares = [r * self.cols + c for r, c in table]
+                actions = [offset + r * self.rows + c for r, c in table]
+                can_move = (positions[:, squares] == 0) | (
+                    alignments[:, squares] != color
+                )
+                masks[group_states[:, None], actions] = can_move
+            else:
+                for ray in table:
+                    blocked = np.zeros(len(group_states), dtype=bool)
+                    for r, c in ray:
+                        occupied = positions[:, r * self.cols + c] != 0
+                        can_move = ~blocked & (
+                            ~occupied | (alignments[:, r * self.cols + c] != color)
+                        )
+                        masks[group_states, offset + r * self.rows + c] = can_move
+                        blocked |= occupied
+        return masks
+
+    def _get_piece_types(self):
+        """Returns the piece used for the movement of every (piece hash, color) in the game"""
+        for piece in self.pieces.values():
+            self.piece_types.setdefault((piece.hash, piece.color), piece)
+        return self.piece_types
 
     def apply_action(self, action):
         """Applies the action to the board"""
@@ -174,11 +615,7 @@ class GameLogic:
         action = action % (self.rows * self.cols)
         row = action // self.rows
         col = action % self.cols
-        piece = None
-        for p in self.pieces.values():
-            if p.id == piece_id:
-                piece = p
-                break
+        piece = self.get_piece_by_id(piece_id)
         if piece is not None:
             self.handle_press(piece.position[0], piece.position[1])
             self.handle_press(row, col)
@@ -189,17 +626,14 @@ class GameLogic:
         action = action % (self.rows * self.cols)
         row = action // self.rows
         col = action % self.cols
-
-        for p in self.pieces.values():
-            if p.id == piece_id:
-                piece = p
-                break
+        piece = self.get_piece_by_id(piece_id)
 
         return f"{'w' if piece.color == WHITE_PIECE else 'b'}{piece.hash}={piece.position}->{(row, col)}"
 
     def get_pieces_from_hash(self, piece_dictionary):
         """Gets the pieces from the hashes stored in the pickle file"""
         self.pieces = {}
+        self.invalidate_move_cache()
 
         with open(os.path.join(os.getcwd(), "pieces.pkl"), "rb") as f:
             hash_to_piece = pickle.load(f)
@@ -212,13 +646,16 @@ class GameLogic:
                     hash_to_piece[self.piece_position[r][c]]
                 ].copy()
                 self.pieces[(r, c)].position = (r, c)
+                # Black pieces see the movement matrix rotated by 180 degrees since the board
+                # is flipped for them, the piece type keeps both orientations
                 self.pieces[(r, c)].color = self.piece_alignment[r][c]
-                # When a piece is black, we rotate the movement matrix by 180 degrees to account for the fact that the board is flipped
-                if self.pieces[(r, c)].color == BLACK_PIECE:
-                    self.pieces[(r, c)].movement = np.rot90(
-                        self.pieces[(r, c)].movement, 2
-                    )
                 self.pieces[(r, c)].id = i
+                self.piece_types.setdefault(
+                    (self.pieces[(r, c)].hash, self.pieces[(r, c)].color),
+                    self.pieces[(r, c)],
+                )
+
+        self._index_pieces()
 
         # Turning the king pieces into kings
 
@@ -233,24 +670,129 @@ class GameLogic:
         """Returns the board as a string"""
         return f"{self.piece_position}\n{self.piece_alignment}"
 
+    def get_piece_letters(self):
+        """Returns the letter the notation writes every piece hash of the game as"""
+        piece_types = self._get_piece_types()
+        if self._piece_letters[0] != len(piece_types):
+            self._piece_letters = (
+                len(piece_types),
+                piece_letters(piece_hash for piece_hash, _ in piece_types),
+            )
+        return self._piece_letters[1]
+
+    def fen_legend(self):
+        """Returns the piece hash of every letter of the notation, like a=492 b=706"""
+        return legend(self.get_piece_letters())
+
+    def to_fen(self):
+        """Returns the position in the FEN-like notation of Logic/notation.py, like
+        k2r/4/4/R2K+ w"""
+        return write_fen(
+            (
+                (row, col, piece.hash, piece.color, piece.is_king)
+                for (row, col), piece in self.pieces.items()
+            ),
+            self.rows,
+            self.cols,
+            self.turn,
+            self.get_piece_letters(),
+        )
+
+    def from_fen(self, fen):
+        """Sets up the position written by to_fen, with the pieces this game knows about
+
+        The pieces get new ids, in the order of their squares, so the actions of the
+        position can differ from the ones of the game it was written from. The history
+        and the undo stack start over."""
+        rows, cols, turn, pieces = read_fen(fen, self.get_piece_letters())
+        if (rows, cols) != (self.rows, self.cols):
+            raise ValueError(
+                f"{fen!r} is a {rows}x{cols} board, not {self.rows}x{self.cols}"
+            )
+        type_ids = {
+            piece.hash: piece.type_id for piece in self._get_piece_types().values()
+        }
+
+        self.pieces = {}
+        self.piece_position = np.zeros((rows, cols))
+        self.piece_alignment = np.zeros((rows, cols))
+        for piece_id, (row, col, piece_hash, color, is_king) in enumerate(pieces):
+            self.pieces[(row, col)] = GamePiece.from_type(
+                type_ids[piece_hash], (row, col), color, piece_id, is_king
+            )
+            self.piece_position[row, col] = piece_hash
+            self.piece_alignment[row, col] = color
+        self.kings = [(row, col) for row, col, _, _, is_king in pieces if is_king]
+        self.turn = turn
+        self.game_history = []
+        self.undo_stack = []
+        self.selected_piece = None
+        self.piece_can_move_to = set()
+
+        # A side that lost its king has lost the game
+        king_colors = {color for _, _, _, color, is_king in pieces if is_king}
+        self.game_over = len(king_colors) == 1
+        self.winner = None
+        if self.game_over:
+            self.winner = "White" if WHITE_PIECE in king_colors else "Black"
+
+        self.invalidate_move_cache()
+        self._index_pieces()
+        return self
+
+    def action_to_move(self, action):
+        """Writes the action down in the notation, like a1a2"""
+        piece_id = action // (self.rows * self.cols)
+        action = action % (self.rows * self.cols)
+        piece = self.get_piece_by_id(piece_id)
+        return move_name(
+            piece.position, (action // self.rows, action % self.cols), self.rows
+        )
+
+    def move_to_action(self, move):
+        """Returns the action of a move written like a1a2, or None if it can't be read or
+        isn't legal"""
+        squares = parse_move(move, self.rows, self.cols)
+        if squares is None:
+            return None
+        return move_action(self, squares)
+
     def clone(self):
         """Clones the current game state"""
         clone = GameLogic(rows=self.rows, cols=self.cols)
         clone.piece_position = self.piece_position.copy()
         clone.piece_alignment = self.piece_alignment.copy()
-        clone.pieces = {k: v.copy() for k, v in self.pieces.items()}
-        for k, v in clone.pieces.items():
-            v.position = k
-            v.color = clone.piece_alignment[k[0]][k[1]]
-            if v.color == BLACK_PIECE:
-                v.movement = np.rot90(v.movement, 2)
-            v.id = self.pieces[k].id
-            v.is_king = self.pieces[k].is_king
+        # The pieces only hold their square, color, id and type, so they're cheap to recreate
+        clone.pieces = {
+            k: GamePiece.from_type(v.type_id, k, v.color, v.id, v.is_king)
+            for k, v in self.pieces.items()
+        }
         clone.selected_piece = self.selected_piece
         clone.piece_can_move_to = self.piece_can_move_to.copy()
         clone.turn = WHITE_PIECE if self.turn == WHITE_PIECE else BLACK_PIECE
         clone.game_history = self.game_history.copy()
         clone.game_over = True if self.game_over else False
-        clone.winner = "White" if self.winner == "White" else "Black"
+        clone.winner = self.winner
         clone.name = self.name
+        clone.initial_piece_position = self.initial_piece_position
+        clone.initial_piece_alignment = self.initial_piece_alignment
+        clone.ai_player = self.ai_player
+        clone.move_time = self.move_time
+        clone.tablebase = self.tablebase
+        clone.book = self.book
+        clone.past_games = self.past_games
+        clone.past_games_budget = self.past_games_budget
+        # The engine keeps its transposition table between the searches of both games
+        clone.engine = self.engine
+        clone.piece_types = self.piece_types
+        clone._piece_letters = self._piece_letters
+        clone.llm_deadline = self.llm_deadline
+        clone.hedge_history = self.hedge_history
+        clone._move_cache = self._move_cache.copy()
+        clone._state_version = self._state_version
+        clone._legal_actions = self._legal_actions
+        clone._hash_key = self._hash_key
+        # The undo stack refers to the pieces of this game, so the clone starts without one
+        clone.undo_stack = []
+        clone._index_pieces()
         return clone
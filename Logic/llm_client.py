@@ -0,0 +1,201 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+
+DEFAULT_DIRECTORY = os.path.join(os.getcwd(), "LLMCache")
+
+# Seconds a single request may take before it's given up on
+DEFAULT_TIMEOUT = 20.0
+
+# Requests sent to the model at the same time
+DEFAULT_CONCURRENCY = 4
+
+# Extra attempts after a request fails, times out or gets a reply that isn't valid
+DEFAULT_RETRIES = 2
+
+# Seconds waited before the first retry, doubled for every one after it
+DEFAULT_BACKOFF = 0.5
+
+
+def model_name(model):
+    """Returns the name the replies of a model are cached under"""
+    return str(getattr(model, "model_name", None) or type(model).__name__)
+
+
+def prompt_key(model, prompt):
+    """Returns the hash the reply of the model to the prompt is cached under"""
+    digest = hashlib.sha256()
+    digest.update(model_name(model).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """The replies of the language model kept on disk, one file per prompt
+
+    The files are named after prompt_key, so the prompt and model don't need to be
+    stored, and are written to a temporary file first so that games running at the same
+    time never read half a reply."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or DEFAULT_DIRECTORY
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".txt")
+
+    def get(self, key):
+        """Returns the cached reply, or None if there isn't one"""
+        try:
+            with open(self.path(key), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, reply):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{id(reply)}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(reply)
+        os.replace(temporary, path)
+
+
+class LLMMoveClient:
+    """Asks a language model for moves with a timeout, retries and a cache on disk
+
+    `model` is anything with an async `apredict(prompt)` or a blocking `predict(prompt)`,
+    like langchain's ChatOpenAI, or a stand-in model answering locally. At most
+    `max_concurrency` requests are sent at the same time, each one given up on after
+    `timeout` seconds and tried again up to `retries` times. The limit holds over every
+    thread asking for moves, since all the requests are sent from a single event loop
+    the client runs on a thread of its own.
+
+    Replies are cached by the hash of the model name and prompt, and the prompt already
+    holds the position, the history and the legal moves, so a position seen before is
+    answered without asking the model. Only replies accepted by `validate` are cached, a
+    move that can't be read is asked for again next time.
+
+    `stats` counts the cache hits, the requests sent to the model, the failed attempts
+    and the seconds spent waiting on the model.
+    """
+
+    def __init__(
+        self,
+        model,
+        cache=None,
+        timeout=DEFAULT_TIMEOUT,
+        max_concurrency=DEFAULT_CONCURRENCY,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+    ):
+        self.model = model
+        self.cache = cache if cache is not None else ResponseCache()
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = {"hits": 0, "requests": 0, "failures": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+        self._loop = None
+        # Created on the client's loop, which is the only one that ever uses it
+        self._semaphore = None
+
+    def _get_loop(self):
+        """Returns the event loop all the requests are sent from, started on its own
+        thread the first time it's needed"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    async def _ask(self, prompt):
+        if hasattr(self.model, "apredict"):
+            request = self.model.apredict(prompt)
+        else:
+            request = asyncio.to_thread(self.model.predict, prompt)
+        return await asyncio.wait_for(request, self.timeout)
+
+    async def apredict(self, prompt, validate=None):
+        """Returns the reply to the prompt, from the cache if it was asked before
+
+        Raises the error of the last attempt if none of them got a reply. If every reply
+        was rejected by validate, the last one is returned without being cached."""
+        loop = self._get_loop()
+        request = self._apredict(prompt, validate)
+        if asyncio.get_running_loop() is loop:
+            return await request
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(request, loop)
+        )
+
+    async def _apredict(self, prompt, validate):
+        key = prompt_key(self.model, prompt)
+        reply = self.cache.get(key)
+        if reply is not None:
+            self._count("hits")
+            return reply
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        error = None
+        reply = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    self._count("requests")
+                    reply = await self._ask(prompt)
+            except Exception as e:
+                error = e
+                self._count("failures")
+                continue
+            finally:
+                self._count("seconds", time.perf_counter() - start)
+            if validate is None or validate(reply):
+                self.cache.put(key, reply)
+                return reply
+            self._count("failures")
+        if reply is None:
+            raise error
+        return reply
+
+    async def apredict_many(self, prompts, validate=None):
+        """Returns the replies to all the prompts, asked concurrently"""
+        return await asyncio.gather(
+            *(self.apredict(prompt, validate) for prompt in prompts)
+        )
+
+    def predict(self, prompt, validate=None):
+        """Blocking version of apredict, for code that isn't running an event loop
+
+        Returns None if no reply came in the time every attempt and the waits between
+        them may take, so a request stuck on the client's loop can't block the caller.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._apredict(prompt, validate), self._get_loop()
+        )
+        try:
+            return future.result(timeout=self.total_timeout())
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return None
+
+    def total_timeout(self):
+        """Returns the seconds all the attempts at a request may take, with the backoff
+        between them, or None if a request has no timeout"""
+        if self.timeout is None:
+            return None
+        backoff = sum(self.backoff * 2**attempt for attempt in range(self.retries))
+        return self.timeout * (self.retries + 1) + backoff
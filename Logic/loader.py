@@ -0,0 +1,51 @@
+import numpy as np
+import os
+
+from Logic.piece import GamePiece
+from Logic.game import GameLogic
+
+
+def load_pieces(directory=None):
+    """Loads every piece in the Pieces folder into a dictionary keyed by piece name
+
+    This is the same as GameScreen.get_all_pieces but doesn't need pygame to be running,
+    so the tools working on the saved games can use it.
+    """
+    directory = directory or os.path.join(os.getcwd(), "Pieces")
+    piece_dictionary = {}
+    for piece in sorted(os.listdir(directory)):
+        if not piece.endswith(".npz"):
+            continue
+        data = np.load(os.path.join(directory, piece))
+        cur_piece = GamePiece(
+            data["drawing"],
+            np.transpose(data["movement"]),  # The drawn movement is stored transposed
+            piece[:-4],
+            True if data["type_movement"][0] == 1 else False,
+        )
+        piece_dictionary[cur_piece.name] = cur_piece
+    return piece_dictionary
+
+
+def list_boards(directory=None):
+    """Returns the file names of all the saved boards"""
+    directory = directory or os.path.join(os.getcwd(), "Boards")
+    return sorted(board for board in os.listdir(directory) if board.endswith(".npz"))
+
+
+def load_board(name, piece_dictionary=None, directory=None):
+    """Loads a saved board into a GameLogic ready to be played, the same way
+    GameScreen.reset sets up a new game"""
+    piece_dictionary = piece_dictionary or load_pieces()
+    directory = directory or os.path.join(os.getcwd(), "Boards")
+    data = np.load(os.path.join(directory, name))
+    rows, cols = data["row_col"]
+    game = GameLogic(rows=int(rows), cols=int(cols))
+    game.kings = [(king[0], king[1]) for king in data["kings"]]
+    game.piece_alignment = data["piece_alignment"].copy()
+    game.initial_piece_alignment = game.piece_alignment.copy()
+    game.piece_position = data["piece_position"].copy()
+    game.initial_piece_position = game.piece_position.copy()
+    game.get_pieces_from_hash(piece_dictionary)
+    game.name = name
+    return game
@@ -0,0 +1,132 @@
+"""
+A FEN-like text notation for the positions and moves of any board.
+
+The position is written rank by rank from row 0 down, ranks separated by "/", followed
+by the side to move:
+
+    k2r/4/4/R2K+ w
+
+Every piece is a letter standing for its piece hash, uppercase for white and lowercase for
+black, followed by a "+" if it's a king. The letters are handed out in the order of the
+piece hashes of the board, so they're only meaningful alongside the board's legend, like
+"a=492 b=706". Runs of empty squares are written as their length, which can take more
+than one digit on wide boards.
+
+Squares are named like in chess, a column letter and a rank counted from the bottom row,
+and a move is the square it starts from followed by the square it ends on, like a1a2.
+"""
+
+import re
+
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+KING_MARK = "+"
+
+FEN_PIECE = re.compile(r"(\d+)|([a-zA-Z])(\+?)")
+
+# The separators are there so a move can still be read when the language model writes
+# it a little differently, like a1-a2 or a1->a2
+MOVE_NOTATION = re.compile(r"\b([a-z])(\d{1,2})\s*(?:-|->|x)?\s*([a-z])(\d{1,2})\b")
+
+
+def piece_letters(piece_hashes):
+    """Returns the letter of every piece hash of a board"""
+    piece_hashes = sorted({int(piece_hash) for piece_hash in piece_hashes})
+    if len(piece_hashes) > len(LETTERS):
+        raise ValueError(
+            f"A board with {len(piece_hashes)} kinds of pieces can't be written down"
+        )
+    return dict(zip(piece_hashes, LETTERS))
+
+
+def legend(letters):
+    """Returns the piece hash of every letter, like a=492 b=706"""
+    return " ".join(f"{letter}={piece_hash}" for piece_hash, letter in letters.items())
+
+
+def square_name(row, col, rows):
+    return f"{LETTERS[col]}{rows - row}"
+
+
+def parse_square(name, rows):
+    """Returns the (row, col) of a square name like a1"""
+    return rows - int(name[1:]), LETTERS.index(name[0])
+
+
+def move_name(start, end, rows):
+    """Writes down the move between two (row, col) squares"""
+    return square_name(*start, rows) + square_name(*end, rows)
+
+
+def parse_move(text, rows, cols):
+    """Returns the (from square, to square) of the first move written in the text that
+    fits on the board, or None if there isn't one"""
+    for col1, rank1, col2, rank2 in MOVE_NOTATION.findall(text):
+        start = parse_square(col1 + rank1, rows)
+        end = parse_square(col2 + rank2, rows)
+        if all(0 <= row < rows and 0 <= col < cols for row, col in (start, end)):
+            return start, end
+    return None
+
+
+def write_fen(pieces, rows, cols, turn, letters):
+    """Writes down the position of the pieces, given as (row, col, piece hash, color,
+    is_king) tuples"""
+    board = [[None] * cols for _ in range(rows)]
+    for row, col, piece_hash, color, is_king in pieces:
+        letter = letters[int(piece_hash)]
+        board[row][col] = (letter.upper() if color == WHITE_PIECE else letter) + (
+            KING_MARK if is_king else ""
+        )
+
+    ranks = []
+    for rank in board:
+        text = []
+        empty = 0
+        for square in rank:
+            if square is None:
+                empty += 1
+                continue
+            if empty:
+                text.append(str(empty))
+                empty = 0
+            text.append(square)
+        if empty:
+            text.append(str(empty))
+        ranks.append("".join(text))
+    return "/".join(ranks) + (" w" if turn == WHITE_PIECE else " b")
+
+
+def read_fen(fen, letters):
+    """Returns the rows, cols, side to move and the (row, col, piece hash, color, is_king)
+    pieces of a position. Raises a ValueError if it isn't written correctly."""
+    placement, _, turn = fen.strip().partition(" ")
+    if turn not in ("w", "b"):
+        raise ValueError(f"Unknown side to move in {fen!r}")
+    piece_hashes = {letter: piece_hash for piece_hash, letter in letters.items()}
+
+    pieces = []
+    cols = None
+    ranks = placement.split("/")
+    for row, rank in enumerate(ranks):
+        col = 0
+        position = 0
+        for match in FEN_PIECE.finditer(rank):
+            if match.start() != position:
+                raise ValueError(f"Can't read rank {rank!r} of {fen!r}")
+            position = match.end()
+            empty, letter, king = match.groups()
+            if empty:
+                col += int(empty)
+                continue
+            if letter.lower() not in piece_hashes:
+                raise ValueError(f"Unknown piece {letter!r} in {fen!r}")
+            color = WHITE_PIECE if letter.isupper() else BLACK_PIECE
+            pieces.append((row, col, piece_hashes[letter.lower()], color, bool(king)))
+            col += 1
+        if position != len(rank) or (cols is not None and col != cols):
+            raise ValueError(f"Can't read rank {rank!r} of {fen!r}")
+        cols = col
+    return len(ranks), cols, WHITE_PIECE if turn == "w" else BLACK_PIECE, pieces
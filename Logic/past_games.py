@@ -0,0 +1,124 @@
+import collections
+import os
+
+from Logic.book import move_action, read_history
+from Logic.notation import move_name
+from UI.board_create_screen import WHITE_PIECE
+
+# Tokens of the prompt given to the past games
+DEFAULT_TOKEN_BUDGET = 800
+
+# Games sharing this many of the last moves of the current game are close enough to show
+RECENT_MOVES = 2
+
+# Rough number of characters in a token, the moves are short runs of letters and digits
+CHARACTERS_PER_TOKEN = 3
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens of a text without needing the model's tokenizer"""
+    return -(-len(text) // CHARACTERS_PER_TOKEN)
+
+
+def game_text(moves, winner, rows):
+    """Writes a game down on one line in the notation of Logic/notation.py, followed by
+    its result"""
+    text = " ".join(move_name(start, end, rows) for _, _, start, end in moves)
+    if winner is not None:
+        text += f' {"White" if winner == WHITE_PIECE else "Black"} wins'
+    return text
+
+
+def _recent_key(moves):
+    return tuple((color, start, end) for color, _, start, end in moves)
+
+
+class PastGamesIndex:
+    """The past games of a board, indexed by the positions and move sequences in them
+
+    Instead of putting every game ever played in the prompt, select only picks the games
+    that went through the current position, then the ones that played the same last
+    RECENT_MOVES moves, and stops once the token budget is used up. Looking the games up
+    only touches the matching ones, so neither the time it takes nor the size of the
+    prompt grows with the number of games saved.
+    """
+
+    def __init__(self):
+        self.texts = []
+        self.tokens = []
+        # Games going through a position, keyed by GameLogic.hash_key, and games with a
+        # sequence of RECENT_MOVES moves, newest games last
+        self.positions = collections.defaultdict(list)
+        self.sequences = collections.defaultdict(list)
+
+    @classmethod
+    def build(cls, game, games):
+        """Indexes the (moves, winner) games, replayed from the current position of the
+        game. Games that can't be replayed, because they were played on another version of
+        the board, are only indexed by their moves."""
+        index = cls()
+        for moves, winner in games:
+            index.add(game, moves, winner)
+        return index
+
+    @classmethod
+    def load(cls, game, name, directory=None):
+        """Indexes the games saved in Histories/ for the board"""
+        directory = directory or os.path.join(os.getcwd(), "Histories")
+        path = os.path.join(directory, f"{name}.txt")
+        return cls.build(game, read_history(path) if os.path.exists(path) else [])
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, game, moves, winner):
+        """Adds a game, replayed from the current position of the game"""
+        game_id = len(self.texts)
+        text = game_text(moves, winner, game.rows)
+        self.texts.append(text)
+        self.tokens.append(estimate_tokens(text))
+
+        replay = game.clone()
+        keys = set()
+        for color, _, start, end in moves:
+            action = move_action(replay, (start, end)) if color == replay.turn else None
+            if action is None:
+                break
+            keys.add(replay.hash_key)
+            replay.push_action(action)
+        for key in keys:
+            self.positions[key].append(game_id)
+
+        sequences = {
+            _recent_key(moves[i - RECENT_MOVES : i])
+            for i in range(RECENT_MOVES, len(moves) + 1)
+        }
+        for sequence in sequences:
+            self.sequences[sequence].append(game_id)
+
+    def matches(self, game, recent_moves):
+        """Returns the ids of the games through the game's position, then of the games
+        sharing its recent (color, piece hash, from square, to square) moves, newest first
+        """
+        matches = list(reversed(self.positions.get(game.hash_key, [])))
+        if len(recent_moves) >= RECENT_MOVES:
+            seen = set(matches)
+            sequence = _recent_key(recent_moves[-RECENT_MOVES:])
+            matches.extend(
+                game_id
+                for game_id in reversed(self.sequences.get(sequence, []))
+                if game_id not in seen
+            )
+        return matches
+
+    def select(self, game, recent_moves, token_budget=DEFAULT_TOKEN_BUDGET):
+        """Returns the text of the closest games to the current one that fit in the
+        token budget"""
+        selected = []
+        for game_id in self.matches(game, recent_moves):
+            if self.tokens[game_id] <= token_budget:
+                selected.append(self.texts[game_id])
+                token_budget -= self.tokens[game_id]
+            if token_budget <= 0:
+                break
+        return "\n".join(selected)
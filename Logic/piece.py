@@ -7,9 +7,227 @@ import math
 import hashlib
 
 from UI.piece_draw_screen import TOTAL_EXPECTED_PIECES, WALK, BLACK, WHITE
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+
+# The movement matrices are 15x15 with the piece sitting in the middle, so a piece can
+# reach at most 7 squares away from itself in any direction
+MOVEMENT_CENTER = 7
+
+DIRECTIONS = [
+    (1, 0),
+    (-1, 0),
+    (0, 1),
+    (0, -1),
+    (1, 1),
+    (-1, -1),
+    (-1, 1),
+    (1, -1),
+]
+
+# Phased pieces with at least this many targets from a square check them all at once
+# with numpy, below it looping over the compiled targets is faster
+VECTORIZED_MIN_TARGETS = 32
+
+
+def movement_window(movement, position, rows, cols):
+    """Returns a rows x cols boolean array of the squares the movement matrix marks
+
+    The movement matrix is centered on `position` and cropped to the board, so this works
+    for any board size, including boards where the window is larger than 8x8.
+    """
+    r, c = position
+    top, left = max(0, r - MOVEMENT_CENTER), max(0, c - MOVEMENT_CENTER)
+    bottom = min(rows, r + MOVEMENT_CENTER + 1)
+    right = min(cols, c + MOVEMENT_CENTER + 1)
+    window = np.zeros((rows, cols), dtype=bool)
+    window[top:bottom, left:right] = (
+        movement[
+            MOVEMENT_CENTER + top - r : MOVEMENT_CENTER + bottom - r,
+            MOVEMENT_CENTER + left - c : MOVEMENT_CENTER + right - c,
+        ]
+        == WALK
+    )
+    window[r, c] = False
+    return window
+
+
+def compile_move_tables(movement, phased_movement, rows, cols):
+    """Compiles a movement matrix into per-square move tables for a rows x cols board
+
+    For phased pieces each square maps to a tuple of the squares the piece can jump to.
+    For contiguous pieces each square maps to a tuple of rays, where every ray is the
+    ordered tuple of squares the piece can land on in that direction. Squares that the
+    movement matrix doesn't mark are left out of the ray completely, so they neither
+    count as a move nor block the piece, the same as walking the ray square by square.
+    """
+    targets = movement == WALK
+    tables = {}
+    for r in range(rows):
+        for c in range(cols):
+            if phased_movement:
+                targets_row, targets_col = np.nonzero(
+                    movement_window(movement, (r, c), rows, cols)
+                )
+                tables[(r, c)] = tuple(zip(targets_row.tolist(), targets_col.tolist()))
+            else:
+                rays = []
+                for direction in DIRECTIONS:
+                    ray = []
+                    for i in range(1, MOVEMENT_CENTER + 1):
+                        row = r + direction[0] * i
+                        col = c + direction[1] * i
+                        if row < 0 or row > rows - 1 or col < 0 or col > cols - 1:
+                            break  # Out of bounds
+                        if targets[
+                            MOVEMENT_CENTER + direction[0] * i,
+                            MOVEMENT_CENTER + direction[1] * i,
+                        ]:
+                            ray.append((row, col))
+                    if ray:
+                        rays.append(tuple(ray))
+                tables[(r, c)] = tuple(rays)
+    return tables
+
+
+# Every kind of piece registered so far, indexed by type id
+PIECE_TYPES = []
+_PIECE_TYPE_IDS = {}
+
+
+class PieceType:
+    """The data shared by every piece of one kind
+
+    This holds everything that never changes during a game: the drawing, the movement
+    in both orientations (black pieces see the board rotated by 180 degrees), whether the
+    movement is phased and the move tables compiled from it for each board size. The
+    pieces on the board only keep the id of their type.
+    """
+
+    __slots__ = (
+        "type_id",
+        "drawing",
+        "movements",
+        "name",
+        "hash",
+        "phased_movement",
+        "_move_tables",
+        "_move_windows",
+        "_move_reach",
+    )
+
+    def __init__(self, type_id, drawing, movement, name, phased_movement):
+        self.type_id = type_id
+        self.drawing = drawing
+        self.movements = {
+            WHITE_PIECE: movement,
+            BLACK_PIECE: np.rot90(movement, 2),
+        }
+        self.name = name
+        self.hash = (
+            int(hashlib.sha1(self.name.encode()).hexdigest(), 16)
+            % TOTAL_EXPECTED_PIECES
+        )
+        self.phased_movement = phased_movement
+        self._move_tables = {}
+        self._move_windows = {}
+        self._move_reach = {}
+
+    def __reduce__(self):
+        # Unpickling registers the type again, so pieces sent to another process find it
+        return (
+            _unpickle_piece_type,
+            (
+                self.drawing if isinstance(self.drawing, np.ndarray) else None,
+                self.movements[WHITE_PIECE],
+                self.name,
+                self.phased_movement,
+            ),
+        )
+
+    def get_movement(self, color):
+        """Returns the movement matrix as seen by a piece of the given color"""
+        return self.movements[BLACK_PIECE if color == BLACK_PIECE else WHITE_PIECE]
+
+    def get_move_tables(self, rows, cols, color):
+        """Returns the move tables for a rows x cols board, compiling them only once"""
+        orientation = BLACK_PIECE if color == BLACK_PIECE else WHITE_PIECE
+        tables = self._move_tables.get((rows, cols, orientation))
+        if tables is None:
+            tables = compile_move_tables(
+                self.movements[orientation], self.phased_movement, rows, cols
+            )
+            self._move_tables[(rows, cols, orientation)] = tables
+        return tables
+
+    def get_move_windows(self, rows, cols, color):
+        """Returns the movement window of every square for a rows x cols board"""
+        orientation = BLACK_PIECE if color == BLACK_PIECE else WHITE_PIECE
+        windows = self._move_windows.get((rows, cols, orientation))
+        if windows is None:
+            windows = {
+                (r, c): movement_window(self.movements[orientation], (r, c), rows, cols)
+                for r in range(rows)
+                for c in range(cols)
+            }
+            self._move_windows[(rows, cols, orientation)] = windows
+        return windows
+
+    def get_move_reach(self, rows, cols, color):
+        """Returns, for every square, the set of squares whose occupancy can change the
+        moves of a piece standing there. These are all the squares in its move tables.
+        """
+        orientation = BLACK_PIECE if color == BLACK_PIECE else WHITE_PIECE
+        reach = self._move_reach.get((rows, cols, orientation))
+        if reach is None:
+            tables = self.get_move_tables(rows, cols, orientation)
+            if self.phased_movement:
+                reach = {square: frozenset(table) for square, table in tables.items()}
+            else:
+                reach = {
+                    square: frozenset(target for ray in table for target in ray)
+                    for square, table in tables.items()
+                }
+            self._move_reach[(rows, cols, orientation)] = reach
+        return reach
+
+
+def register_piece_type(drawing, movement, name, phased_movement=False):
+    """Returns the id of the piece type, registering it if it hasn't been seen before
+
+    Pieces with the same name, movement and type of movement share one type. Registering
+    one again only updates its drawing, in case the piece was redrawn.
+    """
+    movement = np.asarray(movement)
+    key = (name, bool(phased_movement), movement.shape, movement.tobytes())
+    type_id = _PIECE_TYPE_IDS.get(key)
+    if type_id is None:
+        type_id = len(PIECE_TYPES)
+        PIECE_TYPES.append(
+            PieceType(type_id, drawing, movement, name, bool(phased_movement))
+        )
+        _PIECE_TYPE_IDS[key] = type_id
+    elif drawing is not None:
+        PIECE_TYPES[type_id].drawing = drawing
+    return type_id
+
+
+def _unpickle_piece_type(drawing, movement, name, phased_movement):
+    return PIECE_TYPES[register_piece_type(drawing, movement, name, phased_movement)]
+
+
+def _unpickle_piece(piece_type, position, color, id, is_king):
+    return GamePiece.from_type(piece_type.type_id, position, color, id, is_king)
 
 
 class GamePiece:
+    """A piece on the board
+
+    Only the square, color, id, king flag and the id of its PieceType are kept per piece,
+    so cloning a game copies a handful of small objects.
+    """
+
+    __slots__ = ("type_id", "position", "color", "id", "is_king")
+
     def __init__(
         self,
         piece: np.ndarray,
@@ -26,72 +244,109 @@ class GamePiece:
             name (str): The name of the piece.
             phased_movement (bool, optional): Indicates if the piece has phased movement. Defaults to False.
         """
-        self.piece = piece
-        self.movement = movement
-        self.name = name
-        self.hash = (
-            int(hashlib.sha1(self.name.encode()).hexdigest(), 16)
-            % TOTAL_EXPECTED_PIECES
-        )
+        self.type_id = register_piece_type(piece, movement, name, phased_movement)
         self.position = None
         self.color = None
         self.is_king = False
-        self.phased_movement = phased_movement
         self.id = None
 
+    @classmethod
+    def from_type(cls, type_id, position=None, color=None, id=None, is_king=False):
+        """Creates a piece of an already registered type"""
+        piece = cls.__new__(cls)
+        piece.type_id = type_id
+        piece.position = position
+        piece.color = color
+        piece.id = id
+        piece.is_king = is_king
+        return piece
+
+    def __reduce__(self):
+        return (
+            _unpickle_piece,
+            (
+                PIECE_TYPES[self.type_id],
+                self.position,
+                self.color,
+                self.id,
+                self.is_king,
+            ),
+        )
+
+    @property
+    def type(self):
+        return PIECE_TYPES[self.type_id]
+
+    @property
+    def piece(self):
+        return PIECE_TYPES[self.type_id].drawing
+
+    @property
+    def name(self):
+        return PIECE_TYPES[self.type_id].name
+
+    @property
+    def hash(self):
+        return PIECE_TYPES[self.type_id].hash
+
+    @property
+    def phased_movement(self):
+        return PIECE_TYPES[self.type_id].phased_movement
+
+    @property
+    def movement(self):
+        """The movement matrix, rotated by 180 degrees for black pieces"""
+        return PIECE_TYPES[self.type_id].get_movement(self.color)
+
+    def get_move_tables(self, rows, cols):
+        """Returns the compiled move tables of the piece for a rows x cols board"""
+        return PIECE_TYPES[self.type_id].get_move_tables(rows, cols, self.color)
+
+    def get_move_windows(self, rows, cols):
+        """Returns the movement windows of the piece for a rows x cols board"""
+        return PIECE_TYPES[self.type_id].get_move_windows(rows, cols, self.color)
+
+    def get_reach(self, position, rows, cols):
+        """Returns the squares whose occupancy can change the moves of the piece from position"""
+        return PIECE_TYPES[self.type_id].get_move_reach(rows, cols, self.color)[
+            (position[0], position[1])
+        ]
+
     def get_valid_moves(self, board, position, alignment):
         """Returns a list of valid moves for the piece"""
 
-        movement_map = self.movement[
-            15 - position[0] - 8 : 15 - position[0],
-            15 - position[1] - 8 : 15 - position[1],
+        rows, cols = board.shape
+        piece_type = PIECE_TYPES[self.type_id]
+        table = piece_type.get_move_tables(rows, cols, self.color)[
+            (position[0], position[1])
         ]
         valid_moves = []
 
-        rows, cols = board.shape
+        if piece_type.phased_movement:
+            if len(table) >= VECTORIZED_MIN_TARGETS:
+                window = piece_type.get_move_windows(rows, cols, self.color)[
+                    (position[0], position[1])
+                ]
+                targets_row, targets_col = np.nonzero(
+                    window & ((board == 0) | (alignment != self.color))
+                )
+                return list(zip(targets_row.tolist(), targets_col.tolist()))
 
-        if self.phased_movement:
-            for row in range(movement_map.shape[0]):
-                for col in range(movement_map.shape[1]):
-                    if row < 0 or row > rows - 1 or col < 0 or col > cols - 1:
-                        break  # Out of bounds
-                    if movement_map[row, col] == 15:
-                        if board[row, col] == 0:
-                            valid_moves.append((row, col))
-                        else:
-                            if alignment[row, col] != self.color:
-                                valid_moves.append((row, col))
+            for square in table:
+                if board[square] == 0 or alignment[square] != self.color:
+                    valid_moves.append(square)
         else:
-            # This means that the pieces movement needs to be contiguous
-            # If movement isn't phased, then a breadth first search can be used to find all valid moves
-            # A better way to do this would be to just use rays in the directions the piece can move
-
-            directions = [
-                (1, 0),
-                (-1, 0),
-                (0, 1),
-                (0, -1),
-                (1, 1),
-                (-1, -1),
-                (-1, 1),
-                (1, -1),
-            ]
-
-            for direction in directions:
-                for i in range(1, 8):
-                    row = position[0] + direction[0] * i
-                    col = position[1] + direction[1] * i
-                    if row < 0 or row > rows - 1 or col < 0 or col > cols - 1:
-                        break  # Out of bounds
-                    if movement_map[row, col] == 15:
-                        if board[row, col] == 0:
-                            valid_moves.append((row, col))
-                        else:
-                            if alignment[row, col] != self.color:
-                                valid_moves.append((row, col))
-                            break
+            # The movement is contiguous, so each ray stops at the first piece in the way
+            for ray in table:
+                for square in ray:
+                    if board[square] == 0:
+                        valid_moves.append(square)
+                    else:
+                        if alignment[square] != self.color:
+                            valid_moves.append(square)
+                        break
 
         return valid_moves
 
     def copy(self):
-        return GamePiece(self.piece, self.movement, self.name, self.phased_movement)
+        return GamePiece.from_type(self.type_id)
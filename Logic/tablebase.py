@@ -0,0 +1,419 @@
+import array
+import collections
+import os
+import time
+
+import numpy as np
+
+from Logic.bitboard import BitboardGameLogic
+from Logic.zobrist import SIDE_TO_MOVE_KEY, zobrist_key
+from UI.board_create_screen import BLACK_PIECE
+from UI.piece_draw_screen import TOTAL_EXPECTED_PIECES
+
+DEFAULT_DIRECTORY = os.path.join(os.getcwd(), "Tablebases")
+
+# Distance of a position no side can force a win from
+DRAW = -1
+
+# Building stops once this many positions are reached, the board is too big to solve
+MAX_POSITIONS = 20000000
+
+
+def _bitboard_hash_key(bitboard):
+    """Returns the GameLogic.hash_key of the position of a bitboard"""
+    key = SIDE_TO_MOVE_KEY if bitboard.turn == BLACK_PIECE else 0
+    for piece_id, square in enumerate(bitboard.piece_squares):
+        if square >= 0:
+            piece_hash, color = bitboard.piece_info[piece_id][:2]
+            key ^= zobrist_key(piece_hash, color, *divmod(square, bitboard.cols))
+    return key
+
+
+def position_signature(pieces, turn, cols, width):
+    """Writes a position down as width numbers, the side to move followed by a number
+    for each of its (row, col, piece hash, color, is king) pieces, sorted and padded with
+    -1. Returns None if the position has more pieces than fit.
+
+    Unlike the hash key, two different positions never get the same signature, even when
+    they only differ in which of two identical pieces is the king."""
+    if len(pieces) >= width:
+        return None
+    codes = sorted(
+        (
+            ((row * cols + col) * TOTAL_EXPECTED_PIECES + int(piece_hash)) * 2
+            + (color == BLACK_PIECE)
+        )
+        * 2
+        + bool(is_king)
+        for row, col, piece_hash, color, is_king in pieces
+    )
+    return [int(turn == BLACK_PIECE)] + codes + [-1] * (width - 1 - len(codes))
+
+
+def game_signature(game, width):
+    """Returns the position_signature of the position of a GameLogic"""
+    return position_signature(
+        [
+            (row, col, piece.hash, piece.color, piece.is_king)
+            for (row, col), piece in game.pieces.items()
+        ],
+        game.turn,
+        game.cols,
+        width,
+    )
+
+
+def _bitboard_signature(bitboard, width, piece_codes):
+    """Returns the position_signature of a bitboard, as the bytes of its numbers. The
+    piece_codes of every piece id are the numbers of its piece on the first square."""
+    stride = TOTAL_EXPECTED_PIECES * 4
+    codes = sorted(
+        square * stride + piece_codes[piece_id]
+        for piece_id, square in enumerate(bitboard.piece_squares)
+        if square >= 0
+    )
+    return array.array(
+        "i",
+        [int(bitboard.turn == BLACK_PIECE)] + codes + [-1] * (width - 1 - len(codes)),
+    ).tobytes()
+
+
+def enumerate_positions(game, max_positions=MAX_POSITIONS):
+    """Walks every position reachable from the current position of the game
+
+    Returns the hash keys of the positions in the order they were found, which makes the
+    starting position index 0, their signatures (see position_signature) as a 2D array,
+    whether each position is over, and the moves between them as a compressed adjacency
+    list: the successors of position i are successors[offsets[i]:offsets[i + 1]].
+
+    The positions are told apart by their signatures rather than their hash keys, so two
+    of them sharing a key are still solved separately."""
+    start = BitboardGameLogic.from_game_logic(game)
+    # Pieces are only ever taken off the board, no position has more than the start
+    width = len(game.pieces) + 1
+    piece_codes = [
+        (
+            (int(info[0]) * 2 + (info[1] == BLACK_PIECE)) * 2 + bool(info[2])
+            if info is not None
+            else 0
+        )
+        for info in start.piece_info
+    ]
+    signature = _bitboard_signature(start, width, piece_codes)
+    index = {signature: 0}
+    keys = [_bitboard_hash_key(start)]
+    signatures = bytearray(signature)
+    queue = collections.deque([start])
+    game_over = [start.game_over]
+    offsets = array.array("q", [0])
+    successors = array.array("q")
+
+    # Positions are taken from the queue in the order of their indices, so the moves of
+    # position i are always the next ones added to the adjacency list
+    while queue:
+        position = queue.popleft()
+        if not position.game_over:
+            for action in position.get_all_possible_moves_action_space():
+                child = position.clone()
+                child.apply_action(action)
+                signature = _bitboard_signature(child, width, piece_codes)
+                child_index = index.get(signature)
+                if child_index is None:
+                    if len(index) >= max_positions:
+                        raise ValueError(
+                            f"More than {max_positions} positions are reachable, the board is too big for a tablebase"
+                        )
+                    child_index = len(index)
+                    index[signature] = child_index
+                    keys.append(_bitboard_hash_key(child))
+                    signatures += signature
+                    game_over.append(child.game_over)
+                    queue.append(child)
+                successors.append(child_index)
+        offsets.append(len(successors))
+
+    return (
+        np.array(keys, dtype=np.uint64),
+        np.frombuffer(signatures, dtype=np.int32).reshape(-1, width),
+        np.array(game_over, dtype=bool),
+        np.frombuffer(offsets, dtype=np.int64),
+        np.frombuffer(successors, dtype=np.int64),
+    )
+
+
+def _gather(offsets, values, positions):
+    """Returns values[offsets[i]:offsets[i + 1]] of all the positions, concatenated"""
+    starts = offsets[positions]
+    lengths = offsets[positions + 1] - starts
+    shift = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[shift + np.arange(lengths.sum())]
+
+
+def retrograde_analysis(game_over, offsets, successors):
+    """Returns the distance of every position to the end of the game with perfect play
+
+    The distance counts the moves until a king is taken, so the player to move wins an odd
+    distance away and loses an even one, positions where the game is over being lost at
+    distance 0. Positions no side can force a win from are DRAW.
+
+    Working back from the finished games one move at a time, a position with a move to a
+    lost position is won, and a position whose moves all lead to won positions is lost.
+    Because the distances grow by one every round, the winner always gets the quickest
+    win and the loser the slowest loss.
+    """
+    count = len(game_over)
+    sources = np.repeat(np.arange(count), np.diff(offsets))
+    order = np.argsort(successors, kind="stable")
+    predecessors = sources[order]
+    predecessor_offsets = np.searchsorted(successors[order], np.arange(count + 1))
+
+    distances = np.full(count, DRAW, dtype=np.int32)
+    remaining = np.diff(offsets)
+    frontier = np.flatnonzero(game_over)
+    distances[frontier] = 0
+    distance = 0
+    while frontier.size:
+        parents = _gather(predecessor_offsets, predecessors, frontier)
+        if distance % 2 == 0:
+            # The frontier is lost for the player to move, so moving there wins
+            parents = np.unique(parents)
+            frontier = parents[distances[parents] == DRAW]
+        else:
+            # The frontier is won for the player to move, a position is only lost once
+            # every one of its moves leads there
+            moves = np.bincount(parents, minlength=count)
+            remaining = remaining - moves
+            frontier = np.flatnonzero(
+                (moves > 0) & (remaining == 0) & (distances == DRAW)
+            )
+        distance += 1
+        distances[frontier] = distance
+    return distances
+
+
+class Tablebase:
+    """Solved positions of a board, looked up by GameLogic.hash_key
+
+    The keys are stored sorted, so the index of a position is where its key is found by
+    a binary search, and its distance to the end of the game (see retrograde_analysis)
+    sits at the same index of the distances. The arrays are saved as .npy files which are
+    memory mapped when loaded, so a lookup only reads the few pages it touches and every
+    process using the same tablebase shares them.
+
+    Hash keys are 64 bits, so two positions can share one. The signature of every
+    position (see position_signature) is stored alongside its key and checked when
+    probing, a position whose key is in the table but not its signature is unknown. Like
+    everywhere else in the game, the kinds of pieces are told apart by their piece hash.
+    """
+
+    def __init__(self, keys, distances, signatures):
+        self.keys = keys
+        self.distances = distances
+        self.signatures = signatures
+
+    @classmethod
+    def build(cls, game, max_positions=MAX_POSITIONS):
+        """Solves every position reachable from the current position of the game"""
+        keys, signatures, game_over, offsets, successors = enumerate_positions(
+            game, max_positions
+        )
+        distances = retrograde_analysis(game_over, offsets, successors)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], distances[order].astype(np.int16), signatures[order])
+
+    @staticmethod
+    def paths(name, directory=None):
+        """Returns the paths of the key, distance and signature files of a board's
+        tablebase"""
+        directory = directory or DEFAULT_DIRECTORY
+        base = os.path.join(directory, os.path.splitext(name)[0])
+        return base + ".keys.npy", base + ".distances.npy", base + ".signatures.npy"
+
+    def save(self, name, directory=None):
+        keys_path, distances_path, signatures_path = self.paths(name, directory)
+        os.makedirs(os.path.dirname(keys_path), exist_ok=True)
+        np.save(keys_path, self.keys)
+        np.save(distances_path, self.distances)
+        np.save(signatures_path, self.signatures)
+
+    @classmethod
+    def load(cls, name, directory=None):
+        """Memory maps the tablebase of a board, or returns None if it wasn't built"""
+        paths = cls.paths(name, directory)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return cls(*(np.load(path, mmap_mode="r") for path in paths))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def probe(self, game):
+        """Returns the distance of the game's position, None if it's unknown"""
+        key = np.uint64(game.hash_key)
+        start = int(np.searchsorted(self.keys, key))
+        if start == len(self.keys) or self.keys[start] != key:
+            return None
+        signature = game_signature(game, self.signatures.shape[1])
+        if signature is None:
+            return None
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        for index in range(start, end):
+            if np.array_equal(self.signatures[index], signature):
+                return int(self.distances[index])
+        return None
+
+    def value(self, game):
+        """Returns 1 if the player to move wins, -1 if they lose, 0 for a draw and None
+        for an unknown position"""
+        distance = self.probe(game)
+        if distance is None:
+            return None
+        if distance == DRAW:
+            return 0
+        return 1 if distance % 2 else -1
+
+    def best_action(self, game):
+        """Returns the action keeping the best result for the player to move, the quickest
+        win, the slowest loss or a draw, or None if the position is unknown"""
+        distance = self.probe(game)
+        if distance is None or game.game_over:
+            return None
+
+        def preference(child):
+            if child is None:
+                return (3, 0)  # Unknown positions only get picked if nothing else is
+            if distance == DRAW:
+                return (0, 0) if child == DRAW else (1, 0)
+            if distance % 2:
+                # A quick win, the opponent is left in a lost position
+                return (0, child) if child != DRAW and child % 2 == 0 else (1, 0)
+            return (0, -child) if child != DRAW else (1, 0)
+
+        best_action, best_preference = None, None
+        for action in game.get_all_possible_moves_action_space():
+            game.push_action(action)
+            child_preference = preference(self.probe(game))
+            game.pop_action()
+            if best_preference is None or child_preference < best_preference:
+                best_action, best_preference = action, child_preference
+        return best_action
+
+
+def returns_for(distance, player, num_players=2):
+    """Turns a distance into the returns of the players, the player to move first"""
+    returns = np.zeros(num_players)
+    if distance != DRAW:
+        value = 1.0 if distance % 2 else -1.0
+        returns[player] = value
+        returns[1 - player] = -value
+    return returns
+
+
+class TablebaseEvaluator:
+    """MCTS evaluator returning the exact result of the positions in the tablebase and
+    asking `evaluator` about the rest
+
+    It follows the open_spiel interface (`evaluate` and `prior`) and batches the unknown
+    positions when the wrapped evaluator can, so it can sit in front of the rollout,
+    static and AlphaZero evaluators."""
+
+    def __init__(self, tablebase, evaluator):
+        self.tablebase = tablebase
+        self.evaluator = evaluator
+        self.hits = 0
+
+    def _probe(self, state):
+        if state.is_terminal():
+            return None
+        distance = self.tablebase.probe(state.game_logic)
+        if distance is not None:
+            self.hits += 1
+        return distance
+
+    def evaluate(self, state):
+        distance = self._probe(state)
+        if distance is None:
+            return self.evaluator.evaluate(state)
+        return returns_for(distance, state.current_player())
+
+    def prior(self, state):
+        return self.evaluator.prior(state)
+
+    def evaluate_batch(self, states):
+        """Returns the (returns, prior) of every state, only the unknown positions are
+        left to the wrapped evaluator"""
+        distances = [self._probe(state) for state in states]
+        unknown = [state for state, d in zip(states, distances) if d is None]
+        if hasattr(self.evaluator, "evaluate_batch"):
+            evaluations = iter(self.evaluator.evaluate_batch(unknown))
+        else:
+            evaluations = iter(
+                (self.evaluator.evaluate(state), self.evaluator.prior(state))
+                for state in unknown
+            )
+
+        results = []
+        for state, distance in zip(states, distances):
+            if distance is None:
+                results.append(next(evaluations))
+            else:
+                results.append(
+                    (
+                        returns_for(distance, state.current_player()),
+                        self.evaluator.prior(state),
+                    )
+                )
+        return results
+
+
+class LookupBot:
+    """Wraps a bot so the moves of the positions found in the tables, like a Tablebase
+    or an OpeningBook, come straight from them instead of a search
+
+    The tables are asked in order with their best_action(game). Everything else,
+    including keeping the bot informed about the moves played, is left to the wrapped
+    bot, and its settings, like time_budget, are read and set through the wrapper."""
+
+    _OWN_ATTRIBUTES = ("bot", "tables", "search_stats")
+
+    def __init__(self, bot, *tables):
+        self.bot = bot
+        self.tables = tables
+        self.search_stats = {"nodes": 0, "seconds": 0.0}
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+
+    def __setattr__(self, name, value):
+        if name in self._OWN_ATTRIBUTES:
+            super().__setattr__(name, value)
+        else:
+            setattr(self.bot, name, value)
+
+    def restart(self):
+        self.bot.restart()
+
+    def restart_at(self, state):
+        self.bot.restart_at(state)
+
+    def inform_action(self, state, player_id, action):
+        self.bot.inform_action(state, player_id, action)
+
+    def step_with_policy(self, state):
+        start = time.perf_counter()
+        action = None
+        for table in self.tables:
+            action = table.best_action(state.game_logic)
+            if action is not None:
+                break
+        if action is None:
+            result = self.bot.step_with_policy(state)
+            self.search_stats = getattr(self.bot, "search_stats", self.search_stats)
+            return result
+        self.search_stats = {"nodes": 0, "seconds": time.perf_counter() - start}
+        # The wrapped bot still has to follow the game to keep its tree
+        self.bot.inform_action(state, state.current_player(), action)
+        return [(action, 1.0)], action
+
+    def step(self, state):
+        return self.step_with_policy(state)[1]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from UI.board_create_screen import BLACK_PIECE
+
+MASK_64 = (1 << 64) - 1
+
+# Keys handed out so far, keyed by (piece hash, color, row, col)
+_ZOBRIST_KEYS = {}
+
+
+def splitmix64(seed):
+    """Returns a well mixed 64 bit integer for the seed
+
+    The keys are derived from their inputs instead of drawn from a random generator, so
+    every process and every run gives a position the same key.
+    """
+    z = (seed + 0x9E3779B97F4A7C15) & MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return z ^ (z >> 31)
+
+
+# XORed into the key whenever black is to move
+SIDE_TO_MOVE_KEY = splitmix64(0)
+
+
+def zobrist_key(piece_hash, color, row, col):
+    """Returns the key of a piece of the given hash and color standing on (row, col)"""
+    piece = (int(piece_hash), int(color), int(row), int(col))
+    key = _ZOBRIST_KEYS.get(piece)
+    if key is None:
+        key = splitmix64(
+            ((piece[0] * 4 + piece[1]) << 16 | piece[2] << 8 | piece[3]) + 1
+        )
+        _ZOBRIST_KEYS[piece] = key
+    return key
+
+
+def compute_hash_key(piece_position, piece_alignment, turn):
+    """Computes the key of a position from scratch out of its board arrays"""
+    key = SIDE_TO_MOVE_KEY if turn == BLACK_PIECE else 0
+    rows, cols = np.nonzero(piece_position)
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        key ^= zobrist_key(
+            piece_position[row, col], piece_alignment[row, col], row, col
+        )
+    return key
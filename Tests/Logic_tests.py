@@ -1,4 +1,8 @@
+import asyncio
 import pytest
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from unittest.mock import Mock, patch
 import pygame
@@ -6,6 +10,29 @@ from Logic.game import (
     GameLogic,
 )
 from Logic.piece import GamePiece
+from Logic.bitboard import BitboardGameLogic
+from Helpers.graph_mcts import GraphMCTSBot, GraphEdge, BatchedAlphaZeroEvaluator
+from Helpers.perft import perft, compare_to_baseline, compare_speed
+from Helpers.parallel_mcts import RootParallelMCTSBot
+from Helpers.tree_reuse import TreeReuseMixin
+from Logic.engine import AlphaBetaEngine
+from Logic.evaluation import PositionEvaluator, StaticEvaluator, piece_value
+from Logic.tablebase import (
+    DRAW,
+    LookupBot,
+    Tablebase,
+    TablebaseEvaluator,
+    game_signature,
+)
+from Logic.book import OpeningBook, find_games, parse_moves
+from Logic.ai_worker import AIMoveWorker
+from Logic.llm_client import LLMMoveClient, ResponseCache
+from Logic.past_games import PastGamesIndex, estimate_tokens
+from Logic.zobrist import compute_hash_key
+from Helpers.self_play import ShardWriter, play_game, read_shard, shard_paths
+from Helpers.self_play import main as self_play_main
+from UI.board_create_screen import BLACK_PIECE, WHITE_PIECE
+from UI.game_screen import BoxInput
 
 
 @pytest.fixture
@@ -52,6 +79,8 @@ class TestGameLogic:
         - test_get_all_possible_moves: Test that all possible moves are correctly identified for the current player.
         - test_apply_action: Test applying an action translates to the correct piece movement.
         - test_game_over_conditions: Test the game over conditions are correctly set.
+        - test_clone_keeps_winner: Test that a clone has the winner of the game, or none yet.
+        - test_spiel_states_start_apart: Test that every open_spiel state starts from its own copy of the board.
     """
 
     def test_handle_press_select_and_move_piece(self, game_logic, mock_piece):
@@ -139,6 +168,33 @@ class TestGameLogic:
         assert np.array_equal(clone.piece_position, game_logic.piece_position)
         assert np.array_equal(clone.piece_alignment, game_logic.piece_alignment)
 
+    def test_clone_keeps_winner(self, small_game):
+        """Test that a clone has the winner of the game, or none yet."""
+        assert small_game.clone().winner is None
+
+        # The white rook takes the black king
+        small_game.apply_action(0)
+        assert small_game.clone().winner == "White"
+
+    def test_spiel_states_start_apart(self, small_game):
+        """Test that every open_spiel state starts from its own copy of the board."""
+        spiel_helper = pytest.importorskip("Helpers.spiel_helper")
+        game = spiel_helper.MiniChessGame(
+            _GAME_TYPE=spiel_helper.game_type("small"),
+            _GAME_INFO=spiel_helper.game_info(4 * 4 * 4),
+            game_logic=small_game,
+            num_pieces=4,
+            rows=4,
+            cols=4,
+        )
+        state = game.new_initial_state()
+        assert state.returns() == [0, 0]
+
+        state.apply_action(0)
+        assert state.returns() == [1, -1]
+        assert not small_game.game_over
+        assert game.new_initial_state().returns() == [0, 0]
+
 
 @pytest.fixture
 def mock_piece_image():
@@ -217,3 +273,1839 @@ class TestGamePiece:
         assert piece_copy is not game_piece
         assert piece_copy.name == game_piece.name
         assert np.array_equal(piece_copy.movement, game_piece.movement)
+
+    def test_move_tables_are_shared(self, game_piece):
+        """Test that the compiled move tables are reused by copies of the piece."""
+        tables = game_piece.get_move_tables(8, 8)
+        piece_copy = game_piece.copy()
+
+        assert piece_copy.get_move_tables(8, 8) is tables
+        assert set(tables[(3, 3)]) == {(2, 3), (1, 2), (1, 4), (0, 1), (0, 5)}
+
+    def test_move_tables_rotated_movement(self, game_piece):
+        """Test that black pieces get the tables of the movement rotated by 180 degrees."""
+        piece_copy = game_piece.copy()
+        piece_copy.color = 1
+
+        assert np.array_equal(piece_copy.movement, np.rot90(game_piece.movement, 2))
+        assert (4, 3) in piece_copy.get_move_tables(8, 8)[(3, 3)]
+        assert (4, 3) not in game_piece.get_move_tables(8, 8)[(3, 3)]
+
+    def test_pieces_share_type(self, game_piece, mock_piece_image):
+        """Test that pieces of the same kind share one PieceType and survive pickling."""
+        same_piece = GamePiece(
+            mock_piece_image, game_piece.movement, game_piece.name, True
+        )
+        same_piece.position, same_piece.color, same_piece.id = (1, 2), 1, 5
+        unpickled = pickle.loads(pickle.dumps(same_piece))
+
+        assert same_piece.type is game_piece.type
+        assert not hasattr(same_piece, "__dict__")
+        assert unpickled.type is game_piece.type
+        assert (unpickled.position, unpickled.color, unpickled.id) == ((1, 2), 1, 5)
+
+    def test_get_valid_moves_vectorized(self, mock_piece_image):
+        """Test that phased pieces with many targets give the same moves on a large board."""
+        movement = np.zeros((15, 15))
+        movement[::2, ::2] = 15  # Jumps to every other square around it
+        piece = GamePiece(mock_piece_image, movement, "Jumper", phased_movement=True)
+        piece.color = 2
+        board = np.zeros((12, 12))
+        alignment = np.zeros((12, 12))
+        board[9, 9], alignment[9, 9] = 1, 2
+        board[2, 2], alignment[2, 2] = 1, 1
+        board[4, 4], alignment[4, 4] = 1, 2
+
+        with patch("Logic.piece.VECTORIZED_MIN_TARGETS", 0):
+            vectorized = piece.get_valid_moves(board, (9, 9), alignment)
+        with patch("Logic.piece.VECTORIZED_MIN_TARGETS", 1000):
+            looped = piece.get_valid_moves(board, (9, 9), alignment)
+
+        assert vectorized == looped
+        assert (1, 11) not in vectorized  # 8 rows away is outside the movement matrix
+        assert (4, 4) not in vectorized and (4, 6) in vectorized
+        assert (2, 2) in vectorized
+
+    def test_get_valid_moves_contiguous_blocked(self, mock_piece_image):
+        """Test that a contiguous piece stops at the first piece in its way."""
+        movement = np.zeros((15, 15))
+        movement[7, 8:] = 15  # Slides to the right
+        rook = GamePiece(mock_piece_image, movement, "Slider")
+        rook.color = 2
+        board = np.zeros((8, 8))
+        alignment = np.zeros((8, 8))
+        board[0, 0], alignment[0, 0] = 1, 2
+        board[0, 3], alignment[0, 3] = 1, 1
+
+        valid_moves = rook.get_valid_moves(board, (0, 0), alignment)
+
+        assert valid_moves == [(0, 1), (0, 2), (0, 3)]
+
+
+@pytest.fixture
+def rook_movement():
+    """Example movement array for a rook piece."""
+    movement = np.zeros((15, 15))
+    movement[7, :] = 15
+    movement[:, 7] = 15
+    movement[7, 7] = 0
+    return movement
+
+
+@pytest.fixture
+def small_game(mock_piece_image, knight_movement, rook_movement):
+    """Provides a 4x4 GameLogic with a rook and a king-capturing knight for each side."""
+    game = GameLogic(rows=4, cols=4)
+    rook = GamePiece(mock_piece_image, rook_movement, "Rook")
+    knight = GamePiece(mock_piece_image, knight_movement, "Knight", True)
+    layout = [
+        ((3, 0), rook, 2),
+        ((3, 3), knight, 2),
+        ((0, 3), rook, 1),
+        ((0, 0), knight, 1),
+    ]
+    for i, (position, piece, color) in enumerate(layout):
+        piece = piece.copy()
+        piece.position = position
+        piece.color = color
+        piece.id = i
+        game.pieces[position] = piece
+        game.piece_position[position] = piece.hash
+        game.piece_alignment[position] = color
+    game.pieces[(0, 0)].is_king = True
+    game.pieces[(3, 3)].is_king = True
+    return game
+
+
+class TestBitboardGameLogic:
+    """
+    Test cases for the BitboardGameLogic class.
+
+    Test Methods:
+        - test_legal_actions_match: Test that the bitboard generates the same actions as GameLogic.
+        - test_apply_action_and_clone: Test applying actions keeps both representations in sync.
+        - test_board_size_limit: Test that boards larger than 16x16 are rejected.
+        - test_key_includes_kings: Test that positions that only differ in their kings get different keys.
+    """
+
+    def test_legal_actions_match(self, small_game):
+        """Test that the bitboard generates the same actions as GameLogic."""
+        bitboard = BitboardGameLogic.from_game_logic(small_game)
+
+        assert (
+            bitboard.get_all_possible_moves_action_space()
+            == small_game.get_all_possible_moves_action_space()
+        )
+
+    def test_apply_action_and_clone(self, small_game):
+        """Test applying actions keeps both representations in sync."""
+        bitboard = BitboardGameLogic.from_game_logic(small_game)
+        clone = bitboard.clone()
+
+        while not small_game.game_over:
+            action = small_game.get_all_possible_moves_action_space()[0]
+            small_game.apply_action(action)
+            bitboard.apply_action(action)
+            piece_position, piece_alignment = bitboard.get_current_game_state()
+            assert np.array_equal(piece_position, small_game.piece_position)
+            assert np.array_equal(piece_alignment, small_game.piece_alignment)
+
+        assert bitboard.game_over and bitboard.winner == small_game.winner
+        assert clone != bitboard
+        assert not clone.game_over
+
+    def test_board_size_limit(self):
+        """Test that boards larger than 16x16 are rejected."""
+        with pytest.raises(ValueError):
+            BitboardGameLogic(rows=17, cols=17)
+
+    def test_key_includes_kings(self, small_game):
+        """Test that positions that only differ in their kings get different keys."""
+        other = small_game.clone()
+        other.pieces[(3, 3)].is_king = False
+        other.pieces[(3, 0)].is_king = True
+        bitboard = BitboardGameLogic.from_game_logic(small_game)
+        other_bitboard = BitboardGameLogic.from_game_logic(other)
+        assert bitboard != other_bitboard
+
+        # The white king moves up on both boards, the kings stay apart
+        bitboard.apply_action(1 * 16 + 2 * 4 + 3)
+        other_bitboard.apply_action(1 * 16 + 2 * 4 + 3)
+        assert bitboard.king_mask == 1 << (2 * 4 + 3) | 1 << 0
+        assert other_bitboard.king_mask == 1 << (3 * 4 + 0) | 1 << 0
+
+
+class TestLegalActionsMasks:
+    """
+    Test cases for the batched legal action masks of GameLogic.
+
+    Test Methods:
+        - test_masks_match_action_space: Test that each row of the mask matches the legal actions of that state.
+    """
+
+    def test_masks_match_action_space(self, small_game):
+        """Test that each row of the mask matches the legal actions of that state."""
+        states = [small_game.clone()]
+        expected = [small_game.get_all_possible_moves_action_space()]
+        for _ in range(3):
+            small_game.apply_action(expected[-1][-1])
+            states.append(small_game.clone())
+            expected.append(small_game.get_all_possible_moves_action_space())
+        masks = small_game.get_legal_actions_masks(
+            np.stack([s.piece_position for s in states]),
+            np.stack([s.piece_alignment for s in states]),
+            np.array([s.turn for s in states]),
+            np.stack([s.get_piece_ids() for s in states]),
+            num_distinct_actions=4 * 16,
+        )
+
+        assert masks.shape == (4, 64)
+        for mask, actions in zip(masks, expected):
+            assert np.nonzero(mask)[0].tolist() == actions
+
+
+class TestMoveCache:
+    """
+    Test cases for the incremental move cache of GameLogic.
+
+    Test Methods:
+        - test_legal_actions_memoized: Test that asking for the legal actions twice doesn't regenerate them.
+        - test_only_affected_pieces_invalidated: Test that a move only drops the moves of the pieces it touches.
+    """
+
+    def test_legal_actions_memoized(self, small_game):
+        """Test that asking for the legal actions twice doesn't regenerate them."""
+        actions = small_game.get_all_possible_moves_action_space()
+        with patch.object(GamePiece, "get_valid_moves") as get_valid_moves:
+            assert small_game.get_all_possible_moves_action_space() == actions
+            get_valid_moves.assert_not_called()
+
+    def test_only_affected_pieces_invalidated(self, small_game):
+        """Test that a move only drops the moves of the pieces it touches."""
+        small_game.turn = 1
+        small_game.get_all_possible_moves_action_space()
+        small_game.turn = 2
+        small_game.get_all_possible_moves_action_space()
+        knight_moves = small_game._move_cache[(0, 0)][2]
+
+        # The white knight jumps to (2, 3), the black knight can't see either square
+        small_game.handle_press(3, 3)
+        small_game.handle_press(2, 3)
+
+        assert (3, 3) not in small_game._move_cache
+        assert (0, 3) not in small_game._move_cache
+        assert (3, 0) not in small_game._move_cache
+        assert small_game._move_cache[(0, 0)][2] is knight_moves
+        fresh = small_game.clone()
+        fresh.invalidate_move_cache()
+        assert (
+            small_game.get_all_possible_moves_action_space()
+            == fresh.get_all_possible_moves_action_space()
+        )
+
+
+class TestPushPopAction:
+    """
+    Test cases for making and unmaking moves in place on GameLogic.
+
+    Test Methods:
+        - test_push_pop_restores_state: Test that popping every pushed action restores the original state.
+        - test_pop_handle_press_move: Test that moves made by pressing on the board can be taken back.
+        - test_push_illegal_action: Test that pushing an illegal action raises an error.
+    """
+
+    def test_push_pop_restores_state(self, small_game):
+        """Test that popping every pushed action restores the original state."""
+        piece_position = small_game.piece_position.copy()
+        piece_alignment = small_game.piece_alignment.copy()
+        actions = small_game.get_all_possible_moves_action_space()
+
+        pushed = []
+        while not small_game.game_over:
+            action = small_game.get_all_possible_moves_action_space()[-1]
+            small_game.push_action(action)
+            pushed.append(action)
+        assert small_game.winner is not None
+
+        while pushed:
+            assert small_game.pop_action() == pushed.pop()
+
+        assert not small_game.game_over and small_game.winner is None
+        assert small_game.turn == 2 and small_game.game_history == []
+        assert np.array_equal(small_game.piece_position, piece_position)
+        assert np.array_equal(small_game.piece_alignment, piece_alignment)
+        assert small_game.get_all_possible_moves_action_space() == actions
+
+    def test_pop_handle_press_move(self, small_game):
+        """Test that moves made by pressing on the board can be taken back."""
+        small_game.handle_press(3, 3)
+        small_game.handle_press(2, 3)
+
+        small_game.pop_action()
+
+        assert small_game.pieces[(3, 3)].position == (3, 3)
+        assert (2, 3) not in small_game.pieces
+        with pytest.raises(IndexError):
+            small_game.pop_action()
+
+    def test_push_illegal_action(self, small_game):
+        """Test that pushing an illegal action raises an error."""
+        with pytest.raises(ValueError):
+            small_game.push_action(1 * 16 + 0 * 4 + 0)  # The knight can't reach (0, 0)
+
+
+class TestPieceIndex:
+    """
+    Test cases for looking up pieces by id on GameLogic.
+
+    Test Methods:
+        - test_index_follows_captures: Test that the index drops captured pieces and restores them on undo.
+        - test_captured_ids_skip_rebuild: Test that captured ids are looked up without rebuilding the index.
+    """
+
+    def test_index_follows_captures(self, small_game):
+        """Test that the index drops captured pieces and restores them on undo."""
+        knight = small_game.get_piece_by_id(1)
+        assert knight is small_game.pieces[(3, 3)]
+
+        # The white rook moves next to the black knight, which captures it
+        small_game.push_action(0 * 16 + 1 * 4 + 0)
+        small_game.push_action(3 * 16 + 1 * 4 + 0)
+
+        assert small_game.get_piece_by_id(0) is None
+        with patch.object(small_game, "_index_pieces") as index_pieces:
+            assert small_game.get_piece_by_id(3).position == (1, 0)
+            index_pieces.assert_not_called()
+
+        small_game.pop_action()
+        assert small_game.get_piece_by_id(0) is small_game.pieces[(1, 0)]
+
+    def test_captured_ids_skip_rebuild(self, small_game):
+        """Test that captured ids are looked up without rebuilding the index."""
+        small_game.get_piece_by_id(0)
+        small_game.push_action(0 * 16 + 1 * 4 + 0)
+        small_game.push_action(3 * 16 + 1 * 4 + 0)
+
+        with patch.object(small_game, "_index_pieces") as index_pieces:
+            assert small_game.get_piece_by_id(0) is None
+            assert small_game.get_piece_by_id(99) is None
+            index_pieces.assert_not_called()
+
+        # A piece put back by hand is found once the board is marked as edited
+        rook = small_game.undo_stack[-1][2]
+        small_game.pieces[(3, 0)] = rook
+        rook.position = (3, 0)
+        small_game.invalidate_move_cache()
+        assert small_game.get_piece_by_id(0) is rook
+
+
+class TestHashKey:
+    """
+    Test cases for the Zobrist hash key of GameLogic.
+
+    Test Methods:
+        - test_hash_key_matches_recomputed: Test that the incremental key always equals the key computed from scratch.
+        - test_hash_key_transposition: Test that reaching the same position by different moves gives the same key.
+    """
+
+    def test_hash_key_matches_recomputed(self, small_game):
+        """Test that the incremental key always equals the key computed from scratch."""
+        initial_key = small_game.hash_key
+        while not small_game.game_over:
+            small_game.push_action(small_game.get_all_possible_moves_action_space()[0])
+            key = small_game.hash_key
+            small_game.invalidate_move_cache()
+            assert small_game.hash_key == key
+            assert small_game.clone().hash_key == key
+
+        while small_game.undo_stack:
+            small_game.pop_action()
+        assert small_game.hash_key == initial_key
+
+    def test_hash_key_transposition(self, small_game):
+        """Test that reaching the same position by different moves gives the same key."""
+        initial_key = small_game.hash_key
+
+        small_game.push_action(0 * 16 + 2 * 4 + 0)  # White rook (3, 0) -> (2, 0)
+        after_white = small_game.hash_key
+        small_game.push_action(2 * 16 + 1 * 4 + 3)  # Black rook (0, 3) -> (1, 3)
+        small_game.push_action(0 * 16 + 3 * 4 + 0)  # White rook back to (3, 0)
+        assert small_game.hash_key not in (initial_key, after_white)
+        small_game.push_action(2 * 16 + 0 * 4 + 3)  # Black rook back to (0, 3)
+
+        assert small_game.hash_key == initial_key
+        assert len(small_game.undo_stack) == 4
+
+
+class GameLogicState:
+    """Minimal stand in for MiniChessState, which needs pyspiel."""
+
+    def __init__(self, game_logic):
+        self.game_logic = game_logic
+
+    def current_player(self):
+        return (
+            -4 if self.game_logic.game_over else 0 if self.game_logic.turn == 2 else 1
+        )
+
+    def legal_actions(self):
+        return self.game_logic.get_all_possible_moves_action_space()
+
+    def apply_action(self, action):
+        self.game_logic.push_action(action)
+
+    def is_terminal(self):
+        return self.game_logic.game_over
+
+    def returns(self):
+        return [1, -1] if self.game_logic.winner == "White" else [-1, 1]
+
+    def clone(self):
+        return GameLogicState(self.game_logic.clone())
+
+    def observation_tensor(self):
+        return self.game_logic.piece_position.ravel()
+
+    def legal_actions_mask(self):
+        mask = np.zeros(4 * 16, dtype=bool)
+        mask[self.legal_actions()] = True
+        return mask
+
+
+class CountingRolloutEvaluator:
+    """Random rollout evaluator that records the positions it evaluates."""
+
+    def __init__(self):
+        self.evaluated = []
+        self.rng = np.random.RandomState(0)
+
+    def evaluate(self, state):
+        self.evaluated.append(state.game_logic.hash_key)
+        state = state.clone()
+        for _ in range(20):
+            if state.is_terminal():
+                return state.returns()
+            if not state.legal_actions():
+                break
+            state.apply_action(self.rng.choice(state.legal_actions()))
+        return [0, 0]
+
+    def prior(self, state):
+        actions = state.legal_actions()
+        return [(action, 1 / len(actions)) for action in actions]
+
+
+@pytest.fixture
+def graph_game():
+    """Provides the two player game object GraphMCTSBot needs."""
+    game = Mock(spec=["num_players"])
+    game.num_players.return_value = 2
+    return game
+
+
+class UniformModel:
+    """Stands in for the AlphaZero model, counting its calls and batch sizes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def inference(self, observations, masks):
+        self.batches.append(len(observations))
+        policies = masks / masks.sum(axis=1, keepdims=True)
+        return np.zeros((len(observations), 1)), policies
+
+
+class TestGraphMCTSBot:
+    """
+    Test cases for Monte Carlo graph search.
+
+    Test Methods:
+        - test_finds_king_capture: Test that the bot takes the king when it can.
+        - test_transpositions_evaluated_once: Test that every position is only evaluated once.
+        - test_transposition_table_size: Test that the table never grows past its cap.
+        - test_batched_evaluation: Test that the leaves are evaluated by the model in batches.
+    """
+
+    def test_finds_king_capture(self, small_game, graph_game):
+        """Test that the bot takes the king when it can."""
+        bot = GraphMCTSBot(
+            graph_game, 2, 100, CountingRolloutEvaluator(), np.random.RandomState(0)
+        )
+
+        # The white rook slides up the first column onto the black knight
+        assert bot.step(GameLogicState(small_game)) == 0 * 16 + 0 * 4 + 0
+
+    def test_transpositions_evaluated_once(self, small_game, graph_game):
+        """Test that every position is only evaluated once."""
+        evaluator = CountingRolloutEvaluator()
+        bot = GraphMCTSBot(
+            graph_game,
+            2,
+            300,
+            evaluator,
+            random_state=np.random.RandomState(0),
+            child_selection_fn=GraphEdge.puct_value,
+        )
+
+        bot.step(GameLogicState(small_game))
+
+        assert len(evaluator.evaluated) == len(set(evaluator.evaluated))
+        assert len(bot.nodes) < 300
+
+    def test_transposition_table_size(self, small_game, graph_game):
+        """Test that the table never grows past its cap."""
+        bot = GraphMCTSBot(
+            graph_game,
+            2,
+            200,
+            CountingRolloutEvaluator(),
+            random_state=np.random.RandomState(0),
+            transposition_table_size=10,
+        )
+        state = GameLogicState(small_game)
+
+        action = bot.step(state)
+
+        assert len(bot.nodes) <= 10
+        assert action in state.legal_actions()
+
+    def test_batched_evaluation(self, small_game, graph_game):
+        """Test that the leaves are evaluated by the model in batches."""
+        model = UniformModel()
+        bot = GraphMCTSBot(
+            graph_game,
+            2,
+            64,
+            BatchedAlphaZeroEvaluator(graph_game, model),
+            random_state=np.random.RandomState(0),
+            child_selection_fn=GraphEdge.puct_value,
+            batch_size=8,
+        )
+        state = GameLogicState(small_game)
+
+        root = bot.mcts_search(state)
+
+        # One call for the root, then at most one per batch of 8 simulations
+        assert len(model.batches) <= 1 + 64 // 8
+        assert max(model.batches) > 1
+        assert sum(edge.explore_count for edge in root.edges) == 64
+        assert all(edge.total_reward <= edge.explore_count for edge in root.edges)
+        assert bot.step(state) == 0 * 16 + 0 * 4 + 0
+
+
+class TestPerft:
+    """
+    Test cases for the perft benchmark.
+
+    Test Methods:
+        - test_perft_matches_cloning: Test that perft counts the same leaves as walking the tree with clones.
+        - test_compare_to_baseline: Test that diverging node counts are reported.
+        - test_compare_speed: Test that slowdowns against the speed baseline are reported.
+    """
+
+    def test_perft_matches_cloning(self, small_game):
+        """Test that perft counts the same leaves as walking the tree with clones."""
+
+        def count(game, depth):
+            actions = game.get_all_possible_moves_action_space()
+            if depth == 0 or game.game_over or not actions:
+                return 1
+            total = 0
+            for action in actions:
+                child = game.clone()
+                child.apply_action(action)
+                total += count(child, depth - 1)
+            return total
+
+        assert perft(small_game, 3) == count(small_game, 3)
+        assert small_game.undo_stack == []
+
+    def test_compare_to_baseline(self):
+        """Test that diverging node counts are reported."""
+        baseline = {"a.npz": {"4": {"nodes": 100}}, "b.npz": {"4": {"nodes": 100}}}
+        results = {
+            "a.npz": {"nodes": 100, "seconds": 2.0, "nodes_per_second": 50},
+            "b.npz": {"nodes": 101, "seconds": 0.02, "nodes_per_second": 50},
+            "c.npz": {"nodes": 5, "seconds": 1.0, "nodes_per_second": 5},
+        }
+
+        failures = compare_to_baseline(results, baseline, 4)
+
+        assert len(failures) == 1
+        assert failures[0].startswith("b.npz") and "expected 100" in failures[0]
+        assert compare_to_baseline(results, baseline, 3) == []
+
+    def test_compare_speed(self):
+        """Test that slowdowns against the speed baseline are reported."""
+        speed_baseline = {
+            "a.npz": {"4": {"seconds": 1.0, "nodes_per_second": 100}},
+            "b.npz": {"4": {"seconds": 0.01, "nodes_per_second": 100}},
+        }
+        results = {
+            "a.npz": {"nodes": 100, "seconds": 2.0, "nodes_per_second": 50},
+            "b.npz": {"nodes": 100, "seconds": 0.02, "nodes_per_second": 50},
+            "c.npz": {"nodes": 5, "seconds": 1.0, "nodes_per_second": 5},
+        }
+
+        failures = compare_speed(results, speed_baseline, 4, 0.25)
+
+        assert len(failures) == 1
+        assert failures[0].startswith("a.npz") and "nodes/s" in failures[0]
+        assert compare_speed(results, speed_baseline, 4, 0.6) == []
+
+
+class TestAlphaBetaEngine:
+    """
+    Test cases for the local alpha-beta engine.
+
+    Test Methods:
+        - test_takes_king: Test that the engine captures the king when it can.
+        - test_deterministic: Test that a fixed depth search always picks the same move and leaves the game untouched.
+        - test_engine_ai_move: Test that ai_move plays the engine move without calling the language model.
+    """
+
+    def test_takes_king(self, small_game):
+        """Test that the engine captures the king when it can."""
+        engine = AlphaBetaEngine(time_budget=None, max_depth=3)
+
+        assert engine.search(small_game) == 0 * 16 + 0 * 4 + 0
+
+    def test_deterministic(self, small_game):
+        """Test that a fixed depth search always picks the same move and leaves the game untouched."""
+        small_game.push_action(0 * 16 + 2 * 4 + 0)  # White rook (3, 0) -> (2, 0)
+        key = small_game.hash_key
+
+        actions = {
+            AlphaBetaEngine(time_budget=None, max_depth=4).search(small_game)
+            for _ in range(3)
+        }
+
+        assert len(actions) == 1
+        assert actions.pop() in small_game.get_all_possible_moves_action_space()
+        assert small_game.hash_key == key and len(small_game.undo_stack) == 1
+
+    @patch("Logic.game.llm")
+    def test_engine_ai_move(self, mock_llm, small_game):
+        """Test that ai_move plays the engine move without calling the language model."""
+        small_game.ai_player = "engine"
+
+        small_game.ai_move()
+
+        mock_llm.predict.assert_not_called()
+        assert small_game.game_over and small_game.winner == "White"
+
+
+class TestPositionEvaluator:
+    """
+    Test cases for the static evaluation derived from the movement of the pieces.
+
+    Test Methods:
+        - test_piece_value: Test that a piece is worth its average mobility on the board.
+        - test_evaluate_material: Test that losing a piece lowers the score of its side.
+        - test_evaluate_batch: Test that scoring a batch gives the same scores as one at a time.
+        - test_static_evaluator: Test that the MCTS evaluator returns opposite values in (-1, 1).
+    """
+
+    def test_piece_value(self, small_game):
+        """Test that a piece is worth its average mobility on the board."""
+        rook = small_game.pieces[(3, 0)]
+
+        # A rook reaches the 3 other squares of its row and its column from anywhere
+        assert piece_value(rook, 4, 4) == 6
+
+    def test_evaluate_material(self, small_game):
+        """Test that losing a piece lowers the score of its side."""
+        evaluator = PositionEvaluator()
+        assert evaluator(small_game) == 0
+
+        # The white rook moves next to the black knight, which captures it
+        small_game.push_action(0 * 16 + 1 * 4 + 0)
+        small_game.push_action(3 * 16 + 1 * 4 + 0)
+
+        assert evaluator(small_game) < -500
+        small_game.pop_action()
+        assert evaluator(small_game) == 0  # A rook is as mobile on any square
+
+    def test_evaluate_batch(self, small_game):
+        """Test that scoring a batch gives the same scores as one at a time."""
+        evaluator = PositionEvaluator()
+        games = [small_game.clone()]
+        for action in [0 * 16 + 1 * 4 + 0, 3 * 16 + 1 * 4 + 0, 1 * 16 + 2 * 4 + 3]:
+            games[-1].push_action(action)
+            games.append(games[-1].clone())
+
+        scores = evaluator.evaluate_batch(
+            small_game,
+            [game.piece_position for game in games],
+            [game.piece_alignment for game in games],
+            [game.turn for game in games],
+        )
+
+        assert np.allclose(scores, [evaluator(game) for game in games])
+
+    def test_static_evaluator(self, small_game):
+        """Test that the MCTS evaluator returns opposite values in (-1, 1)."""
+        small_game.push_action(0 * 16 + 1 * 4 + 0)
+        small_game.push_action(3 * 16 + 1 * 4 + 0)
+
+        values = StaticEvaluator().evaluate(GameLogicState(small_game))
+
+        assert -1 < values[0] < 0 and values[1] == -values[0]
+
+
+def graph_bot_factory(state, rng):
+    """Builds the worker bots of the root parallel tests, which need to be picklable."""
+    game = Mock()
+    game.num_players.return_value = 2
+    return GraphMCTSBot(game, 2, 50, CountingRolloutEvaluator(), random_state=rng)
+
+
+class TestRootParallelMCTSBot:
+    """
+    Test cases for root parallel MCTS.
+
+    Test Methods:
+        - test_merges_worker_searches: Test that the root visits of every worker are added up.
+        - test_deadline: Test that a move is returned shortly after the deadline.
+        - test_no_visits: Test that a legal action is played when no search hands in a move.
+        - test_context_manager: Test that the worker processes are shut down on leaving the block.
+        - test_lookup_bot_settings: Test that settings given to a LookupBot reach the bot it wraps.
+    """
+
+    def test_merges_worker_searches(self, small_game):
+        """Test that the root visits of every worker are added up."""
+        bot = RootParallelMCTSBot(
+            graph_bot_factory, GameLogicState, num_workers=2, seed=0
+        )
+        try:
+            merged = bot.search(GameLogicState(small_game))
+            action = bot.step(GameLogicState(small_game))
+        finally:
+            bot.close()
+
+        assert sum(visits for visits, _ in merged.values()) == 2 * 50
+        assert set(merged) == set(small_game.get_all_possible_moves_action_space())
+        assert action == 0 * 16 + 0 * 4 + 0
+
+    def test_deadline(self, small_game):
+        """Test that a move is returned shortly after the deadline."""
+        bot = RootParallelMCTSBot(
+            graph_bot_factory, GameLogicState, num_workers=2, deadline=0.3, seed=0
+        )
+        try:
+            bot.step(GameLogicState(small_game))  # Starts the workers
+            start = time.time()
+            merged = bot.search(GameLogicState(small_game))
+            elapsed = time.time() - start
+        finally:
+            bot.close()
+
+        assert elapsed < 1.0
+        assert sum(visits for visits, _ in merged.values()) > 2 * 50
+
+    def test_no_visits(self, small_game):
+        """Test that a legal action is played when no search hands in a move."""
+        bot = RootParallelMCTSBot(graph_bot_factory, GameLogicState, num_workers=2)
+        state = GameLogicState(small_game)
+        with patch.object(bot, "search", return_value={}):
+            policy, action = bot.step_with_policy(state)
+
+        assert action in state.legal_actions() and policy == [(action, 1.0)]
+
+    def test_context_manager(self, small_game):
+        """Test that the worker processes are shut down on leaving the block."""
+        with RootParallelMCTSBot(
+            graph_bot_factory, GameLogicState, num_workers=2, seed=0
+        ) as bot:
+            assert bot.step(GameLogicState(small_game)) == 0
+            assert bot._pool is not None
+
+        assert bot._pool is None
+
+    def test_lookup_bot_settings(self, small_game):
+        """Test that settings given to a LookupBot reach the bot it wraps."""
+        inner = ToyTreeReuseBot(CountingRolloutEvaluator(), 10)
+        bot = LookupBot(inner)
+        bot.time_budget = 0.5
+
+        assert inner.time_budget == 0.5 and bot.time_budget == 0.5
+        assert "time_budget" not in vars(bot)
+
+
+class ToyNode:
+    """Tree node with the fields of mcts.SearchNode the tree reuse works with."""
+
+    def __init__(self, action, player):
+        self.action = action
+        self.player = player
+        self.explore_count = 0
+        self.total_reward = 0.0
+        self.outcome = None
+        self.children = []
+
+    def best_child(self):
+        return max(
+            self.children,
+            key=lambda child: (
+                0 if child.outcome is None else child.outcome[child.player],
+                child.explore_count,
+                child.total_reward,
+            ),
+        )
+
+
+class ToyTreeBot:
+    """Plain tree search with the internals of mcts.MCTSBot, which needs pyspiel.
+
+    It always follows the least visited child, so every move gets searched."""
+
+    def __init__(self, evaluator, max_simulations):
+        self.evaluator = evaluator
+        self.max_simulations = max_simulations
+        self.solve = False
+        self.max_utility = 1
+        self.verbose = False
+
+    def _apply_tree_policy(self, root, state):
+        visit_path = [root]
+        working_state = state.clone()
+        node = root
+        while not working_state.is_terminal() and node.explore_count > 0:
+            if not node.children:
+                player = working_state.current_player()
+                node.children = [
+                    ToyNode(action, player) for action in working_state.legal_actions()
+                ]
+                if not node.children:
+                    break
+            node = min(node.children, key=lambda child: child.explore_count)
+            working_state.apply_action(node.action)
+            visit_path.append(node)
+        return visit_path, working_state
+
+    def mcts_search(self, state):
+        root = ToyNode(None, state.current_player())
+        for _ in range(self.max_simulations):
+            visit_path, working_state = self._apply_tree_policy(root, state)
+            if working_state.is_terminal():
+                returns = working_state.returns()
+            else:
+                returns = self.evaluator.evaluate(working_state)
+            for node in visit_path:
+                node.total_reward += returns[node.player]
+                node.explore_count += 1
+        return root
+
+    def step_with_policy(self, state):
+        # Like mcts.MCTSBot, only the move picked gets a probability
+        action = self.mcts_search(state).best_child().action
+        return [(action, 1.0)], action
+
+
+class ToyTreeReuseBot(TreeReuseMixin, ToyTreeBot):
+    pass
+
+
+class TestTreeReuse:
+    """
+    Test cases for reusing the search tree between moves.
+
+    Test Methods:
+        - test_reuses_subtree_of_move_played: Test that the next search starts from the subtree of the move.
+        - test_other_position_starts_new_tree: Test that a position the tree wasn't built for gets a new tree.
+        - test_search_matches_mcts_bot: Test that the copied search loop builds the same tree as mcts.MCTSBot.
+    """
+
+    def test_reuses_subtree_of_move_played(self, small_game):
+        """Test that the next search starts from the subtree of the move."""
+        bot = ToyTreeReuseBot(CountingRolloutEvaluator(), 200)
+        state = GameLogicState(small_game)
+        root = bot.mcts_search(state)
+        assert bot.reused_visits == 0
+
+        # The white rook steps up instead of taking the king
+        action = 0 * 16 + 2 * 4 + 0
+        child = next(child for child in root.children if child.action == action)
+        bot.inform_action(state, 0, action)
+        state.apply_action(action)
+
+        visits = child.explore_count
+        assert bot.mcts_search(state) is child
+        assert bot.reused_visits == visits > 0
+        assert child.explore_count == visits + 200
+
+    def test_other_position_starts_new_tree(self, small_game):
+        """Test that a position the tree wasn't built for gets a new tree."""
+        bot = ToyTreeReuseBot(CountingRolloutEvaluator(), 50)
+        state = GameLogicState(small_game)
+        root = bot.mcts_search(state)
+        action = 0 * 16 + 2 * 4 + 0
+        bot.inform_action(state, 0, action)
+
+        # The move that was actually played is another one
+        state.apply_action(1 * 16 + 2 * 4 + 3)
+        assert bot.mcts_search(state) is not root
+        assert bot.reused_visits == 0
+
+        bot.restart()
+        assert bot.mcts_search(state).explore_count == 50
+
+    @pytest.mark.parametrize(
+        "game_name, dont_return_chance_node",
+        [
+            ("tic_tac_toe", False),
+            ("pig(winscore=10,horizon=20)", False),
+            ("pig(winscore=10,horizon=20)", True),
+        ],
+    )
+    def test_search_matches_mcts_bot(self, game_name, dont_return_chance_node):
+        """Test that the copied search loop builds the same tree as mcts.MCTSBot."""
+        pyspiel = pytest.importorskip("pyspiel")
+        from open_spiel.python.algorithms import mcts
+
+        class TreeReuseMCTSBot(TreeReuseMixin, mcts.MCTSBot):
+            pass
+
+        def search(bot_class, **kwargs):
+            game = pyspiel.load_game(game_name)
+            bot = bot_class(
+                game,
+                2,
+                100,
+                mcts.RandomRolloutEvaluator(1, np.random.RandomState(3)),
+                random_state=np.random.RandomState(7),
+                dont_return_chance_node=dont_return_chance_node,
+                **kwargs,
+            )
+            return bot.mcts_search(game.new_initial_state())
+
+        def tree(node):
+            return (
+                node.action,
+                node.player,
+                node.explore_count,
+                node.total_reward,
+                None if node.outcome is None else list(node.outcome),
+                [tree(child) for child in node.children],
+            )
+
+        assert tree(search(TreeReuseMCTSBot, reuse_tree=False)) == tree(
+            search(mcts.MCTSBot)
+        )
+
+
+@pytest.fixture
+def small_tablebase(small_game):
+    """Provides the tablebase of the small game."""
+    return Tablebase.build(small_game)
+
+
+class TestTablebase:
+    """
+    Test cases for the retrograde tablebase.
+
+    Test Methods:
+        - test_solves_small_game: Test the distances of positions whose result is known.
+        - test_distances_follow_best_play: Test that every distance is one more than the best move's.
+        - test_save_and_load: Test that a saved tablebase is memory mapped when loaded.
+        - test_engine_and_evaluator: Test that the engine and MCTS evaluator read the tablebase.
+        - test_hash_collisions: Test that positions sharing a hash key are solved and probed apart.
+        - test_kings_in_signature: Test that a position with other kings isn't probed as the one solved.
+    """
+
+    def test_solves_small_game(self, small_game, small_tablebase):
+        """Test the distances of positions whose result is known."""
+        # The white rook takes the black king right away
+        assert small_tablebase.probe(small_game) == 1
+        assert small_tablebase.value(small_game) == 1
+        assert small_tablebase.best_action(small_game) == 0
+
+        small_game.push_action(0)
+        assert small_tablebase.probe(small_game) == 0
+        assert small_tablebase.value(small_game) == -1
+        assert small_tablebase.best_action(small_game) is None
+
+    def test_distances_follow_best_play(self, small_game, small_tablebase):
+        """Test that every distance is one more than the best move's."""
+        rng = np.random.RandomState(0)
+        for _ in range(20):
+            game = small_game.clone()
+            game.push_action(0 * 16 + 2 * 4 + 0)  # Anything but taking the king
+            for _ in range(10):
+                distance = small_tablebase.probe(game)
+                actions = game.get_all_possible_moves_action_space()
+                if game.game_over or not actions:
+                    break
+                children = []
+                for action in actions:
+                    game.push_action(action)
+                    children.append(small_tablebase.probe(game))
+                    game.pop_action()
+                if distance == DRAW:
+                    assert DRAW in children
+                    assert all(child == DRAW or child % 2 for child in children)
+                elif distance % 2:
+                    assert min(c for c in children if c != DRAW and c % 2 == 0) == (
+                        distance - 1
+                    )
+                else:
+                    assert DRAW not in children and max(children) == distance - 1
+                game.push_action(rng.choice(actions))
+
+    def test_save_and_load(self, small_game, small_tablebase, tmp_path):
+        """Test that a saved tablebase is memory mapped when loaded."""
+        assert Tablebase.load("small.npz", tmp_path) is None
+        small_tablebase.save("small.npz", tmp_path)
+        tablebase = Tablebase.load("small.npz", tmp_path)
+
+        assert isinstance(tablebase.keys, np.memmap)
+        assert len(tablebase) == len(small_tablebase)
+        assert tablebase.probe(small_game) == 1
+
+    def test_engine_and_evaluator(self, small_game, small_tablebase):
+        """Test that the engine and MCTS evaluator read the tablebase."""
+        engine = AlphaBetaEngine(
+            time_budget=None, max_depth=3, tablebase=small_tablebase
+        )
+        assert engine.search(small_game) == 0
+        assert engine.nodes == 0
+
+        evaluator = CountingRolloutEvaluator()
+        tablebase_evaluator = TablebaseEvaluator(small_tablebase, evaluator)
+        state = GameLogicState(small_game)
+        assert list(tablebase_evaluator.evaluate(state)) == [1, -1]
+        assert evaluator.evaluated == []
+        assert tablebase_evaluator.hits == 1
+
+    def test_hash_collisions(self, small_game, small_tablebase):
+        """Test that positions sharing a hash key are solved and probed apart."""
+
+        def solved(tablebase):
+            return {
+                tuple(signature): distance
+                for signature, distance in zip(
+                    tablebase.signatures.tolist(), tablebase.distances.tolist()
+                )
+            }
+
+        # Every position gets the same key
+        with patch("Logic.tablebase._bitboard_hash_key", return_value=0):
+            collided = Tablebase.build(small_game)
+        assert solved(collided) == solved(small_tablebase)
+
+        other = small_game.clone()
+        other.push_action(8)
+        distance = small_tablebase.probe(other)
+        assert distance is not None
+        other._hash_key = 0
+        assert collided.probe(other) == distance
+
+        # The key of the starting position is still there, but not its signature
+        start = small_game.clone()
+        start._hash_key = 0
+        assert collided.probe(start) == 1
+        signatures = collided.signatures.copy()
+        signatures[signatures.tolist().index(game_signature(start, 5))] = -2
+        assert (
+            Tablebase(collided.keys, collided.distances, signatures).probe(start)
+            is None
+        )
+
+    def test_kings_in_signature(self, small_game, small_tablebase):
+        """Test that a position with other kings isn't probed as the one solved."""
+        other = small_game.clone()
+        other.pieces[(3, 3)].is_king = False
+        other.pieces[(3, 0)].is_king = True
+
+        assert other.hash_key == small_game.hash_key
+        assert game_signature(other, 5) != game_signature(small_game, 5)
+        assert small_tablebase.probe(other) is None
+
+
+def record_game(game, actions):
+    """Plays the actions on a copy of the game and writes them down like GameScreen."""
+    game = game.clone()
+    lines = []
+    for action in actions:
+        lines.append(game.action_to_string(action))
+        game.push_action(action)
+    return lines
+
+
+class TestOpeningBook:
+    """
+    Test cases for the opening book.
+
+    Test Methods:
+        - test_reads_saved_games: Test that the saved and self-play games are read with their winners.
+        - test_best_action: Test that the book plays the best scoring move seen often enough.
+        - test_save_and_load: Test that a saved book is memory mapped when loaded.
+        - test_ai_move_uses_book: Test that the AI opponent plays book moves without the language model.
+        - test_large_board: Test that moves on boards past 16x16 are kept whole.
+    """
+
+    def games(self, small_game):
+        rook_up = record_game(small_game, [0 * 16 + 2 * 4 + 0, 2 * 16 + 1 * 4 + 3])
+        knight_up = record_game(small_game, [1 * 16 + 2 * 4 + 3])
+        return (
+            [(parse_moves(" ".join(rook_up)), WHITE_PIECE)] * 2
+            + [(parse_moves(" ".join(knight_up)), BLACK_PIECE)] * 2
+            + [(parse_moves(record_game(small_game, [0])[0]), WHITE_PIECE)]
+        )
+
+    def test_reads_saved_games(self, small_game, tmp_path):
+        """Test that the saved and self-play games are read with their winners."""
+        moves = record_game(small_game, [0 * 16 + 2 * 4 + 0, 2 * 16 + 1 * 4 + 3])
+        (tmp_path / "Histories").mkdir()
+        (tmp_path / "Histories" / "small.npz.txt").write_text(
+            "\n".join(moves) + "\n\nWhite wins\n\n" + moves[0] + "\n\nBlack wins\n\n"
+        )
+        (tmp_path / "Checkpoints" / "small_az").mkdir(parents=True)
+        (tmp_path / "Checkpoints" / "small_az" / "log-actor-0.txt").write_text(
+            "[2024-03-07 14:08:09.949] Game 0: Returns: -1 1; Actions: "
+            + " ".join(moves)
+            + "\n[2024-03-07 14:08:10.027] Game 1: Returns: 1 -1; Actions: \n"
+        )
+
+        games = find_games(
+            "small.npz", tmp_path / "Histories", tmp_path / "Checkpoints"
+        )
+
+        assert [len(moves) for moves, _ in games] == [2, 1, 2]
+        assert [winner for _, winner in games] == [
+            WHITE_PIECE,
+            BLACK_PIECE,
+            BLACK_PIECE,
+        ]
+        assert games[0][0][0] == (
+            WHITE_PIECE,
+            small_game.pieces[(3, 0)].hash,
+            (3, 0),
+            (2, 0),
+        )
+
+    def test_best_action(self, small_game):
+        """Test that the book plays the best scoring move seen often enough."""
+        book = OpeningBook.build(small_game, self.games(small_game))
+
+        moves = {
+            action: (count, score) for action, count, score in book.moves(small_game)
+        }
+        assert moves == {8: (2, 2.0), 27: (2, 0.0), 0: (1, 1.0)}
+        # Taking the king right away only happened once
+        assert book.best_action(small_game) == 8
+
+        small_game.push_action(8)
+        assert book.best_action(small_game) == 2 * 16 + 1 * 4 + 3
+        assert book.best_action(small_game, min_count=3) is None
+        small_game.push_action(2 * 16 + 1 * 4 + 3)
+        assert book.moves(small_game) == []
+
+    def test_save_and_load(self, small_game, tmp_path):
+        """Test that a saved book is memory mapped when loaded."""
+        assert OpeningBook.load("small.npz", tmp_path) is None
+        OpeningBook.build(small_game, self.games(small_game)).save(
+            "small.npz", tmp_path
+        )
+        book = OpeningBook.load("small.npz", tmp_path)
+
+        assert isinstance(book.keys, np.memmap)
+        assert len(book) == 2
+        assert book.best_action(small_game) == 8
+
+    def test_ai_move_uses_book(self, small_game, mock_openai):
+        """Test that the AI opponent plays book moves without the language model."""
+        small_game.book = OpeningBook.build(small_game, self.games(small_game))
+        with patch("Logic.game.llm", mock_openai):
+            small_game.ai_move()
+
+        mock_openai.predict.assert_not_called()
+        assert small_game.pieces_by_id[0].position == (2, 0)
+        assert small_game.turn == BLACK_PIECE
+
+    def test_large_board(self, small_game):
+        """Test that moves on boards past 16x16 are kept whole."""
+        letters = small_game.get_piece_letters()
+        rook = letters[small_game.pieces[(3, 0)].hash]
+        knight = letters[small_game.pieces[(3, 3)].hash]
+        game = GameLogic(rows=17, cols=17)
+        game.piece_types = small_game.piece_types
+        game.from_fen(
+            f"{knight}+15{rook}/{'17/' * 15}{rook.upper()}15{knight.upper()}+ w"
+        )
+        action = game.move_to_action("a1a2")
+        book = OpeningBook.build(
+            game, [(parse_moves(record_game(game, [action])[0]), WHITE_PIECE)]
+        )
+
+        assert int(book.entries["move"][0]) > 2**16
+        assert book.moves(game) == [(action, 1, 1.0)]
+
+
+class TestTimeBudget:
+    """
+    Test cases for searching for a time budget instead of a number of simulations.
+
+    Test Methods:
+        - test_graph_bot: Test that the graph search runs until its budget is used up.
+        - test_tree_bot: Test that the tree search runs until its budget is used up.
+        - test_engine: Test that the engine reports what it searched.
+    """
+
+    def test_graph_bot(self, small_game, graph_game):
+        """Test that the graph search runs until its budget is used up."""
+        bot = GraphMCTSBot(
+            graph_game,
+            2,
+            5,
+            CountingRolloutEvaluator(),
+            random_state=np.random.RandomState(0),
+            time_budget=0.2,
+        )
+        assert bot.step(GameLogicState(small_game)) == 0
+
+        assert 0.2 <= bot.search_stats["seconds"] < 1.0
+        assert bot.search_stats["nodes"] > 5
+
+    def test_tree_bot(self, small_game):
+        """Test that the tree search runs until its budget is used up."""
+        bot = ToyTreeReuseBot(CountingRolloutEvaluator(), 5, time_budget=0.2)
+        root = bot.mcts_search(GameLogicState(small_game))
+
+        assert 0.2 <= bot.search_stats["seconds"] < 1.0
+        assert bot.search_stats["nodes"] > 5
+        assert root.explore_count == bot.search_stats["nodes"]
+
+    def test_engine(self, small_game):
+        """Test that the engine reports what it searched."""
+        engine = AlphaBetaEngine(time_budget=0.2)
+        small_game.push_action(0 * 16 + 2 * 4 + 0)
+        engine.search(small_game)
+
+        assert engine.search_stats["seconds"] < 1.0
+        assert engine.search_stats["nodes"] == engine.nodes > 0
+        assert engine.search_stats["depth"] == engine.depth_reached >= 1
+
+
+def wait_for_move(worker, game, timeout=5.0):
+    """Polls the worker like the game screen does until it isn't busy anymore"""
+    deadline = time.perf_counter() + timeout
+    while worker.busy and time.perf_counter() < deadline:
+        action = worker.poll(game)
+        if action is not None:
+            return action
+        time.sleep(0.01)
+    return None
+
+
+class TestAIMoveWorker:
+    """
+    Test cases for working out the AI moves in the background.
+
+    Test Methods:
+        - test_engine_move: Test that the engine move is handed back without touching the game.
+        - test_llm_move: Test that start returns right away while the language model answers.
+        - test_cancel: Test that cancelling stops the engine and drops its move.
+        - test_stale_position: Test that a move for a position that's gone is thrown away.
+        - test_cancel_before_search: Test that a cancel coming before the search starts still stops it.
+        - test_redo_restarts_ai: Test that the AI is asked again when redo leaves it to move.
+    """
+
+    def test_engine_move(self, small_game):
+        """Test that the engine move is handed back without touching the game."""
+        small_game.ai_player = "engine"
+        key = small_game.hash_key
+        worker = AIMoveWorker()
+        worker.start(small_game)
+
+        assert wait_for_move(worker, small_game) == 0
+        assert not worker.busy
+        assert small_game.hash_key == key and not small_game.game_over
+
+    @patch("Logic.game.llm")
+    def test_llm_move(self, mock_llm, small_game):
+        """Test that start returns right away while the language model answers."""
+
+        def slow_reply(prompt, validate=None):
+            time.sleep(0.3)
+            return "w1=(3, 0)->(2, 0)"
+
+        mock_llm.predict.side_effect = slow_reply
+        worker = AIMoveWorker()
+        start = time.perf_counter()
+        worker.start(small_game)
+
+        assert time.perf_counter() - start < 0.1
+        assert worker.busy and worker.poll(small_game) is None
+        assert wait_for_move(worker, small_game) == 8
+
+    def test_cancel(self, small_game):
+        """Test that cancelling stops the engine and drops its move."""
+        small_game.push_action(8)
+        small_game.ai_player = "engine"
+        small_game.move_time = 30
+        worker = AIMoveWorker()
+        worker.start(small_game)
+        time.sleep(0.1)
+        worker.cancel()
+        worker.wait(2.0)
+
+        assert not worker._thread.is_alive()
+        assert not worker.busy and worker.poll(small_game) is None
+
+    def test_stale_position(self, small_game):
+        """Test that a move for a position that's gone is thrown away."""
+        small_game.ai_player = "engine"
+        worker = AIMoveWorker()
+        worker.start(small_game)
+        small_game.push_action(8)
+        worker.wait(5.0)
+
+        assert worker.poll(small_game) is None
+        assert not worker.busy
+
+    def test_cancel_before_search(self, small_game):
+        """Test that a cancel coming before the search starts still stops it."""
+        small_game.push_action(8)
+        small_game.ai_player = "engine"
+        small_game.move_time = 30
+        # The book holds the thread up until after the cancel
+        small_game.book = Mock()
+        small_game.book.best_action.side_effect = lambda game: time.sleep(0.2)
+        worker = AIMoveWorker()
+        worker.start(small_game)
+        worker.cancel()
+        worker.wait(2.0)
+
+        # The engine is shared with the clone the worker searched, it didn't go a ply deep
+        assert not worker._thread.is_alive()
+        assert small_game.engine.depth_reached == 0
+
+    def test_redo_restarts_ai(self, small_game):
+        """Test that the AI is asked again when redo leaves it to move."""
+        small_game.ai_player = "engine"
+        board = BoxInput(4, 4)
+        board.game = small_game
+        board.ai_mode = True
+        small_game.push_action(8)
+        board.ai_color = small_game.turn
+        board.resume_ai_move()
+        assert board.ai_move and board.worker.busy
+
+        # Undoing while the AI thinks gives the player their turn back
+        board.undo()
+        assert not board.ai_move and not board.ai_turn()
+        board.redo()
+        assert board.ai_move and board.worker.busy
+
+        # After a cancel the board waits for an undo instead of taking the AI's move
+        board.cancel_ai_move()
+        assert board.ai_turn()
+        board.handle_event(
+            pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=board.rect.center)
+        )
+        assert len(small_game.game_history) == 1
+
+
+class LocalModel:
+    """Stand-in for the language model, answering from a list of replies
+
+    A reply can be an exception to raise, and every request waits `delay` seconds first,
+    or `slow` seconds for the first request."""
+
+    model_name = "local"
+
+    def __init__(self, replies, delay=0.0, slow=None):
+        self.replies = list(replies)
+        self.delay = delay
+        self.slow = slow
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def apredict(self, prompt):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            delay = (
+                self.slow if self.slow is not None and self.calls == 1 else self.delay
+            )
+            await asyncio.sleep(delay)
+            reply = self.replies[min(self.calls, len(self.replies)) - 1]
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        finally:
+            self.running -= 1
+
+
+class TestLLMMoveClient:
+    """
+    Test cases for the language model client.
+
+    Test Methods:
+        - test_cache: Test that a prompt asked before is answered from the disk.
+        - test_timeout_and_retry: Test that a request that takes too long is tried again.
+        - test_predict_gives_up: Test that predict stops waiting once every attempt could have timed out.
+        - test_invalid_reply: Test that replies rejected by validate are retried and not cached.
+        - test_concurrency: Test that no more than max_concurrency requests run at once.
+        - test_concurrency_across_threads: Test that the limit holds when several threads ask at once.
+        - test_ai_move: Test that the AI plays the move of the model and caches it.
+    """
+
+    def test_cache(self, tmp_path):
+        """Test that a prompt asked before is answered from the disk."""
+        model = LocalModel(["w1=(3, 0)->(2, 0)"])
+        client = LLMMoveClient(model, cache=ResponseCache(tmp_path))
+
+        assert client.predict("prompt") == "w1=(3, 0)->(2, 0)"
+        assert client.predict("prompt") == "w1=(3, 0)->(2, 0)"
+        assert model.calls == 1 and client.stats["hits"] == 1
+
+        # The cache outlives the client
+        other = LLMMoveClient(model, cache=ResponseCache(tmp_path))
+        assert other.predict("prompt") == "w1=(3, 0)->(2, 0)"
+        assert model.calls == 1
+        assert other.predict("another prompt") == "w1=(3, 0)->(2, 0)"
+        assert model.calls == 2
+
+    def test_timeout_and_retry(self, tmp_path):
+        """Test that a request that takes too long is tried again."""
+        model = LocalModel(["late", "on time"], slow=1.0)
+        client = LLMMoveClient(
+            model, cache=ResponseCache(tmp_path), timeout=0.1, backoff=0.0
+        )
+
+        assert client.predict("prompt") == "on time"
+        assert client.stats["failures"] == 1 and client.stats["requests"] == 2
+
+        failing = LLMMoveClient(
+            LocalModel([ConnectionError("offline")]),
+            cache=ResponseCache(tmp_path),
+            retries=1,
+            backoff=0.0,
+        )
+        with pytest.raises(ConnectionError):
+            failing.predict("another prompt")
+        assert failing.stats["requests"] == 2
+
+    def test_predict_gives_up(self, tmp_path):
+        """Test that predict stops waiting once every attempt could have timed out."""
+        client = LLMMoveClient(
+            LocalModel(["a1a2"]),
+            cache=ResponseCache(tmp_path),
+            timeout=1.0,
+            retries=2,
+            backoff=0.5,
+        )
+        assert client.total_timeout() == 1.0 * 3 + 0.5 + 1.0
+
+        async def stuck(prompt, validate):
+            await asyncio.sleep(10)
+
+        client.timeout, client.retries = 0.1, 0
+        with patch.object(client, "_apredict", stuck):
+            start = time.perf_counter()
+            assert client.predict("prompt") is None
+        assert time.perf_counter() - start < 1.0
+
+    def test_invalid_reply(self, tmp_path):
+        """Test that replies rejected by validate are retried and not cached."""
+        model = LocalModel(["nonsense"])
+        client = LLMMoveClient(
+            model, cache=ResponseCache(tmp_path), retries=2, backoff=0.0
+        )
+
+        assert client.predict("prompt", validate=lambda reply: "->" in reply) == (
+            "nonsense"
+        )
+        assert model.calls == 3
+        client.predict("prompt", validate=lambda reply: "->" in reply)
+        assert model.calls == 6 and client.stats["hits"] == 0
+
+    def test_concurrency(self, tmp_path):
+        """Test that no more than max_concurrency requests run at once."""
+        model = LocalModel(["reply"], delay=0.05)
+        client = LLMMoveClient(model, cache=ResponseCache(tmp_path), max_concurrency=2)
+        replies = asyncio.run(client.apredict_many([f"prompt {i}" for i in range(6)]))
+
+        assert replies == ["reply"] * 6
+        assert model.calls == 6 and model.max_running == 2
+
+    def test_concurrency_across_threads(self, tmp_path):
+        """Test that the limit holds when several threads ask at once."""
+        model = LocalModel(["reply"], delay=0.05)
+        client = LLMMoveClient(model, cache=ResponseCache(tmp_path), max_concurrency=1)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            replies = list(
+                executor.map(client.predict, [f"prompt {i}" for i in range(6)])
+            )
+
+        assert replies == ["reply"] * 6
+        assert model.calls == 6 and model.max_running == 1
+        assert client.stats["requests"] == 6
+
+    def test_ai_move(self, small_game, tmp_path):
+        """Test that the AI plays the move of the model and caches it."""
+        model = LocalModel(["w1=(3, 0)->(2, 0)"])
+        client = LLMMoveClient(model, cache=ResponseCache(tmp_path))
+        with patch("Logic.game.llm", client):
+            assert small_game.clone().choose_ai_action() == 8
+            small_game.ai_move()
+
+        assert model.calls == 1 and client.stats["hits"] == 1
+        assert (2, 0) in small_game.pieces and small_game.turn == BLACK_PIECE
+
+
+class TestPastGamesIndex:
+    """
+    Test cases for picking the past games shown to the language model.
+
+    Test Methods:
+        - test_position_match: Test that only the games through the current position are picked.
+        - test_sequence_match: Test that games sharing the last moves are picked even if they can't be replayed.
+        - test_token_budget: Test that the picked games stay within the budget however many were played.
+        - test_prompt: Test that the prompt only holds the picked games.
+    """
+
+    def games(self, small_game):
+        rook_up = parse_moves(" ".join(record_game(small_game, [8, 39])))
+        knight_up = parse_moves(" ".join(record_game(small_game, [27])))
+        return [(rook_up, WHITE_PIECE), (knight_up, BLACK_PIECE)]
+
+    def test_position_match(self, small_game):
+        """Test that only the games through the current position are picked."""
+        index = PastGamesIndex.build(small_game, self.games(small_game))
+        assert len(index) == 2
+        assert index.matches(small_game, []) == [1, 0]
+
+        small_game.push_action(8)
+        text = index.select(small_game, parse_moves("\n".join(small_game.game_history)))
+
+        assert text == index.texts[0]
+        assert text == "a1a2 d4d3 White wins"
+
+    def test_sequence_match(self, small_game):
+        """Test that games sharing the last moves are picked even if they can't be replayed."""
+        rook_up = self.games(small_game)[0][0]
+        elsewhere = [(WHITE_PIECE, 1, (1, 1), (1, 2))] + rook_up
+        index = PastGamesIndex.build(small_game, [(elsewhere, None)])
+        small_game.push_action(8)
+        small_game.push_action(39)
+
+        assert index.matches(small_game, []) == []
+        assert index.matches(small_game, rook_up) == [0]
+        assert "wins" not in index.select(small_game, rook_up)
+
+    def test_token_budget(self, small_game):
+        """Test that the picked games stay within the budget however many were played."""
+        sizes = []
+        for count in (10, 1000):
+            index = PastGamesIndex.build(small_game, self.games(small_game) * count)
+            text = index.select(small_game, [], token_budget=100)
+            sizes.append(len(text))
+            assert 0 < estimate_tokens(text) <= 100 + count
+
+        assert sizes[0] == sizes[1]
+
+    def test_prompt(self, small_game):
+        """Test that the prompt only holds the picked games."""
+        small_game.past_games = PastGamesIndex.build(
+            small_game, self.games(small_game) * 50
+        )
+        small_game.past_games_budget = 10
+        small_game.push_action(8)
+        with patch("Logic.game.llm") as mock_llm:
+            mock_llm.predict.return_value = "no move"
+            small_game.clone().choose_ai_action()
+
+        prompt = mock_llm.predict.call_args[0][0]
+        assert small_game.past_games.texts[0] in prompt
+        assert small_game.past_games.texts[1] not in prompt
+        assert prompt.count("White wins") == 1
+
+
+class TestNotation:
+    """
+    Test cases for the FEN-like notation of positions and moves.
+
+    Test Methods:
+        - test_to_fen: Test that the position is written rank by rank with the side to move.
+        - test_round_trip: Test that reading a written position gives back the same position.
+        - test_wide_board: Test that boards needing two digits are written and read back.
+        - test_moves: Test that actions and moves like a1a2 turn into each other.
+        - test_bad_fen: Test that a position that can't be read raises a ValueError.
+    """
+
+    def test_to_fen(self, small_game):
+        """Test that the position is written rank by rank with the side to move."""
+        letters = small_game.get_piece_letters()
+        rook = letters[small_game.pieces[(3, 0)].hash]
+        knight = letters[small_game.pieces[(3, 3)].hash]
+
+        assert small_game.to_fen() == (
+            f"{knight}+2{rook}/4/4/{rook.upper()}2{knight.upper()}+ w"
+        )
+        assert small_game.fen_legend() == " ".join(
+            f"{letter}={piece_hash}" for piece_hash, letter in sorted(letters.items())
+        )
+        assert len(small_game.to_fen()) * 10 < len(small_game.board_to_string())
+
+    def test_round_trip(self, small_game):
+        """Test that reading a written position gives back the same position."""
+        small_game.push_action(8)
+        fen = small_game.to_fen()
+        game = small_game.clone().from_fen(fen)
+
+        assert game.to_fen() == fen
+        assert game.hash_key == compute_hash_key(
+            small_game.piece_position, small_game.piece_alignment, small_game.turn
+        )
+        assert game.turn == BLACK_PIECE and not game.game_over
+        assert sorted(
+            map(game.action_to_move, game.get_all_possible_moves_action_space())
+        ) == sorted(
+            map(
+                small_game.action_to_move,
+                small_game.get_all_possible_moves_action_space(),
+            )
+        )
+
+        small_game.push_action(39)
+        small_game.push_action(0)  # The rook takes the black king
+        finished = small_game.clone().from_fen(small_game.to_fen())
+        assert finished.game_over and finished.winner == "White"
+
+    def test_wide_board(self, small_game):
+        """Test that boards needing two digits are written and read back."""
+        letters = small_game.get_piece_letters()
+        rook = letters[small_game.pieces[(3, 0)].hash]
+        knight = letters[small_game.pieces[(3, 3)].hash]
+        fen = f"{knight}+11/{'12/' * 10}{rook.upper()}10{knight.upper()}+ b"
+        game = GameLogic(rows=12, cols=12)
+        game.piece_types = small_game.piece_types
+        game.from_fen(fen)
+
+        assert game.to_fen() == fen
+        assert (11, 0) in game.pieces and (11, 11) in game.pieces
+        actions = game.get_all_possible_moves_action_space()
+        assert actions and all(game.pieces[(0, 0)].id == a // 144 for a in actions)
+        assert [game.move_to_action(game.action_to_move(a)) for a in actions] == actions
+        assert game.action_to_move(actions[-1]).startswith("a12")
+
+    def test_moves(self, small_game):
+        """Test that actions and moves like a1a2 turn into each other."""
+        assert small_game.action_to_move(8) == "a1a2"
+        assert small_game.action_to_move(0) == "a1a4"
+        for move in ("a1a2", "a1-a2", "a1->a2", "I'll play a1a2."):
+            assert small_game.move_to_action(move) == 8
+        assert small_game.move_to_action("b1b2") is None
+        assert small_game.move_to_action("a1a9") is None
+
+        # The llm can still answer like the game history
+        assert small_game.parse_llm_move("w1=(3, 0)->(2, 0)") == 8
+        assert small_game.parse_llm_move("no idea") is None
+
+    def test_bad_fen(self, small_game):
+        """Test that a position that can't be read raises a ValueError."""
+        for fen in ("4/4/4/4", "4/4/4/5 w", "4/4/4/3 w", "4/4/4/3? w", "4/4/4/3z w"):
+            with pytest.raises(ValueError):
+                small_game.clone().from_fen(fen)
+        with pytest.raises(ValueError):
+            small_game.clone().from_fen("4/4/4 w")
+
+
+def llm_reply(reply, delay=0.0, error=None):
+    """Returns a stand-in for the llm client's predict answering after a delay"""
+
+    def predict(prompt, validate=None):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return reply
+
+    return predict
+
+
+class TestHedgedAction:
+    """
+    Test cases for racing the language model against the engine.
+
+    Test Methods:
+        - test_llm_in_time: Test that a legal move of the language model within the deadline is played.
+        - test_llm_too_slow: Test that the engine move is played once the deadline passes.
+        - test_bad_reply: Test that the engine move is played right away when the reply isn't a legal move.
+        - test_no_move: Test that the first legal action is played when nobody has a move.
+    """
+
+    def test_llm_in_time(self, small_game):
+        """Test that a legal move of the language model within the deadline is played."""
+        small_game.move_time = 5.0
+        with patch("Logic.game.llm") as mock_llm:
+            mock_llm.predict.side_effect = llm_reply("a1a2", delay=0.1)
+            start = time.perf_counter()
+            action = small_game.clone().choose_ai_action()
+
+        assert action == 8
+        assert time.perf_counter() - start < small_game.move_time
+        stats = small_game.hedge_history[-1]
+        assert stats["source"] == "llm"
+        assert 0.1 <= stats["llm_seconds"] and stats["engine_seconds"] is not None
+
+    def test_llm_too_slow(self, small_game):
+        """Test that the engine move is played once the deadline passes."""
+        small_game.llm_deadline = 0.2
+        with patch("Logic.game.llm") as mock_llm:
+            mock_llm.predict.side_effect = llm_reply("a1a2", delay=0.6)
+            start = time.perf_counter()
+            action = small_game.choose_ai_action()
+            elapsed = time.perf_counter() - start
+            stats = small_game.hedge_history[-1]
+            assert stats["llm_seconds"] is None
+            time.sleep(0.6)
+
+        assert action == 0  # The engine takes the king
+        assert 0.2 <= elapsed < 0.6
+        assert stats["source"] == "engine" and stats["llm_seconds"] >= 0.6
+
+    def test_bad_reply(self, small_game):
+        """Test that the engine move is played right away when the reply isn't a legal move."""
+        for predict in (llm_reply("b1b2"), llm_reply(None, error=TimeoutError())):
+            with patch("Logic.game.llm") as mock_llm:
+                mock_llm.predict.side_effect = predict
+                start = time.perf_counter()
+
+                assert small_game.choose_ai_action() == 0
+                assert time.perf_counter() - start < small_game.llm_deadline
+                assert small_game.hedge_history[-1]["source"] == "engine"
+
+    def test_no_move(self, small_game):
+        """Test that the first legal action is played when nobody has a move."""
+        small_game.engine = Mock()
+        small_game.engine.search.return_value = None
+        with patch("Logic.game.llm") as mock_llm:
+            mock_llm.predict.side_effect = llm_reply("no idea")
+
+            assert small_game.choose_ai_action() == 0
+        assert small_game.hedge_history[-1]["source"] == "first legal"
+
+
+class TestSelfPlay:
+    """
+    Test cases for the headless self-play games and their shards.
+
+    Test Methods:
+        - test_play_game: Test that a game is played to the end with a policy for every move.
+        - test_max_moves: Test that games running too long are stopped as draws.
+        - test_shards: Test that the games are written games_per_shard at a time and read back.
+        - test_needs_two_bots: Test that the command line takes exactly one bot per player.
+        - test_tree_bot_policy: Test that the tree bots give their root visit counts as the policy.
+    """
+
+    def bots(self, graph_game):
+        return [
+            GraphMCTSBot(
+                graph_game,
+                2,
+                20,
+                CountingRolloutEvaluator(),
+                random_state=np.random.RandomState(player),
+            )
+            for player in range(2)
+        ]
+
+    def test_play_game(self, small_game, graph_game):
+        """Test that a game is played to the end with a policy for every move."""
+        small_game.push_action(8)
+        start = small_game.clone()
+        assert start.winner is None
+        actions, policies, returns = play_game(
+            GameLogicState(small_game),
+            self.bots(graph_game),
+            temperature_moves=2,
+            rng=np.random.RandomState(0),
+        )
+
+        assert small_game.game_over and len(actions) == len(policies) > 0
+        assert returns in ([1, -1], [-1, 1])
+        replay = start.clone()
+        for action, (policy_actions, policy_probs) in zip(actions, policies):
+            assert (
+                sorted(policy_actions) == replay.get_all_possible_moves_action_space()
+            )
+            assert abs(policy_probs.sum() - 1) < 1e-5
+            replay.push_action(action)
+        assert replay.hash_key == small_game.hash_key
+
+    def test_tree_bot_policy(self, small_game):
+        """Test that the tree bots give their root visit counts as the policy."""
+        small_game.push_action(8)
+        legal_actions = small_game.get_all_possible_moves_action_space()
+        bots = [ToyTreeReuseBot(CountingRolloutEvaluator(), 50) for _ in range(2)]
+        actions, policies, _ = play_game(
+            GameLogicState(small_game),
+            bots,
+            temperature_moves=2,
+            rng=np.random.RandomState(0),
+        )
+
+        policy_actions, policy_probs = policies[0]
+        assert sorted(policy_actions) == legal_actions
+        assert abs(policy_probs.sum() - 1) < 1e-5
+        assert (policy_probs > 0).sum() > 1
+        assert actions[0] in policy_actions[policy_probs > 0]
+
+    def test_max_moves(self, small_game, graph_game):
+        """Test that games running too long are stopped as draws."""
+        actions, policies, returns = play_game(
+            GameLogicState(small_game), self.bots(graph_game), max_moves=0
+        )
+
+        assert actions == [] and policies == [] and returns == [0.0, 0.0]
+
+    def test_shards(self, tmp_path):
+        """Test that the games are written games_per_shard at a time and read back."""
+        games = [
+            ([8, 39], [(np.array([8, 27]), np.array([0.75, 0.25]))] * 2, [1, -1]),
+            ([], [], [0, 0]),
+            ([27], [(np.array([27]), np.array([1.0]))], [-1, 1]),
+        ]
+        writer = ShardWriter(
+            tmp_path / "small",
+            "run",
+            games_per_shard=2,
+            metadata={"board": "small.npz", "bots": ["mcts", "mcts"]},
+        )
+        for game in games:
+            writer.add(*game)
+        assert len(writer.paths) == 1
+        writer.close()
+
+        assert shard_paths("small.npz", tmp_path) == [
+            str(path) for path in writer.paths
+        ]
+        assert writer.games == 3 and writer.positions == 3
+        read = read_shard(writer.paths[0]) + read_shard(writer.paths[1])
+        for (actions, policies, returns), (
+            read_actions,
+            read_policies,
+            read_returns,
+        ) in zip(games, read):
+            assert read_actions == actions and read_returns == returns
+            for (policy_actions, probs), (read_policy_actions, read_probs) in zip(
+                policies, read_policies
+            ):
+                assert list(read_policy_actions) == list(policy_actions)
+                assert np.allclose(read_probs, probs)
+        with np.load(writer.paths[0]) as shard:
+            assert str(shard["board"]) == "small.npz"
+
+    @pytest.mark.parametrize("bots", [["mcts"], ["mcts", "static", "random"]])
+    def test_needs_two_bots(self, bots):
+        """Test that the command line takes exactly one bot per player."""
+        with patch("Helpers.self_play.generate") as generate:
+            with pytest.raises(SystemExit) as error:
+                self_play_main(["small.npz", *bots])
+        assert error.value.code == 2
+        generate.assert_not_called()
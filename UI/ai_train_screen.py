@@ -16,6 +16,7 @@ from Helpers.spiel_helper import (
     BoardObserver,
     return_default_az_values,
     debug_alpha_zero,
+    debug_mcts_evaluator,
 )
 
 BOARD_ROWS, BOARD_COLS = 8, 8
@@ -154,7 +155,7 @@ class PlayButton(InteractiveBox):
             if self.rect.collidepoint(event.pos):
                 if game:
                     path = "./Checkpoints/" + name + "_az/checkpoint-0"
-                    mini_chess_helper.debug_mcts_evaluator(
+                    debug_mcts_evaluator(
                         [],
                         game=game,
                         az_path=path,
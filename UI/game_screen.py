@@ -10,9 +10,13 @@ from UI.piece_existing_screen import IndividualPiece
 from UI.board_create_screen import PIECE_HEIGHT, PIECE_WIDTH, BLACK_PIECE, WHITE_PIECE
 from Logic.piece import GamePiece
 from Logic.game import GameLogic
-
+from Logic.ai_worker import AIMoveWorker
+from Logic.tablebase import Tablebase
+from Logic.book import OpeningBook
+from Logic.past_games import PastGamesIndex
 
 BOX_COLOR = (217, 217, 217)
+BACKGROUND_COLOR = (198, 198, 198)
 
 """
 The actual game instance is implemented pretty similarly to the way the frontend for the board creation screen is implemented. The main difference is the type of logic
@@ -38,18 +42,23 @@ class BoxBack(InteractiveBox):
 
 
 class BoxMode(InteractiveBox):
+    """Switches the AI opponent between the language model and the local engine"""
+
     def __init__(self):
         self.rect = pygame.Rect(57, 169, 146, 58)
-        self.text = "Mode"
+        self.text = "LLM"
         self.text_color = (0, 0, 0)
         self.active = False
         self.color_active = (250, 220, 220)
         self.color_inactive = BOX_COLOR
+        self.ai_player = "llm"
 
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
-                print("mode")
+                self.ai_player = "engine" if self.ai_player == "llm" else "llm"
+                self.text = "Engine" if self.ai_player == "engine" else "LLM"
+                return "opponent"
 
 
 class BoxUndo(InteractiveBox):
@@ -64,7 +73,7 @@ class BoxUndo(InteractiveBox):
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
-                print("undo")
+                return "undo"
 
 
 class BoxRedo(InteractiveBox):
@@ -79,7 +88,7 @@ class BoxRedo(InteractiveBox):
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
-                print("redo")
+                return "redo"
 
 
 class BoxSave(InteractiveBox):
@@ -107,8 +116,13 @@ class BoxInput:
         self.written = False
         self.ai_mode = False
         self.ai_move = False
+        # The color the AI plays, the one left to move by the player's first move
+        self.ai_color = None
         self.text = ""
         self.cur_length = 0
+        self.redo_actions = []
+        # The AI moves are worked out in the background so the window keeps responding
+        self.worker = AIMoveWorker()
 
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -121,15 +135,73 @@ class BoxInput:
 
                 print(f"row: {row}, col: {col}")
 
-                if not self.ai_move:
+                if not self.ai_move and not self.ai_turn():
                     self.game.handle_press(row, col)
+                    if len(self.game.game_history) > self.cur_length:
+                        # A new move makes the undone moves impossible to redo
+                        self.redo_actions = []
                     if len(self.game.game_history) > self.cur_length and self.ai_mode:
-                        self.ai_move = True
-                        if self.game.game_over == False:
-                            self.game.ai_move()
-                        self.ai_move = False
+                        self.ai_color = self.game.turn
+                        self.resume_ai_move()
                     self.cur_length = len(self.game.game_history)
 
+    def ai_turn(self):
+        """Whether the AI is the one to move, the board then ignores clicks"""
+        return (
+            self.ai_mode and self.ai_color == self.game.turn and not self.game.game_over
+        )
+
+    def resume_ai_move(self):
+        """Starts working out the AI move if it's the AI's turn and it isn't already"""
+        if self.ai_turn() and not self.ai_move:
+            self.ai_move = True
+            self.worker.start(self.game)
+
+    def poll_ai_move(self):
+        """Plays the AI move once the worker has it"""
+        if not self.ai_move:
+            return
+        action = self.worker.poll(self.game)
+        if action is not None:
+            self.game.apply_action(action)
+            self.cur_length = len(self.game.game_history)
+        if not self.worker.busy:
+            self.ai_move = False
+
+    def cancel_ai_move(self):
+        """Stops waiting for the AI, the player can then undo their move or switch to
+        Human Mode to play the AI's side"""
+        self.worker.cancel()
+        self.ai_move = False
+
+    def undo(self):
+        """Takes back the last move, or the last two against the AI so it's the player's turn again"""
+        if self.ai_move:
+            # Only the player's move is on the board yet
+            self.cancel_ai_move()
+            if self.game.undo_stack:
+                self.redo_actions.append(self.game.pop_action())
+            self.cur_length = len(self.game.game_history)
+            return
+        for _ in range(2 if self.ai_mode else 1):
+            if not self.game.undo_stack:
+                break
+            self.redo_actions.append(self.game.pop_action())
+        self.cur_length = len(self.game.game_history)
+        self.resume_ai_move()
+
+    def redo(self):
+        """Replays the moves taken back by undo"""
+        if self.ai_move:
+            return
+        for _ in range(2 if self.ai_mode else 1):
+            if not self.redo_actions:
+                break
+            self.game.push_action(self.redo_actions.pop())
+        self.cur_length = len(self.game.game_history)
+        # Redoing a move taken back while the AI was thinking leaves the AI to move
+        self.resume_ai_move()
+
     def draw(self, screen):
         if self.game.game_over:
             # Appending the history of the game to a file
@@ -270,8 +342,46 @@ class BoxInput:
                     ),
                 )
 
+    def draw_thinking(self, screen):
+        """Shows how long the AI has been thinking under the board"""
+        font = pygame.font.Font(None, 32)
+        text = font.render(f"Thinking... {self.worker.elapsed:.1f}s", 1, (0, 0, 0))
+        screen.blit(text, (self.rect.left, self.rect.bottom + 18))
+
     def update(self, screen):
+        self.poll_ai_move()
         self.draw(screen)
+        # The strip under the board is cleared every frame, it only has something in it
+        # while the AI is thinking
+        pygame.draw.rect(
+            screen,
+            BACKGROUND_COLOR,
+            (self.rect.left, self.rect.bottom + 1, self.rect.width, 60),
+        )
+        if self.ai_move:
+            self.draw_thinking(screen)
+
+
+class BoxCancel(InteractiveBox):
+    """Stops the AI move being worked out, only shown while the AI is thinking"""
+
+    def __init__(self, board):
+        self.rect = pygame.Rect(573, 547, 146, 45)
+        self.text = "Cancel"
+        self.text_color = (0, 0, 0)
+        self.active = False
+        self.color_active = (250, 220, 220)
+        self.color_inactive = BOX_COLOR
+        self.board = board
+
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN and self.board.ai_move:
+            if self.rect.collidepoint(event.pos):
+                return "cancel"
+
+    def update(self, screen):
+        if self.board.ai_move:
+            super().update(screen)
 
 
 class BoxAIMode(InteractiveBox):
@@ -300,6 +410,7 @@ class GameScreen:
         self.save = BoxSave()
         self.screen = BoxInput()
         self.ai_mode = BoxAIMode()
+        self.cancel = BoxCancel(self.screen)
         self.boxes = [
             self.back,
             self.mode,
@@ -308,6 +419,7 @@ class GameScreen:
             self.save,
             self.screen,
             self.ai_mode,
+            self.cancel,
         ]
         self.piece_alignment = np.zeros((8, 8))
         self.piece_position = np.zeros((8, 8))
@@ -342,7 +454,26 @@ class GameScreen:
             if box.text == "AI Mode" or box.text == "Human Mode":
                 if box.handle_event(event) == "change":
                     self.boxes[5].ai_mode = not self.boxes[5].ai_mode
+                    if not self.boxes[5].ai_mode:
+                        self.boxes[5].cancel_ai_move()
+                    else:
+                        self.boxes[5].resume_ai_move()
                     continue
+            if box is self.mode:
+                if box.handle_event(event) == "opponent":
+                    self.boxes[5].game.ai_player = box.ai_player
+                continue
+            if box is self.cancel:
+                if box.handle_event(event) == "cancel":
+                    self.boxes[5].cancel_ai_move()
+                continue
+            if box.text == "Undo" or box.text == "Redo":
+                action = box.handle_event(event)
+                if action == "undo":
+                    self.boxes[5].undo()
+                elif action == "redo":
+                    self.boxes[5].redo()
+                continue
             next_window = box.handle_event(event)
             if next_window:
                 return next_window
@@ -363,7 +494,9 @@ class GameScreen:
             # print(self.boxes[5].game.kings)
             print(np.load(os.path.join(os.getcwd(), "Boards", name))["kings"])
             rows, cols = np.load(os.path.join(os.getcwd(), "Boards", name))["row_col"]
+            self.boxes[5].cancel_ai_move()
             self.boxes[5] = BoxInput(rows, cols)
+            self.cancel.board = self.boxes[5]
             self.boxes[5].game.kings = (
                 (i[0], i[1])
                 for i in np.load(os.path.join(os.getcwd(), "Boards", name))["kings"]
@@ -374,5 +507,11 @@ class GameScreen:
             self.boxes[5].game.initial_piece_position = self.piece_position
             self.boxes[5].game.get_pieces_from_hash(self.piece_dictionary)
             self.boxes[5].game.game_over = False
+            self.boxes[5].game.ai_player = self.mode.ai_player
+            self.boxes[5].game.tablebase = Tablebase.load(name)
+            self.boxes[5].game.book = OpeningBook.load(name)
+            self.boxes[5].game.past_games = PastGamesIndex.load(
+                self.boxes[5].game, name
+            )
             self.boxes[5].name = name
             self.boxes[5].game.name = name